@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures how the decomposed size, depth and width of each gate grow with the
+register size, and writes them to a JSON report that can be compared across
+commits.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import math
+import platform
+import subprocess
+from timeit import default_timer
+
+import numpy as np
+from projectq import MainEngine
+from projectq.backends import ResourceCounter
+from projectq.cengines import DecompositionRuleSet, DummyEngine
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    AutoReplacerEx,
+    DepthCounter,
+    LimitedCapabilityEngine,
+    SymbolicDepthCounter,
+)
+from dirty_period_finding.gates import (
+    Add,
+    ConstPivotFlipGate,
+    Decrement,
+    Increment,
+    LessThanConstantGate,
+    ModularAdditionGate,
+    ModularBimultiplicationGate,
+    ModularDoubleGate,
+    ModularNegate,
+    ModularOffsetGate,
+    ModularScaledAdditionGate,
+    ModularSubtractionGate,
+    ModularUndoubleGate,
+    MultiNot,
+    Negate,
+    OffsetGate,
+    PivotFlip,
+    PredictOffsetOverflowGate,
+    ReverseBits,
+    RotateBitsGate,
+    ScaleGate,
+    ScaledAdditionGate,
+    Subtract,
+    XorOffsetCarrySignalsGate,
+)
+
+# Where the report is written.
+REPORT_PATH = 'scaling-report.json'
+
+# Set to the path of a report from an earlier run (e.g. of another commit) to
+# print every count, depth or width that changed since.
+BASELINE_REPORT_PATH = None
+
+# The register sizes swept for each gate. Decomposed circuits are produced
+# in full (unless SYMBOLIC is set), so the largest sizes take a while for the
+# quadratic (and worse) gates.
+REGISTER_SIZES = [4, 8, 16]
+
+# Set to count and measure depths with a SymbolicDepthCounter instead of
+# producing the decomposed circuits, which makes much larger sizes feasible.
+# The measured time is then that of the symbolic count.
+SYMBOLIC = False
+
+# Set to only benchmark the gates with these names (see _CASES).
+ONLY_GATES = None
+
+# Every benchmarked gate is controlled by this many qubits.
+CONTROLS = 1
+
+# Every benchmarked gate has this many other qubits around, which its
+# decomposition may borrow as dirty workspace.
+SPARE_QUBITS = 2
+
+# The metrics whose growth exponent is fitted.
+FITTED_METRICS = ['toffolis', 'gates', 'depth', 'toffoli_depth', 'seconds']
+
+
+def _alternating(n):
+    """Returns the n-bit constant with every other bit set (...0101)."""
+    return sum(1 << i for i in range(0, n, 2))
+
+
+def _prime_below(limit):
+    """Returns the largest prime less than limit."""
+    candidate = limit - 1
+    while any(candidate % d == 0
+              for d in range(2, int(math.sqrt(candidate)) + 1)):
+        candidate -= 1
+    return candidate
+
+
+def _modular_case(make_gate):
+    def case(n):
+        return make_gate(_prime_below(1 << n)), [n, n]
+    return case
+
+
+# Maps each gate's name to a function that, given a register size, returns an
+# instance of the gate and the sizes of the registers it acts on.
+#
+# The cost of many decompositions depends on the bit pattern of the gate's
+# constants, so the constants are fixed and structured instead of random:
+# plain constants have every other bit set and moduli are the largest prime
+# that fits in the register (so every nonzero factor is invertible).
+_CASES = {
+    'Add': lambda n: (Add, [n, n]),
+    'Subtract': lambda n: (Subtract, [n, n]),
+    'Increment': lambda n: (Increment, [n]),
+    'Decrement': lambda n: (Decrement, [n]),
+    'MultiNot': lambda n: (MultiNot, [n]),
+    'Negate': lambda n: (Negate, [n]),
+    'ReverseBits': lambda n: (ReverseBits, [n]),
+    'RotateBits': lambda n: (RotateBitsGate(n // 2), [n]),
+    'Offset': lambda n: (OffsetGate(_alternating(n)), [n]),
+    'Scale': lambda n: (ScaleGate(_alternating(n)), [n]),
+    'ScaledAddition': lambda n: (ScaledAdditionGate(_alternating(n)),
+                                 [n, n]),
+    'PivotFlip': lambda n: (PivotFlip, [n, n]),
+    'ConstPivotFlip': lambda n: (ConstPivotFlipGate(_alternating(n)), [n]),
+    'XorOffsetCarrySignals': lambda n: (
+        XorOffsetCarrySignalsGate(_alternating(n)), [n, n]),
+    'PredictOffsetOverflow': lambda n: (
+        PredictOffsetOverflowGate(_alternating(n)), [n, 1]),
+    'LessThanConstant': lambda n: (LessThanConstantGate(_alternating(n)),
+                                   [n, 1]),
+    'ModularAddition': _modular_case(ModularAdditionGate),
+    'ModularSubtraction': _modular_case(ModularSubtractionGate),
+    'ModularOffset': lambda n: (
+        ModularOffsetGate(_alternating(n), _prime_below(1 << n)), [n]),
+    'ModularDouble': lambda n: (ModularDoubleGate(_prime_below(1 << n)),
+                                [n]),
+    'ModularUndouble': lambda n: (ModularUndoubleGate(_prime_below(1 << n)),
+                                  [n]),
+    'ModularNegate': lambda n: (ModularNegate(_prime_below(1 << n)), [n]),
+    'ModularScaledAddition': _modular_case(
+        lambda m: ModularScaledAdditionGate(_alternating(m.bit_length()), m)),
+    'ModularBimultiplication': _modular_case(
+        lambda m: ModularBimultiplicationGate(_alternating(m.bit_length()),
+                                              m)),
+}
+
+
+# The gates whose decompositions need other conditions than CONTROLS and
+# SPARE_QUBITS, mapped to functions giving the number of controls and of
+# spare qubits to use for a register size.
+_SETUPS = {
+    # Only decomposes without controls (it's always used that way).
+    'XorOffsetCarrySignals': lambda n: (0, SPARE_QUBITS),
+    # Borrows a dirty qubit per bit of the query register.
+    'PredictOffsetOverflow': lambda n: (CONTROLS, n),
+}
+
+
+def measure(name, n):
+    """
+    Decomposes an instance of a gate (controlled by CONTROLS qubits, unless
+    _SETUPS says otherwise) into Toffolis, CNOTs and NOTs with a fresh
+    AutoReplacerEx.
+
+    Args:
+        name (str): The gate's key in _CASES.
+        n (int): The register size.
+
+    Returns:
+        dict: The gate's repr, the number of controls and of spare qubits
+            it was given, the number of Toffolis (gates with at least two
+            controls) and of gates overall, the depth, Toffoli depth and width
+            of the decomposed circuit, and the seconds it took to produce.
+    """
+    gate, sizes = _CASES[name](n)
+    controls, spare = _SETUPS.get(name, lambda _: (CONTROLS, SPARE_QUBITS))(n)
+
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    limiter = LimitedCapabilityEngine(allow_toffoli=True,
+                                      allow_single_qubit_gates=True,
+                                      allow_classes=[])
+    if SYMBOLIC:
+        resources = depths = SymbolicDepthCounter(rule_set)
+        eng = MainEngine(backend=DummyEngine(), engine_list=[
+            resources,
+            limiter,
+        ])
+    else:
+        resources = ResourceCounter()
+        depths = DepthCounter()
+        eng = MainEngine(backend=depths, engine_list=[
+            AutoReplacerEx(rule_set),
+            limiter,
+            resources,
+        ])
+    control_qubits = eng.allocate_qureg(controls)
+    registers = tuple(eng.allocate_qureg(size) for size in sizes)
+    spare_qubits = eng.allocate_qureg(spare)
+    eng.flush()
+
+    start = default_timer()
+    gate & control_qubits | registers
+    eng.flush()
+    seconds = default_timer() - start
+    del spare_qubits
+
+    counts = {k: v
+              for k, v in resources.gate_counts.items()
+              if k not in ('Allocate', 'Deallocate')}
+    return {
+        'n': n,
+        'gate': repr(gate),
+        'controls': controls,
+        'spare_qubits': spare,
+        'toffolis': sum(v for k, v in counts.items()
+                        if k.startswith('CC')),
+        'gates': sum(counts.values()),
+        'depth': depths.depth,
+        'toffoli_depth': depths.toffoli_depth,
+        'width': resources.max_width,
+        'seconds': seconds,
+    }
+
+
+def fit_exponent(sizes, values):
+    """
+    Args:
+        sizes (list[int]): Register sizes.
+        values (list[float]): A metric measured at each size.
+
+    Returns:
+        None|float: The slope of the least-squares line through the sizes
+            and values on a log-log scale, i.e. the k in O(N^k). None when
+            fewer than two values are positive.
+    """
+    points = [(math.log(n), math.log(v))
+              for n, v in zip(sizes, values)
+              if v > 0]
+    if len(points) < 2:
+        return None
+    xs, ys = zip(*points)
+    return float(np.polyfit(xs, ys, 1)[0])
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD']).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_changes(baseline, report):
+    for name, entry in sorted(report['gates'].items()):
+        old_rows = {row['n']: row
+                    for row in baseline['gates'].get(name, {}).get('rows',
+                                                                  [])}
+        for row in entry['rows']:
+            old = old_rows.get(row['n'])
+            if old is None:
+                continue
+            for metric in ['toffolis', 'gates', 'depth', 'toffoli_depth',
+                           'width']:
+                if old.get(metric) != row[metric]:
+                    print("CHANGED {} N={} {}: {} -> {}".format(
+                        name, row['n'], metric, old.get(metric),
+                        row[metric]))
+
+
+def main():
+    names = sorted(_CASES) if ONLY_GATES is None else ONLY_GATES
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'symbolic': SYMBOLIC,
+        'register_sizes': REGISTER_SIZES,
+        'gates': {},
+    }
+
+    for name in names:
+        rows = []
+        for n in REGISTER_SIZES:
+            row = measure(name, n)
+            rows.append(row)
+            print("{} N={}: {} toffolis, {} gates, depth {}, "
+                  "toffoli depth {}, width {}, {:.2f}s".format(
+                      name, n, row['toffolis'], row['gates'], row['depth'],
+                      row['toffoli_depth'], row['width'], row['seconds']))
+        exponents = {metric: fit_exponent([row['n'] for row in rows],
+                                          [row[metric] for row in rows])
+                     for metric in FITTED_METRICS}
+        print("{} growth exponents: {}".format(
+            name,
+            ', '.join('{} {}'.format(metric, 'n/a' if k is None
+                                     else '{:.2f}'.format(k))
+                      for metric, k in sorted(exponents.items()))))
+        report['gates'][name] = {'rows': rows, 'exponents': exponents}
+
+    text = json.dumps(report, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+    with open(REPORT_PATH, 'wb') as f:
+        f.write(text.encode('utf8'))
+    print("Wrote {}".format(REPORT_PATH))
+
+    if BASELINE_REPORT_PATH is not None:
+        with open(BASELINE_REPORT_PATH, 'rb') as f:
+            baseline = json.loads(f.read().decode('utf8'))
+        _print_changes(baseline, report)
+
+
+if __name__ == "__main__":
+    main()
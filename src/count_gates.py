@@ -23,38 +23,77 @@ import fractions
 import random
 
 from projectq import MainEngine
-from projectq.backends import ResourceCounter
 from projectq.cengines import DecompositionRuleSet, DummyEngine
 
 import dirty_period_finding.decompositions as decompositions
 from dirty_period_finding.extensions import (
+    CompilationContext,
+    DecompositionProfiler,
     LimitedCapabilityEngine,
-    AutoReplacerEx,
+    FileDecompositionCache,
+    ResourceEstimator,
+    SymbolicGateCounter,
 )
 from dirty_period_finding.gates import ModularBimultiplicationGate
 
+# Set to a directory path to reuse decompositions across runs.
+DECOMPOSITION_CACHE_DIRECTORY = None
+
+# Set to a path prefix to profile the decompositions, writing a flame graph
+# compatible folded-stack file (prefix + '.folded') and a summary of the time,
+# cache hits and leaves per rule and per gate class (prefix + '.json').
+PROFILE_OUTPUT_PREFIX = None
+
+# Set to print, under each size's counts, how they split across the gates of
+# the decomposition tree (with the width and estimated depth of each gate).
+PRINT_BREAKDOWN = False
+
+# Gates are counted symbolically (without producing the decomposed circuit),
+# so sizes well beyond what fits in memory as explicit commands are fine.
+REGISTER_SIZES = list(range(2, 20)) + [24, 32, 48, 64]
+
+
+def _make_capability_engines():
+    return [
+        LimitedCapabilityEngine(
+            allow_toffoli=True,
+            allow_single_qubit_gates=True,
+            allow_classes=[]
+        ),
+    ]
+
 
 def main():
+    # One context for every size, so that subgates the sizes have in common
+    # are only decomposed once.
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    cache = None
+    if DECOMPOSITION_CACHE_DIRECTORY is not None:
+        cache = FileDecompositionCache(DECOMPOSITION_CACHE_DIRECTORY,
+                                       rule_set,
+                                       namespace='count-gates')
+    profiler = None
+    if PROFILE_OUTPUT_PREFIX is not None:
+        profiler = DecompositionProfiler()
+    context = CompilationContext(rule_set,
+                                 engine_list_factory=_make_capability_engines,
+                                 cache=cache,
+                                 profiler=profiler)
+
     x = 2
     modulus = 2
 
-    for reg_size in range(2, 20):
+    for reg_size in REGISTER_SIZES:
         reg_max_val = 1 << reg_size
         while True:
             modulus = random.randint(reg_max_val // 2 + 1, reg_max_val - 1)
             x = random.randint(2, modulus - 1)
             if modulus % 2 != 0 and fractions.gcd(x, modulus) == 1:
                 break
-        cnt = ResourceCounter()
-        eng = MainEngine(backend=DummyEngine(), engine_list=[
-            AutoReplacerEx(DecompositionRuleSet(modules=[decompositions])),
-            LimitedCapabilityEngine(
-                allow_toffoli=True,
-                allow_single_qubit_gates=True,
-                allow_classes=[]
-            ),
-            cnt,
-        ])
+        engine_list = context.new_counting_engine_list(
+            ResourceEstimator if PRINT_BREAKDOWN else SymbolicGateCounter)
+        cnt = engine_list[0]
+        eng = MainEngine(backend=DummyEngine(), engine_list=engine_list)
         v1 = eng.allocate_qureg(reg_size)
         v2 = eng.allocate_qureg(reg_size)
         c = eng.allocate_qubit()
@@ -65,6 +104,17 @@ def main():
         print("Register Size: {}".format(reg_size))
         print("Gate count for controlled {}".format(gate))
         print("\t{}".format(cnt).replace('\n', '\n\t'))
+        if PRINT_BREAKDOWN:
+            print()
+            print("Breakdown by decomposition tree node:")
+            print("\t{}".format(cnt.breakdown()).replace('\n', '\n\t'))
+
+    print()
+    print()
+    print("Decomposition cache: {}".format(context.stats()))
+    if profiler is not None:
+        profiler.write_folded_stacks(PROFILE_OUTPUT_PREFIX + '.folded')
+        profiler.write_summary(PROFILE_OUTPUT_PREFIX + '.json')
 
 
 if __name__ == "__main__":
@@ -28,9 +28,30 @@ from ._basic_math_gate_ex import (
     Swap,
     SwapGate,
 )
-from ._cached_auto_replacer import AutoReplacerEx, MergeRule
+from ._batch_classical_simulator import BatchClassicalSimulator
+from ._cached_auto_replacer import (
+    AutoReplacerEx,
+    InverseControlMergeRule,
+    MergeRule,
+    SimpleAdjacentCombiner,
+)
 from ._classical_simulator import ClassicalSimulator
 from ._command_ex import CommandEx
+from ._compact_commands import CompactCommandList
+from ._compilation_context import CompilationContext
+from ._cost_chooser import MinimumCostChooser, toffoli_cost
+from ._decomposition_cache import (
+    BoundedDecompositionCache,
+    DecompositionCache,
+    FileDecompositionCache,
+)
+from ._decomposition_index import DecompositionIndex
+from ._decomposition_profiler import DecompositionProfiler
+from ._depth_counter import (
+    DepthCounter,
+    DepthSummary,
+    SymbolicDepthCounter,
+)
 from ._command_predicates import (
     min_controls,
     max_controls,
@@ -43,6 +64,18 @@ from ._command_predicates import (
     max_workspace,
 )
 from ._limited_capability_engine import LimitedCapabilityEngine
+from ._parallel_decomposition import DecompositionPool
+from ._peephole_optimizer import PeepholeOptimizer
+from ._period_finding_emulator import PeriodFindingEmulator
 from ._permutation_simulator import PermutationSimulator
+from ._resource_estimator import (
+    NodeEstimate,
+    ResourceEstimator,
+    ResourceSummary,
+)
+from ._reversible_gate_fuser import ReversibleGateFuser
+from ._sparse_simulator import SparseSimulator
+from ._symbolic_gate_counter import GateHistogram, SymbolicGateCounter
 from ._to_ascii import commands_to_ascii_circuit
 from ._util import multiplicative_inverse, extended_gcd
+from ._vectorized_math import bit_length_bound, exact_int_arrays
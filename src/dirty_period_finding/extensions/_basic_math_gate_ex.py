@@ -19,41 +19,106 @@ from __future__ import unicode_literals
 import projectq.ops
 from projectq.ops import BasicMathGate
 from ._basic_gate_ex import BasicGateEx
+from ._vectorized_math import vectorize_scalar_function
+
+
+def _do_not_call(*_):
+    raise AssertionError()
+
+
+def _math_gate_getstate(self):
+    # The math function installed by BasicMathGate is an unpicklable lambda,
+    # and it's never called because get_math_function is overridden.
+    state = dict(self.__dict__)
+    state.pop('_math_function', None)
+    return state
+
+
+def _math_gate_setstate(self, state):
+    self.__dict__.update(state)
+    self._math_function = _do_not_call
 
 
 class BasicMathGateEx(BasicMathGate, BasicGateEx):
     def __init__(self):
-        def do_not_call(*_):
-            raise AssertionError()
         BasicGateEx.__init__(self)
-        BasicMathGate.__init__(self, do_not_call)
+        BasicMathGate.__init__(self, _do_not_call)
 
     def do_operation(self, *args):
         raise NotImplementedError()
 
+    def do_vectorized_operation(self, *args):
+        """
+        Applies do_operation to arrays of register values.
+
+        Subclasses can override this with array arithmetic. The default calls
+        do_operation once per distinct input.
+
+        Args:
+            *args (numpy.ndarray): Equal-length integer arrays, one per
+                register. Arrays of python ints are used for wide registers.
+
+        Returns:
+            tuple[numpy.ndarray]: The output values of each register.
+        """
+        return vectorize_scalar_function(lambda x: self.do_operation(*x),
+                                         args)
+
     def get_math_function(self, qubits):
         return lambda x: self.do_operation(*x)
 
+    def get_vectorized_math_function(self, qubits):
+        return lambda xs: self.do_vectorized_operation(*xs)
+
+    __getstate__ = _math_gate_getstate
+    __setstate__ = _math_gate_setstate
+
 
 class BasicSizedMathGateEx(BasicMathGate, BasicGateEx):
     def __init__(self):
-        def do_not_call(*_):
-            raise AssertionError()
         BasicGateEx.__init__(self)
-        BasicMathGate.__init__(self, do_not_call)
+        BasicMathGate.__init__(self, _do_not_call)
 
     def do_operation(self, sizes, args):
         raise NotImplementedError()
 
+    def do_vectorized_operation(self, sizes, args):
+        """
+        Applies do_operation to arrays of register values.
+
+        Subclasses can override this with array arithmetic. The default calls
+        do_operation once per distinct input.
+
+        Args:
+            sizes (list[int]): The size of each register.
+            args (list[numpy.ndarray]): Equal-length integer arrays, one per
+                register. Arrays of python ints are used for wide registers.
+
+        Returns:
+            tuple[numpy.ndarray]: The output values of each register.
+        """
+        return vectorize_scalar_function(lambda x: self.do_operation(sizes, x),
+                                         args)
+
     def get_math_function(self, qubits):
         sizes = [len(q) for q in qubits]
         return lambda x: self.do_operation(sizes, x)
 
+    def get_vectorized_math_function(self, qubits):
+        sizes = [len(q) for q in qubits]
+        return lambda xs: self.do_vectorized_operation(sizes, xs)
+
+    __getstate__ = _math_gate_getstate
+    __setstate__ = _math_gate_setstate
+
 
 class SwapGate(projectq.ops.SwapGate, BasicMathGateEx):
     def do_operation(self, a, b):
         return b, a
 
+    def do_vectorized_operation(self, a, b):
+        return b, a
+
     def __eq__(self, other):
         return isinstance(other, SwapGate)
 
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A classical simulator that runs many input assignments at once.
+"""
+
+from __future__ import unicode_literals
+
+import numpy as np
+from projectq.cengines import BasicEngine
+from projectq.ops import (
+    XGate,
+    BasicMathGate,
+    Measure,
+    FlushGate,
+    Allocate,
+    Deallocate
+)
+
+from ._vectorized_math import evaluate_math_gate, register_dtype
+
+_LANE_SHIFTS = np.arange(64, dtype=np.uint64)
+
+
+class BatchClassicalSimulator(BasicEngine):
+    """
+    A ClassicalSimulator that tracks many independent classical states
+    (lanes) at once, applying each command to all of them.
+
+    The state is bit-sliced: every qubit owns a row of uint64 words, with bit
+    j of the row holding the qubit's value in lane j. NOTs, CNOTs and Toffolis
+    are then a few vectorized ANDs and XORs over all lanes. Math gates are
+    evaluated once per distinct input among the lanes that meet the controls.
+
+    Allows allocation, deallocation, measuring (no-op), flushing (no-op),
+    controls, NOTs, and any BasicMathGate. Supports reading/writing arrays of
+    per-lane values directly from/to bits and registers of bits.
+    """
+    def __init__(self, lanes):
+        """
+        Args:
+            lanes (int): The number of states to simulate side by side.
+        """
+        BasicEngine.__init__(self)
+        if lanes <= 0:
+            raise ValueError("Need at least one lane.")
+        self.lanes = lanes
+        self._words = (lanes + 63) // 64
+        self._rows = np.zeros((0, self._words), np.uint64)
+        self._row_of = {}
+        self._free_rows = []
+
+    def read_bit(self, qubit):
+        """
+        Reads a bit in every lane.
+
+        Args:
+            qubit (projectq.types.Qubit): The bit to read.
+
+        Returns:
+            numpy.ndarray: A bool per lane.
+        """
+        return self._unpack(self._rows[self._row_of[qubit.id]])
+
+    def write_bit(self, qubit, values):
+        """
+        Resets/sets a bit in every lane.
+
+        Args:
+            qubit (projectq.types.Qubit): The bit to write.
+            values (bool|int|numpy.ndarray): The value for all lanes, or a
+                truthy/falsy value per lane.
+        """
+        bits = np.broadcast_to(np.asarray(values, bool), (self.lanes,))
+        self._rows[self._row_of[qubit.id]] = self._pack(bits)
+
+    def read_register(self, qureg):
+        """
+        Reads a group of bits as a little-endian integer, in every lane.
+
+        Args:
+            qureg (projectq.types.Qureg):
+                The group of bits to read, in little-endian order.
+
+        Returns:
+            numpy.ndarray: The register's value in each lane, as int64 values
+                or (for registers wider than 62 bits) python ints.
+        """
+        dtype = register_dtype(len(qureg))
+        result = np.zeros(self.lanes, dtype)
+        for i, q in enumerate(qureg):
+            bits = self.read_bit(q).astype(dtype)
+            result |= bits << i
+        return result
+
+    def write_register(self, qureg, values):
+        """
+        Sets a group of bits to store a little-endian integer, in every lane.
+
+        Args:
+            qureg (projectq.types.Qureg):
+                The bits to write, in little-endian order.
+            values (int|list[int]|numpy.ndarray): The value for all lanes, or
+                a value per lane. Must fit in the register.
+        """
+        dtype = register_dtype(len(qureg))
+        values = np.broadcast_to(np.asarray(values, dtype), (self.lanes,))
+        if np.any(values < 0) or np.any(values >= 1 << len(qureg)):
+            raise ValueError("Value won't fit in register.")
+        for i, q in enumerate(qureg):
+            self.write_bit(q, (values >> i) & 1)
+
+    def is_available(self, cmd):
+        return (cmd.gate == Measure or
+                cmd.gate == Allocate or
+                cmd.gate == Deallocate or
+                isinstance(cmd.gate, BasicMathGate) or
+                isinstance(cmd.gate, FlushGate) or
+                isinstance(cmd.gate, XGate))
+
+    def receive(self, command_list):
+        for cmd in command_list:
+            self._handle(cmd)
+        if not self.is_last_engine:
+            self.send(command_list)
+
+    def _unpack(self, row):
+        bits = (row[:, np.newaxis] >> _LANE_SHIFTS) & np.uint64(1)
+        return bits.reshape(-1)[:self.lanes].astype(bool)
+
+    def _pack(self, bits):
+        padded = np.zeros(self._words * 64, np.uint64)
+        padded[:self.lanes] = bits
+        return np.bitwise_or.reduce(
+            padded.reshape(self._words, 64) << _LANE_SHIFTS, axis=1)
+
+    def _controls_row(self, controls):
+        """
+        Returns:
+            numpy.ndarray: A row with a lane's bit set when every control is
+                on in that lane.
+        """
+        mask = np.zeros(self._words, np.uint64)
+        mask[:] = ~np.uint64(0)
+        for q in controls:
+            mask &= self._rows[self._row_of[q.id]]
+        return mask
+
+    def _handle(self, cmd):
+        if cmd.gate == Measure or isinstance(cmd.gate, FlushGate):
+            return
+
+        if cmd.gate == Allocate:
+            new_id = cmd.qubits[0][0].id
+            if not self._free_rows:
+                # Double the row storage, handing out the lowest rows first.
+                old = len(self._rows)
+                self._rows = np.concatenate([
+                    self._rows,
+                    np.zeros((max(old, 1), self._words), np.uint64)])
+                self._free_rows.extend(range(len(self._rows) - 1, old - 1, -1))
+            row = self._free_rows.pop()
+            self._rows[row] = 0
+            self._row_of[new_id] = row
+            return
+
+        if cmd.gate == Deallocate:
+            self._free_rows.append(self._row_of.pop(cmd.qubits[0][0].id))
+            return
+
+        if isinstance(cmd.gate, XGate):
+            assert len(cmd.qubits) == 1 and len(cmd.qubits[0]) == 1
+            target = self._row_of[cmd.qubits[0][0].id]
+            self._rows[target] ^= self._controls_row(cmd.control_qubits)
+            return
+
+        if isinstance(cmd.gate, BasicMathGate):
+            self._apply_math(cmd)
+            return
+
+        raise ValueError("Only support alloc/dealloc/measure/not/math ops.")
+
+    def _apply_math(self, cmd):
+        active = self._unpack(self._controls_row(cmd.control_qubits))
+        lanes = np.flatnonzero(active)
+        if not len(lanes):
+            return
+
+        ins = [self.read_register(reg) for reg in cmd.qubits]
+        outs = evaluate_math_gate(cmd.gate,
+                                  cmd.qubits,
+                                  [x[lanes] for x in ins])
+        for reg, values, out in zip(cmd.qubits, ins, outs):
+            values[lanes] = out
+            self.write_register(reg, values)
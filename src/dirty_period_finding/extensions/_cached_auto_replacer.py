@@ -16,45 +16,118 @@
 
 from __future__ import unicode_literals
 
+from collections import Counter
+
+import numpy as np
 from projectq.cengines import (
     BasicEngine, DummyEngine, MainEngine, LocalOptimizer,
 )
 from projectq.cengines._replacer import NoGateDecompositionError
-from projectq.ops import get_inverse, X, FlushGate
+from projectq.ops import X, FlushGate
 from projectq.types import WeakQubitRef, Qureg
 
 from ._command_ex import CommandEx
+from ._command_predicates import workspace_demand
+from ._compact_commands import CompactCommandList
+from ._decomposition_cache import DecompositionCache
+from ._decomposition_index import DecompositionIndex
 
 
 class AutoReplacerEx(BasicEngine):
     def __init__(self,
                  decomposition_rule_set,
-                 decomposition_chooser=
-                 lambda cmd, decomposition_list: decomposition_list[0],
-                 merge_rules=()):
+                 decomposition_chooser=None,
+                 merge_rules=(),
+                 cache=None,
+                 streaming_chunk_size=None,
+                 streaming_cache_limit=10000,
+                 minimal_workspace_keys=False,
+                 decomposition_pool=None,
+                 profiler=None):
+        """
+        Args:
+            decomposition_rule_set (projectq.cengines.DecompositionRuleSet):
+                The rules used to break down unavailable commands.
+            decomposition_chooser (None|function(cmd, decomposition_list)):
+                Picks which of the applicable decompositions to use. Defaults
+                to the first one, in rule set order. If the
+                chooser has an attach method, it's called with this engine
+                (see MinimumCostChooser).
+            merge_rules (list[MergeRule]):
+                Extra rules for combining adjacent decomposed commands.
+            cache (None|DecompositionCache):
+                Where flattened decompositions are memoized. Defaults to a
+                fresh in-memory cache. Pass a FileDecompositionCache to reuse
+                decompositions across runs.
+            streaming_chunk_size (None|int):
+                When set, decompositions are sent to the next engine in chunks
+                of this many commands while the decomposition tree is still
+                being walked, instead of all at once after it's complete.
+                Peak memory is then bounded by the tree depth times
+                streaming_cache_limit rather than by the total gate count.
+            streaming_cache_limit (int):
+                When streaming, only subtrees that expand into at most this
+                many commands are cached.
+            minimal_workspace_keys (bool):
+                When set, a command is decomposed with only as many workspace
+                qubits as the chosen rule's recognizer demands (e.g. one for
+                min_workspace(1)), taken from the lowest available qubit ids,
+                unless a different rule would be chosen with that little
+                workspace.
+                Cache keys then encode that demand instead of the number of
+                spare qubits, so entries stay reusable as allocations come
+                and go. Nested decompositions see less workspace, which can
+                make them pick costlier rules.
+            decomposition_pool (None|DecompositionPool):
+                When set, sibling subcommands that miss the cache are sent to
+                the pool's worker processes to be decomposed in parallel, and
+                the results are added to this engine's cache. Not used while
+                streaming, where large subtrees aren't cached.
+            profiler (None|DecompositionProfiler):
+                When set, records the time spent expanding each gate class and
+                rule, the cache hits and misses, and the leaves produced.
+        """
         BasicEngine.__init__(self)
-        self._cached_results = dict()
+        self.cache = DecompositionCache() if cache is None else cache
+        self._in_progress = set()
+        self._failed = set()
+        self._workspace_sizes = {}
+        self._sizing = set()
         self.decomposition_rule_set = decomposition_rule_set
+        self.decomposition_index = DecompositionIndex.for_rule_set(
+            decomposition_rule_set)
+        if decomposition_chooser is None:
+            decomposition_chooser = _first_decomposition
         self.decomposition_chooser = decomposition_chooser
         self.merge_rules = merge_rules
+        self.streaming_chunk_size = streaming_chunk_size
+        self.streaming_cache_limit = streaming_cache_limit
+        self.minimal_workspace_keys = minimal_workspace_keys
+        self.decomposition_pool = decomposition_pool
+        self.profiler = profiler
+        attach = getattr(decomposition_chooser, 'attach', None)
+        if attach is not None:
+            attach(self)
 
     def is_available(self, cmd):
         return (isinstance(cmd.gate, FlushGate) or
                 self.is_last_engine or
                 self.next_engine.is_available(cmd))
 
-    def _all_decomps_for(self, cmd):
-        key = cmd.gate.__class__.__name__
-        inv_key = get_inverse(cmd.gate).__class__.__name__
-        ds = self.decomposition_rule_set.decompositions
-
-        forward = ds[key] if key in ds else []
-        backward = [
-            d.get_inverse_decomposition()
-            for d in ds[inv_key]
-        ] if inv_key in ds else []
+    def _all_decomps_with_recognizers_for(self, cmd):
+        """
+        Returns:
+            list[tuple[_Decomposition, function]]: The applicable
+                decompositions, each paired with the recognizer of the rule it
+                came from (the forward rule, for inverse decompositions).
+                Only the first is found when the default chooser is used.
+        """
+        return self.decomposition_index.applicable(
+            cmd,
+            first_only=self.decomposition_chooser is _first_decomposition)
 
-        return [d for d in forward + backward if d.check(cmd)]
+    def _all_decomps_for(self, cmd):
+        return [d for d, _ in self._all_decomps_with_recognizers_for(cmd)]
 
     def _pick_decomp_for(self, cmd):
         choices = self._all_decomps_for(cmd)
@@ -63,17 +136,103 @@ class AutoReplacerEx(BasicEngine):
                 'No decomposition for {}.'.format(cmd))
         return self.decomposition_chooser(cmd, choices)
 
-    def _translate(self, original_command, flat_commands, id_map):
-        rev_id_map = {val: key for key, val in id_map.iteritems()}
-        return [
-            CommandEx(
-                engine=original_command.engine,
-                gate=cmd.gate,
-                qubits=self.remap_quregs(cmd.qubits, rev_id_map),
-                controls=self.remap_qureg(cmd.control_qubits, rev_id_map),
-                tags=original_command.tags + cmd.tags)
-            for cmd in flat_commands
-        ]
+    def _workspace_size(self, cmd, layout, num_spare):
+        """
+        Args:
+            cmd (projectq.ops.Command): The command to canonicalize.
+            layout (tuple[tuple[int]]): The canonical ids of the command's
+                controls and registers.
+            num_spare (int): How many spare qubits there are.
+
+        Returns:
+            int: How many of the spare qubits to give the command as
+                workspace. All of them, unless minimal_workspace_keys is set.
+                Otherwise as many as the rule chosen with all of them needs,
+                as long as that rule is still chosen with that little
+                workspace (with none at all, the bootstrapping rules for
+                max_workspace(0) apply and usually win instead), and as long
+                as the rule's nested commands keep the workspace they need in
+                turn.
+        """
+        if not self.minimal_workspace_keys:
+            return num_spare
+        memo_key = (cmd.gate, layout, num_spare)
+        size = self._workspace_sizes.get(memo_key)
+        if size is None:
+            if memo_key in self._sizing:
+                # Recursive rule; don't trim anything along the cycle.
+                return num_spare
+            self._sizing.add(memo_key)
+            try:
+                size = self._smallest_workspace(cmd, layout, num_spare)
+            finally:
+                self._sizing.discard(memo_key)
+            self._workspace_sizes[memo_key] = size
+        return size
+
+    def _smallest_workspace(self, cmd, layout, num_spare):
+        choices = self._all_decomps_with_recognizers_for(cmd)
+        if not choices:
+            return num_spare
+        chosen = self.decomposition_chooser(cmd, [d for d, _ in choices])
+        recognizer = dict((id(d), r) for d, r in choices)[id(chosen)]
+        demand = max(workspace_demand(recognizer, cmd), 0)
+        nested = self._workspace_for_nested(chosen,
+                                            cmd.gate,
+                                            layout,
+                                            num_spare)
+        for candidate in sorted(set([demand, max(demand, 1)])):
+            candidate = max(candidate, nested)
+            if candidate >= num_spare:
+                break
+            scratch_cmd, _ = _scratch_command(cmd.gate, layout, candidate)
+            if self._choice_for(scratch_cmd) is chosen:
+                return candidate
+        return num_spare
+
+    def _workspace_for_nested(self, decomposition, gate, layout, num_spare):
+        """
+        Returns:
+            int: How many of the spare qubits must be kept so that the
+                unavailable commands the decomposition emits, when given all
+                of them, still get the workspace they keep themselves.
+        """
+        num_used = len(set(i for reg in layout for i in reg))
+        scratch_cmd, _ = _scratch_command(gate, layout, 0)
+        children, qubits = self._apply_decomposition(scratch_cmd,
+                                                     num_used,
+                                                     num_spare,
+                                                     decomposition)
+        needed = 0
+        for child in children:
+            if self.is_available(child):
+                continue
+            child_ids = {}
+            for qureg in child.all_qubits:
+                for q in qureg:
+                    child_ids.setdefault(q.id, len(child_ids))
+            active = set(q.id for q in child.engine.main_engine.active_qubits)
+            child_spare = len(active - set(child_ids))
+            child_layout = tuple(tuple(child_ids[q.id] for q in qureg)
+                                 for qureg in child.all_qubits)
+            kept = self._workspace_size(child, child_layout, child_spare)
+            needed = max(needed, num_spare - (child_spare - kept))
+        assert qubits is not None
+        return needed
+
+    def _choice_for(self, cmd):
+        """
+        Returns:
+            None|_Decomposition: The decomposition the chooser picks for the
+                given command, or None when there's none.
+        """
+        choices = self._all_decomps_for(cmd)
+        if not choices:
+            return None
+        try:
+            return self.decomposition_chooser(cmd, choices)
+        except NoGateDecompositionError:
+            return None
 
     def remap_quregs(self, quregs, id_map):
         return tuple(self.remap_qureg(qureg, id_map) for qureg in quregs)
@@ -81,7 +240,21 @@ class AutoReplacerEx(BasicEngine):
     def remap_qureg(self, qureg, id_map):
         return Qureg(WeakQubitRef(q.engine, id_map[q.id]) for q in qureg)
 
-    def _canonicalize(self, cmd):
+    def _canonicalize(self, cmd, all_workspace=False):
+        """
+        Renames the qubits of a command (and the workspace it may use) to
+        consecutive ids, starting with the qubits it acts on.
+
+        Args:
+            cmd (projectq.ops.Command): The command to canonicalize.
+            all_workspace (bool): Use every spare qubit as workspace, even
+                when minimal_workspace_keys is set.
+
+        Returns:
+            tuple: The canonical command, the map from actual to canonical
+                qubit ids, the cache key, and the number of acted-on and of
+                workspace qubits.
+        """
         id_map = {}
         for qureg in cmd.all_qubits:
             for q in qureg:
@@ -89,10 +262,17 @@ class AutoReplacerEx(BasicEngine):
                     id_map[q.id] = len(id_map)
         num_used = len(id_map)
 
-        for q in self.main_engine.active_qubits:
-            if q.id not in id_map:
-                id_map[q.id] = len(id_map)
-        num_available = len(id_map) - num_used
+        # Sorted so that repeated runs (e.g. sharing a persistent cache) pick
+        # the same workspace qubits.
+        spare = sorted(set(q.id for q in cmd.engine.main_engine.active_qubits)
+                       - set(id_map))
+        if not all_workspace:
+            layout = tuple(tuple(id_map[q.id] for q in qureg)
+                           for qureg in cmd.all_qubits)
+            spare = spare[:self._workspace_size(cmd, layout, len(spare))]
+        for qid in spare:
+            id_map[qid] = len(id_map)
+        num_available = len(spare)
 
         new_cmd = CommandEx(
             engine=cmd.engine,
@@ -101,22 +281,148 @@ class AutoReplacerEx(BasicEngine):
             controls=self.remap_qureg(cmd.control_qubits, id_map),
             tags=cmd.tags)
 
-        key = (new_cmd.gate, tuple(tuple(q.id for q in qureg)
-                                   for qureg in new_cmd.all_qubits))
+        key = (new_cmd.gate,
+               tuple(tuple(q.id for q in qureg)
+                     for qureg in new_cmd.all_qubits),
+               num_available)
         return new_cmd, id_map, key, num_used, num_available
 
     def _recursive_decompose(self, cmd):
+        """
+        Args:
+            cmd (projectq.ops.Command): The command to decompose.
+
+        Returns:
+            CompactCommandList: Available commands, acting on the same qubits
+                as the given command, that implement it.
+        """
         if self.is_available(cmd):
-            return [cmd]
+            return CompactCommandList.from_commands([cmd])
+        return CompactCommandList.concatenate(
+            list(self._decompose_pieces(cmd, cache_limit=None)))
+
+    def _decompose_pieces(self, cmd, cache_limit, all_workspace=False):
+        """
+        Decomposes an unavailable command into pieces of available commands.
 
-        canonical_cmd, id_map, key, used, avail = self._canonicalize(cmd)
-        if key in self._cached_results:
-            if self._cached_results == 'IN PROGRESS':
-                raise NoGateDecompositionError(
-                    'Cyclic decomposition for {}.'.format(cmd))
-            return self._translate(cmd, self._cached_results[key], id_map)
-        self._cached_results[key] = 'IN PROGRESS'
+        Subtrees with at most cache_limit leaves (or any number, when the limit
+        is None) are cached and yielded as a single piece. Larger subtrees are
+        yielded piece by piece as they are expanded, and aren't cached.
 
+        Args:
+            cmd (projectq.ops.Command): The command to decompose.
+            cache_limit (None|int): Largest leaf count to buffer and cache.
+            all_workspace (bool): Decompose using every spare qubit, even when
+                minimal_workspace_keys is set.
+
+        Yields:
+            CompactCommandList: Consecutive parts of the decomposition, acting
+                on the same qubits as the given command.
+        """
+        canonical_cmd, id_map, key, used, avail = self._canonicalize(
+            cmd, all_workspace)
+        lookup = _id_lookup(id_map)
+        cached = self.cache.get(key)
+        if self.profiler is not None:
+            self.profiler.record_lookup(
+                cmd, None if cached is None else len(cached))
+        if cached is not None:
+            yield cached.remapped(lookup, cmd.tags)
+            return
+
+        # With minimal workspace, a nested decomposition can end up without
+        # the workspace it needs. Commands whose minimal-workspace expansion
+        # failed are retried with every spare qubit, as long as nothing has
+        # been yielded for them yet.
+        can_widen = self.minimal_workspace_keys and not all_workspace
+        if can_widen and (key in self._failed or key in self._in_progress):
+            for piece in self._decompose_pieces(cmd,
+                                                cache_limit,
+                                                all_workspace=True):
+                yield piece
+            return
+
+        self._enter(key, cmd)
+        buffered = []
+        buffered_size = 0
+        pieces = self._decompose_canonical(canonical_cmd,
+                                           used,
+                                           avail,
+                                           cache_limit)
+        if self.profiler is not None:
+            pieces = self.profiler.profile_pieces(cmd, pieces)
+        try:
+            for piece in pieces:
+                if buffered is None:
+                    yield piece.remapped(lookup, cmd.tags)
+                    continue
+                buffered.append(piece)
+                buffered_size += len(piece)
+                if cache_limit is not None and buffered_size > cache_limit:
+                    for p in buffered:
+                        yield p.remapped(lookup, cmd.tags)
+                    buffered = None
+        except NoGateDecompositionError:
+            self._failed.add(key)
+            if not can_widen or buffered is None:
+                raise
+        finally:
+            self._in_progress.discard(key)
+
+        if key in self._failed:
+            for piece in self._decompose_pieces(cmd,
+                                                cache_limit,
+                                                all_workspace=True):
+                yield piece
+        elif buffered is not None:
+            flattened_result = CompactCommandList.concatenate(buffered)
+            self.cache.put(key, flattened_result)
+            yield flattened_result.remapped(lookup, cmd.tags)
+
+    def _enter(self, key, cmd):
+        """
+        Marks a canonical key as being decomposed, failing fast on keys that
+        already failed and on keys whose decomposition contains themselves.
+        """
+        if key in self._failed:
+            raise NoGateDecompositionError(
+                'No decomposition for {}.'.format(cmd))
+        if key in self._in_progress:
+            raise NoGateDecompositionError(
+                'Cyclic decomposition for {}.'.format(cmd))
+        self._in_progress.add(key)
+
+    def _expand_canonical(self, canonical_cmd, used, avail,
+                          decomposition=None):
+        """
+        Applies one decomposition rule to a canonicalized command.
+
+        Args:
+            canonical_cmd (CommandEx): A command produced by _canonicalize.
+            used (int): The number of qubits the command acts on.
+            avail (int): The number of workspace qubits after those.
+            decomposition (None|_Decomposition): The decomposition to apply.
+                Defaults to the one the chooser picks.
+
+        Returns:
+            tuple[list[projectq.ops.Command], projectq.types.Qureg]:
+                The (locally optimized) commands the chosen rule emitted,
+                acting on canonical qubit ids, and the qubits they act on.
+                Keep the qubits alive while decomposing the commands further;
+                their workspace is found through the engine's active qubits.
+        """
+        if decomposition is None:
+            decomposition = self._pick_decomp_for(canonical_cmd)
+        if self.profiler is not None:
+            self.profiler.record_rule(
+                decomposition,
+                self.decomposition_index.forward_of(decomposition))
+        return self._apply_decomposition(canonical_cmd,
+                                         used,
+                                         avail,
+                                         decomposition)
+
+    def _apply_decomposition(self, canonical_cmd, used, avail, decomposition):
         rec = DummyEngine(save_commands=True)
         eng = MainEngine(backend=rec, engine_list=[
             LocalOptimizer(),
@@ -128,29 +434,170 @@ class AutoReplacerEx(BasicEngine):
         rec.received_commands = []
         canonical_cmd.engine = eng
 
-        self._pick_decomp_for(cmd).decompose(canonical_cmd)
+        decomposition.decompose(canonical_cmd)
         eng.flush()
-        intermediate_result = rec.received_commands[:-1]
 
-        assert involved is not None
-        assert workspace is not None
+        return rec.received_commands[:-1], involved + workspace
+
+    def _decompose_canonical(self, canonical_cmd, used, avail, cache_limit):
+        intermediate_result, qubits = self._expand_canonical(canonical_cmd,
+                                                             used,
+                                                             avail)
+        if self.decomposition_pool is not None and cache_limit is None:
+            self._prefetch_in_parallel(intermediate_result)
+
+        # Runs of available commands are encoded together, instead of one
+        # small array set per leaf.
+        leaves = []
+        for child in intermediate_result:
+            if self.is_available(child):
+                leaves.append(child)
+                continue
+            if leaves:
+                yield CompactCommandList.from_commands(leaves)
+                leaves = []
+            for piece in self._decompose_pieces(child, cache_limit):
+                yield piece
+        if leaves:
+            yield CompactCommandList.from_commands(leaves)
 
-        flattened_result = [leaf
-                            for child in intermediate_result
-                            for leaf in self._recursive_decompose(child)]
+        assert qubits is not None
 
-        self._cached_results[key] = flattened_result
-        return self._translate(cmd, flattened_result, id_map)
+    def _prefetch_in_parallel(self, commands):
+        """
+        Fills the cache with the decompositions of the given commands, using
+        the decomposition pool, when more than one of them is missing.
+        """
+        keys = []
+        for cmd in commands:
+            if self.is_available(cmd):
+                continue
+            key = self._canonicalize(cmd)[2]
+            if (key not in keys and
+                    key not in self._in_progress and
+                    key not in self._failed and
+                    self.cache.get(key) is None):
+                keys.append(key)
+        if len(keys) < 2:
+            return
+
+        for key, result in zip(keys,
+                               self.decomposition_pool.decompose_keys(keys)):
+            if result is not None:
+                self.cache.put(key, result)
+
+    def _streamed_chunks(self, cmd):
+        """
+        Yields:
+            list[CommandEx]: Consecutive chunks of at most streaming_chunk_size
+                available commands that together implement the given command.
+        """
+        chunk_size = self.streaming_chunk_size
+        pending = []
+        pending_size = 0
+        for piece in self._decompose_pieces(
+                cmd, cache_limit=self.streaming_cache_limit):
+            pending.append(piece)
+            pending_size += len(piece)
+            if pending_size < chunk_size:
+                continue
+
+            joined = CompactCommandList.concatenate(pending)
+            full = len(joined) - len(joined) % chunk_size
+            for start in range(0, full, chunk_size):
+                yield joined.to_commands(cmd.engine, start, start + chunk_size)
+            pending = [joined.sliced(full)]
+            pending_size = len(joined) - full
+
+        if pending_size:
+            joined = CompactCommandList.concatenate(pending)
+            yield joined.to_commands(cmd.engine)
 
     def receive(self, command_list):
         for cmd in command_list:
-            self.send(self._recursive_decompose(cmd))
+            if self.is_available(cmd):
+                self.send([cmd])
+            elif self.streaming_chunk_size is None:
+                self.send(
+                    self._recursive_decompose(cmd).to_commands(cmd.engine))
+            else:
+                for chunk in self._streamed_chunks(cmd):
+                    self.send(chunk)
+
+
+def _scratch_command(gate, layout, num_workspace):
+    """
+    Args:
+        gate (projectq.ops.BasicGate): The gate to apply.
+        layout (tuple[tuple[int]]): The canonical ids of the controls and of
+            each target register.
+        num_workspace (int): How many idle qubits to allocate after the ones
+            the command acts on.
+
+    Returns:
+        tuple[CommandEx, projectq.types.Qureg]: A command acting on fresh
+            qubits of a throwaway engine, and all the allocated qubits.
+    """
+    num_used = len(set(i for reg in layout for i in reg))
+    eng = MainEngine(backend=DummyEngine(), engine_list=[])
+    qubits = eng.allocate_qureg(num_used + num_workspace)
+    cmd = CommandEx(engine=eng,
+                    gate=gate,
+                    qubits=tuple(Qureg(qubits[i] for i in reg)
+                                 for reg in layout[1:]),
+                    controls=[qubits[i] for i in layout[0]])
+    return cmd, qubits
+
+
+def _first_decomposition(cmd, decomposition_list):
+    """
+    The default decomposition chooser: the first applicable rule wins.
+    """
+    return decomposition_list[0]
+
+
+def _id_lookup(id_map):
+    """
+    Args:
+        id_map (dict[int, int]): Maps actual qubit ids to canonical ids.
+
+    Returns:
+        numpy.ndarray: Maps canonical ids (as indices) to actual qubit ids.
+    """
+    lookup = np.empty(len(id_map), np.int64)
+    lookup[list(id_map.values())] = list(id_map.keys())
+    return lookup
 
 
 class MergeRule(object):
+    """
+    Rewrites runs of adjacent commands, for SimpleAdjacentCombiner.
+
+    Attributes:
+        window (int): How many adjacent commands the rule looks at.
+        gate_classes (None|tuple[type]): The rule is only tried when the
+            newest command of the window has a gate that's an instance of
+            one of these classes. None means every gate.
+    """
+    window = 2
+    gate_classes = None
+
     def try_merge(self, cmd1, cmd2):
         return None
 
+    def try_rewrite(self, commands):
+        """
+        Args:
+            commands (list[projectq.ops.Command]): The last `window`
+                commands, oldest first.
+
+        Returns:
+            None|list[projectq.ops.Command]: Commands to use instead, or None
+                if the rule doesn't apply. Defaults to try_merge, for rules
+                looking at pairs of commands.
+        """
+        return self.try_merge(*commands)
+
 
 class InverseControlMergeRule(MergeRule):
     def try_merge(self, cmd1, cmd2):
@@ -181,35 +628,72 @@ class InverseControlMergeRule(MergeRule):
 
 
 class SimpleAdjacentCombiner(BasicEngine):
-    def __init__(self, rules):
+    """
+    Holds back the last few commands and rewrites them with merge rules as
+    new commands arrive.
+
+    Rules are indexed by gate class, so each command only tries the rules
+    that can apply to it. Each rule gets one try per incoming command, and
+    the number of times each rule fired is counted in fire_counts (keyed by
+    the rule's class name).
+    """
+    def __init__(self, rules, lookback=None):
+        """
+        Args:
+            rules (list[MergeRule]): The rules to try, in priority order.
+                An InverseControlMergeRule is added at the end.
+            lookback (None|int): How many commands are held back. Rules with
+                a larger window than lookback + 1 never apply. Defaults to
+                just enough for the largest window.
+        """
         BasicEngine.__init__(self)
         self.rules = tuple(rules) + (InverseControlMergeRule(),)
-        self._last_command = None
+        if lookback is None:
+            lookback = max(rule.window for rule in self.rules) - 1
+        self.lookback = lookback
+        self.fire_counts = Counter()
+        self._rules_by_class = {}
+        self._buffer = []
+
+    def _rules_for(self, gate):
+        cls = type(gate)
+        rules = self._rules_by_class.get(cls)
+        if rules is None:
+            rules = tuple(rule
+                          for rule in self.rules
+                          if rule.window <= self.lookback + 1 and (
+                              rule.gate_classes is None or
+                              issubclass(cls, tuple(rule.gate_classes))))
+            self._rules_by_class[cls] = rules
+        return rules
+
+    def _rewrite(self):
+        for rule in self._rules_for(self._buffer[-1].gate):
+            if rule.window > len(self._buffer):
+                continue
+            replacement = rule.try_rewrite(self._buffer[-rule.window:])
+            if replacement is not None:
+                self._buffer[-rule.window:] = replacement
+                self.fire_counts[type(rule).__name__] += 1
+                return
 
     def _process(self, cmd):
         # Flush all commands when asked.
         if isinstance(cmd.gate, FlushGate):
-            if self._last_command is None:
-                return [cmd]
-            p = [self._last_command, cmd]
-            self._last_command = None
+            p = self._buffer + [cmd]
+            self._buffer = []
             return p
 
-        # Buffer commands.
-        if self._last_command is None:
-            self._last_command = cmd
-            return []
-
-        # See if any merge rule applies.
-        for rule in self.rules:
-            merged = rule.try_merge(self._last_command, cmd)
-            if merged is not None:
-                self._last_command = merged[-1] if merged else None
-                return merged[:-1]
+        # Buffer commands, and see if any merge rule applies.
+        self._buffer.append(cmd)
+        self._rewrite()
 
-        p = self._last_command
-        self._last_command = cmd
-        return [p]
+        excess = len(self._buffer) - self.lookback
+        if excess <= 0:
+            return []
+        p = self._buffer[:excess]
+        del self._buffer[:excess]
+        return p
 
     def receive(self, command_list):
         for cmd in command_list:
@@ -18,6 +18,8 @@
 A simulator that only permits classical operations, for faster/easier testing.
 """
 
+import heapq
+
 from projectq.cengines import BasicEngine
 from projectq.ops import (
     XGate,
@@ -36,11 +38,17 @@ class ClassicalSimulator(BasicEngine):
     Allows allocation, deallocation, measuring (no-pop), flushing (no-op),
     controls, NOTs, and any BasicMathGate. Supports reading/writing directly
     from/to bits and registers of bits.
+
+    Deallocated bit positions are recycled (and cleared when handed out
+    again), so allocation and deallocation don't move other bits.
     """
     def __init__(self):
         BasicEngine.__init__(self)
         self._state = 0
         self._bit_positions = {}
+        self._free_positions = []
+        self._num_positions = 0
+        self._register_layouts = {}
 
     def read_bit(self, qubit):
         """
@@ -69,6 +77,43 @@ class ClassicalSimulator(BasicEngine):
         else:
             self._state &= ~(1 << p)
 
+    def _layout(self, qureg):
+        """
+        Returns how a register's bits are laid out in the state.
+
+        Args:
+            qureg (projectq.types.Qureg): The bits, in little-endian order.
+
+        Returns:
+            tuple[int, list[tuple[int, int, int]]]: A mask with the bits from
+                the register set to 1 and other bits set to 0, and the runs of
+                consecutive bits making up the register, as (position in the
+                state, position in the register, length) triples.
+        """
+        key = tuple(q.id for q in qureg)
+        layout = self._register_layouts.get(key)
+        if layout is not None:
+            return layout
+
+        mask = 0
+        runs = []
+        for i, q in enumerate(qureg):
+            p = self._bit_positions[q.id]
+            mask |= 1 << p
+            if runs and runs[-1][0] + runs[-1][2] == p:
+                start, offset, length = runs[-1]
+                runs[-1] = (start, offset, length + 1)
+            else:
+                runs.append((p, i, 1))
+
+        # Entries can't go stale (qubit ids aren't reused), but registers of
+        # deallocated qubits would pile up over a long run.
+        if len(self._register_layouts) >= 1 << 12:
+            self._register_layouts.clear()
+        layout = mask, runs
+        self._register_layouts[key] = layout
+        return layout
+
     def _mask(self, qureg):
         """
         Returns a mask, to compare against the state, with bits from the
@@ -81,10 +126,7 @@ class ClassicalSimulator(BasicEngine):
         Returns:
             int: The mask.
         """
-        t = 0
-        for q in qureg:
-            t |= 1 << self._bit_positions[q.id]
-        return t
+        return self._layout(qureg)[0]
 
     def read_register(self, qureg):
         """
@@ -98,8 +140,8 @@ class ClassicalSimulator(BasicEngine):
             int: Little-endian register value.
         """
         t = 0
-        for i in range(len(qureg)):
-            t |= self.read_bit(qureg[i]) << i
+        for start, offset, length in self._layout(qureg)[1]:
+            t |= ((self._state >> start) & ((1 << length) - 1)) << offset
         return t
 
     def write_register(self, qureg, value):
@@ -113,8 +155,11 @@ class ClassicalSimulator(BasicEngine):
         """
         if value < 0 or value >= 1 << len(qureg):
             raise ValueError("Value won't fit in register.")
-        for i in range(len(qureg)):
-            self.write_bit(qureg[i], (value >> i) & 1)
+        mask, runs = self._layout(qureg)
+        t = 0
+        for start, offset, length in runs:
+            t |= ((value >> offset) & ((1 << length) - 1)) << start
+        self._state = (self._state & ~mask) | t
 
     def is_available(self, cmd):
         return (cmd.gate == Measure or
@@ -136,18 +181,19 @@ class ClassicalSimulator(BasicEngine):
 
         if cmd.gate == Allocate:
             new_id = cmd.qubits[0][0].id
-            self._bit_positions[new_id] = len(self._bit_positions)
+            if self._free_positions:
+                pos = heapq.heappop(self._free_positions)
+                self._state &= ~(1 << pos)
+            else:
+                pos = self._num_positions
+                self._num_positions += 1
+            self._bit_positions[new_id] = pos
             return
 
         if cmd.gate == Deallocate:
             old_id = cmd.qubits[0][0].id
-            pos = self._bit_positions[old_id]
-            low = (1 << pos) - 1
-            self._state = (self._state & low) | ((self._state >> 1) & ~low)
-            self._bit_positions = {
-                k: b - (0 if b < pos else 1)
-                for k, b in self._bit_positions.items()
-            }
+            heapq.heappush(self._free_positions,
+                           self._bit_positions.pop(old_id))
             return
 
         controls_mask = self._mask(cmd.control_qubits)
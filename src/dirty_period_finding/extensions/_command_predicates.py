@@ -26,6 +26,26 @@ class _CommandPredicate(object):
     def __call__(self, cmd):
         raise NotImplementedError()
 
+    def workspace_demand(self, cmd):
+        """
+        Args:
+            cmd (projectq.ops.Command): A command satisfying the predicate.
+
+        Returns:
+            int: How many workspace qubits the command needs for the predicate
+                to stay satisfied. Zero if the predicate ignores workspace.
+        """
+        return 0
+
+    def reads_only_shape(self):
+        """
+        Returns:
+            bool: True when the predicate only looks at a command's shape (its
+                register sizes, number of controls and amount of workspace),
+                so that commands of the same shape get the same answer.
+        """
+        return False
+
     def __and__(self, other):
         return _CommandPredicateCombinator([self, other], all, 'all')
 
@@ -42,19 +62,42 @@ class _CommandPredicateCombinator(_CommandPredicate):
     def __call__(self, cmd):
         return self.combinator(predicate(cmd) for predicate in self.predicates)
 
+    def workspace_demand(self, cmd):
+        if self.combinator is all:
+            return max(workspace_demand(predicate, cmd)
+                       for predicate in self.predicates)
+        # Only one satisfied alternative needs to stay satisfied.
+        return min(workspace_demand(predicate, cmd)
+                   for predicate in self.predicates
+                   if predicate(cmd))
+
+    def reads_only_shape(self):
+        return all(reads_only_shape(predicate)
+                   for predicate in self.predicates)
+
     def __str__(self):
         return '{}({})'.format(self.combinator_desc,
                                ', '.join(str(e) for e in self.predicates))
 
 
 class _CommandPredicateLambda(_CommandPredicate):
-    def __init__(self, predicate, desc):
+    """
+    A predicate on a command's shape.
+    """
+    def __init__(self, predicate, desc, demand=lambda cmd: 0):
         self.predicate = predicate
         self.desc = desc
+        self.demand = demand
+
+    def reads_only_shape(self):
+        return True
 
     def __call__(self, cmd):
         return self.predicate(cmd)
 
+    def workspace_demand(self, cmd):
+        return self.demand(cmd)
+
     def __str__(self):
         return self.desc()
 
@@ -97,24 +140,61 @@ def workspace(cmd):
     return sorted(result, key=lambda q: q.id)
 
 
+def workspace_demand(predicate, cmd):
+    """
+    Args:
+        predicate (function(projectq.ops.Command) : bool): A decomposition
+            rule's gate recognizer.
+        cmd (projectq.ops.Command): A command satisfying the predicate.
+
+    Returns:
+        int: How many workspace qubits the command needs for the predicate to
+            stay satisfied. Predicates not built from the ones in this module
+            are assumed to ignore workspace.
+    """
+    if isinstance(predicate, _CommandPredicate):
+        return predicate.workspace_demand(cmd)
+    return 0
+
+
+def reads_only_shape(predicate):
+    """
+    Args:
+        predicate (function(projectq.ops.Command) : bool): A decomposition
+            rule's gate recognizer.
+
+    Returns:
+        bool: True when the predicate is built only from the ones in this
+            module, which look at nothing but a command's shape. Arbitrary
+            functions (e.g. ones reading the gate's parameters) may look at
+            anything.
+    """
+    if isinstance(predicate, _CommandPredicate):
+        return predicate.reads_only_shape()
+    return False
+
+
 def min_workspace(limit):
     return _CommandPredicateLambda(
         predicate=lambda cmd: len(workspace(cmd)) >= limit,
-        desc=lambda: 'min_workspace({})'.format(limit()))
+        desc=lambda: 'min_workspace({})'.format(limit()),
+        demand=lambda cmd: limit)
 
 
 def min_workspace_vs_controls(factor, offset=0):
     return _CommandPredicateLambda(
         predicate=lambda cmd:
             len(workspace(cmd)) >= offset + factor*len(cmd.control_qubits),
-        desc=lambda: 'min_workspace({}, {})'.format(offset, factor))
+        desc=lambda: 'min_workspace({}, {})'.format(offset, factor),
+        demand=lambda cmd: offset + factor*len(cmd.control_qubits))
 
 
 def min_workspace_vs_reg1(factor, offset=0):
     return _CommandPredicateLambda(
         predicate=lambda cmd:
             len(workspace(cmd)) >= offset + factor*len(cmd.qubits[0]),
-        desc=lambda: 'min_workspace({}, {})'.format(offset, factor))
+        desc=lambda: 'min_workspace({}, {})'.format(offset, factor),
+        demand=lambda cmd: offset + factor*len(cmd.qubits[0]))
 
 
 def max_workspace(limit):
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An array-backed encoding of command sequences, used to store flattened
+decompositions without keeping millions of command objects alive.
+"""
+
+from __future__ import unicode_literals
+
+import sys
+
+import numpy as np
+from projectq.types import Qureg, WeakQubitRef
+
+from ._command_ex import CommandEx
+
+
+class CompactCommandList(object):
+    """
+    A sequence of commands stored as flat arrays.
+
+    Each command is described by an index into an interned table of gates, an
+    index into an interned table of layouts (the control count and the size of
+    each target register), an index into an interned table of tag tuples, and
+    a slice of a flat array of qubit ids. The slice lists the control qubits
+    followed by the qubits of each target register.
+
+    Remapping the qubits of every command is a single array lookup, so
+    translating a cached decomposition onto new qubits doesn't allocate an
+    object per command. Command objects are only created by to_commands.
+
+    Instances should be treated as immutable; derived lists share arrays.
+    """
+    def __init__(self,
+                 gates,
+                 layouts,
+                 tag_lists,
+                 gate_ids,
+                 layout_ids,
+                 tag_ids,
+                 qubit_ids,
+                 offsets):
+        """
+        Args:
+            gates (list[projectq.ops.BasicGate]): Interned gate table.
+            layouts (list[tuple[int, tuple[int]]]): Interned table of
+                (control count, target register sizes) pairs.
+            tag_lists (list[tuple]): Interned table of tag tuples.
+            gate_ids (numpy.ndarray): Per-command index into gates.
+            layout_ids (numpy.ndarray): Per-command index into layouts.
+            tag_ids (numpy.ndarray): Per-command index into tag_lists.
+            qubit_ids (numpy.ndarray): The qubit ids of all commands,
+                concatenated.
+            offsets (numpy.ndarray): Where each command's qubit ids start
+                within qubit_ids, plus a final entry for the total length.
+        """
+        self.gates = gates
+        self.layouts = layouts
+        self.tag_lists = tag_lists
+        self.gate_ids = gate_ids
+        self.layout_ids = layout_ids
+        self.tag_ids = tag_ids
+        self.qubit_ids = qubit_ids
+        self.offsets = offsets
+
+    @staticmethod
+    def from_commands(commands):
+        """
+        Args:
+            commands (list[projectq.ops.Command]): The commands to encode.
+
+        Returns:
+            CompactCommandList:
+        """
+        gates = _Interner()
+        layouts = _Interner()
+        tag_lists = _Interner()
+        gate_ids = []
+        layout_ids = []
+        tag_ids = []
+        qubit_ids = []
+        offsets = [0]
+        for cmd in commands:
+            gate_ids.append(gates.index_of(cmd.gate))
+            layout_ids.append(layouts.index_of((
+                len(cmd.control_qubits),
+                tuple(len(reg) for reg in cmd.qubits))))
+            tag_ids.append(tag_lists.index_of(tuple(cmd.tags)))
+            for reg in cmd.all_qubits:
+                qubit_ids.extend(q.id for q in reg)
+            offsets.append(len(qubit_ids))
+
+        return CompactCommandList(
+            gates=gates.items,
+            layouts=layouts.items,
+            tag_lists=tag_lists.items,
+            gate_ids=np.array(gate_ids, np.int32),
+            layout_ids=np.array(layout_ids, np.int32),
+            tag_ids=np.array(tag_ids, np.int32),
+            qubit_ids=np.array(qubit_ids, np.int64),
+            offsets=np.array(offsets, np.int64))
+
+    @staticmethod
+    def concatenate(parts):
+        """
+        Args:
+            parts (list[CompactCommandList]): The sequences to join.
+
+        Returns:
+            CompactCommandList: The commands of each part, in order.
+        """
+        if len(parts) == 1:
+            return parts[0]
+
+        gates = _Interner()
+        layouts = _Interner()
+        tag_lists = _Interner()
+        gate_ids = []
+        layout_ids = []
+        tag_ids = []
+        qubit_ids = []
+        offsets = [np.zeros(1, np.int64)]
+        total = 0
+        for part in parts:
+            gate_ids.append(gates.translation(part.gates)[part.gate_ids])
+            layout_ids.append(
+                layouts.translation(part.layouts)[part.layout_ids])
+            tag_ids.append(tag_lists.translation(part.tag_lists)[part.tag_ids])
+            qubit_ids.append(part.qubit_ids)
+            offsets.append(part.offsets[1:] + total)
+            total += len(part.qubit_ids)
+
+        return CompactCommandList(
+            gates=gates.items,
+            layouts=layouts.items,
+            tag_lists=tag_lists.items,
+            gate_ids=_concat(gate_ids, np.int32),
+            layout_ids=_concat(layout_ids, np.int32),
+            tag_ids=_concat(tag_ids, np.int32),
+            qubit_ids=_concat(qubit_ids, np.int64),
+            offsets=_concat(offsets, np.int64))
+
+    def remapped(self, id_lookup, prefix_tags=()):
+        """
+        Args:
+            id_lookup (numpy.ndarray): Maps each current qubit id (used as an
+                index) to its new qubit id.
+            prefix_tags (list): Tags to put before each command's own tags.
+
+        Returns:
+            CompactCommandList: The same commands, acting on the new qubits.
+        """
+        tag_lists = self.tag_lists
+        if prefix_tags:
+            prefix = tuple(prefix_tags)
+            tag_lists = [prefix + tags for tags in tag_lists]
+        return CompactCommandList(
+            gates=self.gates,
+            layouts=self.layouts,
+            tag_lists=tag_lists,
+            gate_ids=self.gate_ids,
+            layout_ids=self.layout_ids,
+            tag_ids=self.tag_ids,
+            qubit_ids=id_lookup[self.qubit_ids],
+            offsets=self.offsets)
+
+    def sliced(self, start, stop=None):
+        """
+        Args:
+            start (int): Index of the first command to keep.
+            stop (None|int): Index after the last command to keep. Defaults
+                to the end of the list.
+
+        Returns:
+            CompactCommandList: The commands in the given range.
+        """
+        if stop is None:
+            stop = len(self)
+        offsets = self.offsets[start:stop + 1]
+        return CompactCommandList(
+            gates=self.gates,
+            layouts=self.layouts,
+            tag_lists=self.tag_lists,
+            gate_ids=self.gate_ids[start:stop],
+            layout_ids=self.layout_ids[start:stop],
+            tag_ids=self.tag_ids[start:stop],
+            qubit_ids=self.qubit_ids[offsets[0]:offsets[-1]],
+            offsets=offsets - offsets[0])
+
+    def to_commands(self, engine, start=0, stop=None):
+        """
+        Args:
+            engine (projectq.cengines.BasicEngine): The engine owning the
+                created commands and qubit references.
+            start (int): Index of the first command to create.
+            stop (None|int): Index after the last command to create. Defaults
+                to the end of the list.
+
+        Returns:
+            list[CommandEx]:
+        """
+        if start != 0 or (stop is not None and stop != len(self)):
+            return self.sliced(start, stop).to_commands(engine)
+
+        ids = self.qubit_ids.tolist()
+        starts = self.offsets.tolist()
+        result = []
+        for i, (g, l, t) in enumerate(zip(self.gate_ids.tolist(),
+                                          self.layout_ids.tolist(),
+                                          self.tag_ids.tolist())):
+            num_controls, sizes = self.layouts[l]
+            p = starts[i]
+            controls = [WeakQubitRef(engine, q)
+                        for q in ids[p:p + num_controls]]
+            p += num_controls
+            quregs = []
+            for size in sizes:
+                quregs.append(Qureg(WeakQubitRef(engine, q)
+                                    for q in ids[p:p + size]))
+                p += size
+            result.append(CommandEx(engine=engine,
+                                    gate=self.gates[g],
+                                    qubits=tuple(quregs),
+                                    controls=controls,
+                                    tags=self.tag_lists[t]))
+        return result
+
+    @property
+    def nbytes(self):
+        """
+        int: Approximate memory used, not counting the gates themselves.
+        """
+        arrays = [self.gate_ids,
+                  self.layout_ids,
+                  self.tag_ids,
+                  self.qubit_ids,
+                  self.offsets]
+        return (sum(a.nbytes for a in arrays) +
+                sys.getsizeof(self.gates) +
+                sys.getsizeof(self.layouts) +
+                sys.getsizeof(self.tag_lists))
+
+    def __len__(self):
+        return len(self.gate_ids)
+
+    def __repr__(self):
+        return 'CompactCommandList({} commands, {} gates)'.format(
+            len(self), len(self.gates))
+
+
+class _Interner(object):
+    """
+    Assigns consecutive indices to distinct values. Falls back to equality
+    scans for unhashable values.
+    """
+    def __init__(self):
+        self.items = []
+        self._hashed = {}
+
+    def index_of(self, value):
+        try:
+            index = self._hashed.get(value)
+        except TypeError:
+            index = next((i for i, e in enumerate(self.items) if e == value),
+                         None)
+        if index is None:
+            index = len(self.items)
+            self.items.append(value)
+            try:
+                self._hashed[value] = index
+            except TypeError:
+                pass
+        return index
+
+    def translation(self, values):
+        """
+        Returns:
+            numpy.ndarray: The interned index of each of the given values.
+        """
+        return np.array([self.index_of(v) for v in values], np.int32)
+
+
+def _concat(arrays, dtype):
+    if not arrays:
+        return np.zeros(0, dtype)
+    return np.concatenate(arrays).astype(dtype, copy=False)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A rule set, decomposition cache, and engine setup shared across circuits.
+"""
+
+from __future__ import unicode_literals
+
+from projectq import MainEngine
+
+from ._cached_auto_replacer import AutoReplacerEx
+from ._decomposition_cache import DecompositionCache
+from ._symbolic_gate_counter import SymbolicGateCounter
+
+
+class CompilationContext(object):
+    """
+    Builds compilation pipelines that share one decomposition cache.
+
+    Creating a new AutoReplacerEx per circuit starts it off with an empty
+    cache, so every circuit decomposes again the subgates it has in common
+    with the previous ones. The pipelines of a context instead consult and
+    fill the context's cache, whether they're used for different attempts
+    at the same problem or for different register sizes.
+
+    The leaf commands of a decomposition depend on which commands the engines
+    after the replacer accept, so each pipeline ends with engines made by the
+    same factory. Contexts with differently behaving engines must not share a
+    cache.
+    """
+    def __init__(self,
+                 decomposition_rule_set,
+                 engine_list_factory=list,
+                 cache=None,
+                 **replacer_kwargs):
+        """
+        Args:
+            decomposition_rule_set (projectq.cengines.DecompositionRuleSet):
+                The rules used to break down unavailable commands.
+            engine_list_factory (function() : list[BasicEngine]): Creates the
+                engines placed after the replacer (e.g. a
+                LimitedCapabilityEngine). Defaults to none, leaving the
+                backend to decide what's available.
+            cache (None|DecompositionCache): The shared cache. Defaults to a
+                fresh in-memory cache.
+            **replacer_kwargs: Passed on to every AutoReplacerEx (or
+                SymbolicGateCounter) built by the context.
+        """
+        self.decomposition_rule_set = decomposition_rule_set
+        self.engine_list_factory = engine_list_factory
+        self.cache = DecompositionCache() if cache is None else cache
+        self.replacer_kwargs = replacer_kwargs
+        self.pipelines_built = 0
+        self.counters_built = 0
+        self._engine_list = None
+
+    def new_engine_list(self):
+        """
+        Returns:
+            list[BasicEngine]: A new AutoReplacerEx using the shared cache,
+                followed by new engines from the factory.
+        """
+        self.pipelines_built += 1
+        replacer = AutoReplacerEx(self.decomposition_rule_set,
+                                  cache=self.cache,
+                                  **self.replacer_kwargs)
+        return [replacer] + list(self.engine_list_factory())
+
+    def new_counting_engine_list(self, counter_class=SymbolicGateCounter):
+        """
+        Args:
+            counter_class (type): SymbolicGateCounter or a subclass of it
+                (e.g. ResourceEstimator).
+
+        Returns:
+            list[BasicEngine]: A new counter using the shared cache, followed
+                by new engines from the factory. The counter is the first
+                engine.
+        """
+        self.counters_built += 1
+        counter = counter_class(self.decomposition_rule_set,
+                                cache=self.cache,
+                                **self.replacer_kwargs)
+        return [counter] + list(self.engine_list_factory())
+
+    def engine_list(self):
+        """
+        Returns:
+            list[BasicEngine]: The context's long-lived pipeline, created on
+                first use. It can be reused by one main engine after another
+                (see main_engine), but not by two at once.
+        """
+        if self._engine_list is None:
+            self._engine_list = self.new_engine_list()
+        return self._engine_list
+
+    def main_engine(self, backend, backend_engines=()):
+        """
+        Args:
+            backend (BasicEngine): Where the compiled commands go.
+            backend_engines (list[BasicEngine]): Engines placed between the
+                pipeline and the backend (e.g. a ReversibleGateFuser). They
+                see the compiled commands, so they don't affect the cache.
+
+        Returns:
+            projectq.MainEngine: A main engine feeding the context's
+                long-lived pipeline, which feeds the given backend.
+        """
+        return MainEngine(backend=backend,
+                          engine_list=(list(self.engine_list()) +
+                                       list(backend_engines)))
+
+    def stats(self):
+        """
+        Returns:
+            dict[str, int]: The cache's statistics (see
+                DecompositionCache.stats), plus how many pipelines and
+                counters the context has built.
+        """
+        result = self.cache.stats()
+        result['pipelines'] = self.pipelines_built
+        result['counters'] = self.counters_built
+        return result
+
+    def reset_stats(self):
+        """Zeroes the cache's counters and the context's build counts."""
+        self.cache.reset_stats()
+        self.pipelines_built = 0
+        self.counters_built = 0
+
+    def reset(self):
+        """
+        Empties the shared cache and discards the long-lived pipeline. Later
+        pipelines start cold, as if the context was new.
+        """
+        self.cache.clear()
+        self._engine_list = None
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A decomposition chooser that picks the applicable rule with the cheapest
+fully decomposed result.
+"""
+
+from __future__ import unicode_literals
+
+from projectq.cengines import DummyEngine, MainEngine
+from projectq.cengines._replacer import NoGateDecompositionError
+
+from ._symbolic_gate_counter import SymbolicGateCounter
+
+
+def toffoli_cost(histogram):
+    """
+    The default cost used by MinimumCostChooser.
+
+    Args:
+        histogram (GateHistogram): Counts of a decomposition's leaf commands.
+
+    Returns:
+        tuple[int, int]: The number of gates with at least two controls,
+            then the total number of gates (to break ties).
+    """
+    toffolis = sum(n
+                   for (_, controls), n in histogram.counts.items()
+                   if controls >= 2)
+    return toffolis, histogram.total()
+
+
+class MinimumCostChooser(object):
+    """
+    A decomposition_chooser for AutoReplacerEx that tries every applicable
+    decomposition and picks the one whose fully decomposed result costs the
+    least, keeping the earliest rule on ties.
+
+    Costs are estimated symbolically, by counting each candidate's leaves with
+    a SymbolicGateCounter that uses this same chooser for nested commands. The
+    counter caches a GateHistogram per canonical command, so every distinct
+    subcommand is costed once and the chosen decompositions are cheapest all
+    the way down. The choice made for each canonical command is memoized as
+    well, along with the winner's histogram (so the counter never expands the
+    winner a second time).
+
+    Candidates that can't be fully decomposed (including ones that lead back
+    to the command being chosen for) are skipped. A candidate that leads back
+    to a command further up only fails because of what is being expanded
+    above it, so choices and counts made below that command aren't memoized.
+
+    Each chooser should be given to a single AutoReplacerEx, which attaches
+    itself so that costs are measured against the engines after it.
+    """
+    def __init__(self, cost=toffoli_cost, cache=None):
+        """
+        Args:
+            cost (function(GateHistogram) : comparable): What to minimize.
+                Defaults to the Toffoli count. For example, pass
+                `lambda h: (h.width,) + toffoli_cost(h)` to prefer
+                decompositions that touch fewer qubits.
+            cache (None|DecompositionCache): Where histograms of nested
+                commands are memoized. Defaults to a fresh in-memory cache.
+                When passing a FileDecompositionCache, give it a namespace
+                that identifies the cost function.
+        """
+        self.cost = cost
+        self.cache = cache
+        self.counter = None
+        self._chosen = {}
+        # The keys being chosen for or counted, mapped to their nesting depth.
+        self._depths = {}
+        # Per open key, the smallest depth a cycle below it returned to.
+        self._cycle_depths = []
+
+    def attach(self, replacer):
+        """
+        Args:
+            replacer (AutoReplacerEx): The engine using this chooser. Its
+                rules, merge rules and next engines are used when estimating
+                costs.
+        """
+        counter = _CostCounter(self,
+                               replacer.decomposition_rule_set,
+                               merge_rules=replacer.merge_rules,
+                               cache=self.cache)
+        counter.decomposition_chooser = self
+        counter.is_available = replacer.is_available
+        self.counter = counter
+
+    def estimate(self, cmd, decomposition):
+        """
+        Args:
+            cmd (projectq.ops.Command): The command to decompose.
+            decomposition (_Decomposition): An applicable decomposition.
+
+        Returns:
+            GateHistogram: Counts of the available commands that result from
+                applying the given decomposition, then decomposing its output
+                with this chooser, acting on canonical qubit ids.
+
+        Raises:
+            NoGateDecompositionError: The decomposition's output can't be
+                fully decomposed.
+        """
+        canonical_cmd, _, _, used, avail = self.counter._canonicalize(cmd)
+        return self.counter._count_canonical(canonical_cmd,
+                                             used,
+                                             avail,
+                                             decomposition)
+
+    def __call__(self, cmd, decomposition_list):
+        return self.choose(cmd, decomposition_list)[0]
+
+    def choose(self, cmd, decomposition_list):
+        """
+        Args:
+            cmd (projectq.ops.Command): The command to decompose.
+            decomposition_list (list[_Decomposition]): The applicable
+                decompositions.
+
+        Returns:
+            tuple[_Decomposition, None|GateHistogram]: The cheapest
+                decomposition and its estimate (see estimate), or None when
+                there was nothing to compare it to.
+
+        Raises:
+            NoGateDecompositionError: None of the decompositions can be fully
+                decomposed.
+        """
+        if len(decomposition_list) == 1:
+            return decomposition_list[0], None
+
+        key = self.counter._canonicalize(cmd)[2]
+        chosen = self._chosen.get(key)
+        if chosen is None:
+            index, histogram, tainted = self._choose(cmd,
+                                                     key,
+                                                     decomposition_list)
+            chosen = index, histogram
+            if not tainted:
+                self._chosen[key] = chosen
+        index, histogram = chosen
+        return decomposition_list[index], histogram
+
+    def _choose(self, cmd, key, decomposition_list):
+        if key in self._depths:
+            self._returned_to(key)
+            raise NoGateDecompositionError(
+                'Cyclic decomposition for {}.'.format(cmd))
+
+        self._open(key)
+        try:
+            best_index = None
+            best_cost = None
+            best_histogram = None
+            for i, decomposition in enumerate(decomposition_list):
+                try:
+                    histogram = self.estimate(cmd, decomposition)
+                except NoGateDecompositionError:
+                    continue
+                cost = self.cost(histogram)
+                if best_index is None or cost < best_cost:
+                    best_index = i
+                    best_cost = cost
+                    best_histogram = histogram
+        finally:
+            tainted = self._close(key)
+
+        if best_index is None:
+            raise NoGateDecompositionError(
+                'No decomposition for {}.'.format(cmd))
+        return best_index, best_histogram, tainted
+
+    def _open(self, key):
+        self._depths[key] = len(self._cycle_depths)
+        self._cycle_depths.append(len(self._cycle_depths))
+
+    def _returned_to(self, key):
+        """Records a cycle from the innermost open key back to the given."""
+        self._cycle_depths[-1] = min(self._cycle_depths[-1],
+                                     self._depths[key])
+
+    def _close(self, key):
+        """
+        Returns:
+            bool: True when a cycle below the given key returned to a key
+                above it, so that its result depends on what was open.
+        """
+        depth = self._depths.pop(key)
+        cycle_depth = self._cycle_depths.pop()
+        if self._cycle_depths:
+            self._cycle_depths[-1] = min(self._cycle_depths[-1], cycle_depth)
+        return cycle_depth < depth
+
+
+class _CostCounter(SymbolicGateCounter):
+    """
+    The SymbolicGateCounter a MinimumCostChooser estimates costs with.
+
+    Shares the chooser's cycle tracking, so that counts that only failed or
+    differ because of what was being expanded above them aren't memoized, and
+    takes the histogram of a chosen decomposition from the chooser instead of
+    expanding it again.
+    """
+    def __init__(self, chooser, decomposition_rule_set, **kwargs):
+        SymbolicGateCounter.__init__(self, decomposition_rule_set, **kwargs)
+        self.chooser = chooser
+
+    def _enter(self, key, cmd):
+        if key in self.chooser._depths:
+            self.chooser._returned_to(key)
+        SymbolicGateCounter._enter(self, key, cmd)
+        self.chooser._open(key)
+
+    def _remember(self, key, histogram):
+        if not self.chooser._close(key):
+            SymbolicGateCounter._remember(self, key, histogram)
+
+    def _remember_failure(self, key):
+        if not self.chooser._close(key):
+            SymbolicGateCounter._remember_failure(self, key)
+
+    def _count_canonical(self, canonical_cmd, used, avail,
+                         decomposition=None):
+        if decomposition is None:
+            decomposition, histogram = self._choose_canonical(canonical_cmd,
+                                                              used,
+                                                              avail)
+            if histogram is not None:
+                return histogram
+        return SymbolicGateCounter._count_canonical(self,
+                                                    canonical_cmd,
+                                                    used,
+                                                    avail,
+                                                    decomposition)
+
+    def _choose_canonical(self, canonical_cmd, used, avail):
+        eng = MainEngine(backend=DummyEngine(), engine_list=[])
+        qubits = eng.allocate_qureg(used + avail)
+        canonical_cmd.engine = eng
+        choices = self._all_decomps_for(canonical_cmd)
+        if not choices:
+            raise NoGateDecompositionError(
+                'No decomposition for {}.'.format(canonical_cmd))
+        result = self.chooser.choose(canonical_cmd, choices)
+        assert qubits is not None
+        return result
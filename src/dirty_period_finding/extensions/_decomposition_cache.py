@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Storage backends for the flattened decompositions memoized by AutoReplacerEx.
+"""
+
+from __future__ import unicode_literals
+
+import collections
+import hashlib
+import os
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Bump when the on-disk encoding of entries changes.
+_FILE_FORMAT_VERSION = 2
+
+
+class DecompositionCache(object):
+    """
+    An unbounded in-memory store of flattened decompositions.
+
+    Keys are the hashable canonical keys produced by AutoReplacerEx (the gate
+    and the canonical qubit layout it acts on). Values are CompactCommandLists
+    of leaf commands acting on canonical qubit ids.
+    """
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Args:
+            key (tuple): A canonical command key.
+
+        Returns:
+            None|CompactCommandList:
+                The cached leaf commands, or None if there's no entry.
+        """
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, key, commands):
+        """
+        Args:
+            key (tuple): A canonical command key.
+            commands (CompactCommandList): Canonical leaf commands.
+        """
+        self._entries[key] = commands
+
+    def clear(self):
+        self._entries.clear()
+
+    def commands_held(self):
+        """
+        Returns:
+            int: The total number of leaf commands across all entries.
+        """
+        return sum(len(e) for e in self._entries.values())
+
+    def bytes_held(self):
+        """
+        Returns:
+            int: An estimate of the memory used by the cached commands.
+        """
+        return sum(e.nbytes for e in self._entries.values())
+
+    def stats(self):
+        """
+        Returns:
+            dict[str, int]: Entry count, hit/miss/eviction counters, and the
+                number of commands and (estimated) bytes held.
+        """
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'commands': self.commands_held(),
+            'bytes': self.bytes_held(),
+        }
+
+    def reset_stats(self):
+        """Zeroes the hit, miss and eviction counters."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class BoundedDecompositionCache(DecompositionCache):
+    """
+    An in-memory decomposition cache with a capacity, measured in leaf
+    commands, that evicts the least recently used entries when full.
+
+    Weighting by command count means a single huge flattened decomposition
+    pushes out many small ones, which keeps memory use proportional to the
+    capacity no matter how the cached sizes are distributed.
+    """
+    def __init__(self, max_commands, max_entries=None):
+        """
+        Args:
+            max_commands (int): Maximum total number of leaf commands held.
+                Entries larger than this are never stored.
+            max_entries (None|int): Optional limit on the number of entries.
+        """
+        DecompositionCache.__init__(self)
+        self._entries = collections.OrderedDict()
+        self._sizes = {}
+        self._commands_held = 0
+        self._bytes_held = 0
+        self.max_commands = max_commands
+        self.max_entries = max_entries
+
+    def get(self, key):
+        result = self._entries.pop(key, None)
+        if result is None:
+            self.misses += 1
+            return None
+        # Re-insert to mark as most recently used.
+        self._entries[key] = result
+        self.hits += 1
+        return result
+
+    def put(self, key, commands):
+        if key in self._entries:
+            self._discard(key)
+        if len(commands) > self.max_commands:
+            return
+
+        size = commands.nbytes
+        self._entries[key] = commands
+        self._sizes[key] = size
+        self._commands_held += len(commands)
+        self._bytes_held += size
+
+        while (self._commands_held > self.max_commands or
+               (self.max_entries is not None and
+                len(self._entries) > self.max_entries)):
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        DecompositionCache.clear(self)
+        self._sizes.clear()
+        self._commands_held = 0
+        self._bytes_held = 0
+
+    def commands_held(self):
+        return self._commands_held
+
+    def bytes_held(self):
+        return self._bytes_held
+
+    def _discard(self, key):
+        commands = self._entries.pop(key)
+        self._commands_held -= len(commands)
+        self._bytes_held -= self._sizes.pop(key)
+
+
+class FileDecompositionCache(DecompositionCache):
+    """
+    A decomposition cache that also persists its entries to disk, so that
+    later runs can skip decomposing commands seen by earlier runs.
+
+    Entries are content-addressed. Each one is stored in a file named after a
+    hash of its canonical key, inside a directory named after the file format
+    version and a fingerprint of the decomposition rules. Editing a rule module
+    therefore moves later runs into a fresh directory instead of serving stale
+    results.
+
+    The leaves produced by a decomposition also depend on what the engines
+    after the AutoReplacerEx accept, which can't be fingerprinted
+    automatically. Use distinct namespaces for differently configured
+    pipelines sharing one directory.
+
+    Entries whose gates or tags can't be pickled are only kept in memory.
+    """
+    def __init__(self,
+                 directory,
+                 decomposition_rule_set,
+                 namespace='',
+                 memory_cache=None):
+        """
+        Args:
+            directory (str): Root directory of the persistent store. Created
+                if it doesn't exist.
+            decomposition_rule_set (projectq.cengines.DecompositionRuleSet):
+                The rules used by the AutoReplacerEx that owns this cache.
+            namespace (str): Distinguishes pipelines that share a directory
+                and rule set but accept different leaf gates.
+            memory_cache (None|DecompositionCache): In-process front for the
+                disk store. Defaults to an unbounded DecompositionCache.
+        """
+        DecompositionCache.__init__(self)
+        fingerprint = hashlib.sha256()
+        fingerprint.update(_rule_set_fingerprint(
+            decomposition_rule_set).encode('utf8'))
+        fingerprint.update(namespace.encode('utf8'))
+        self.directory = os.path.join(
+            directory,
+            'v{}'.format(_FILE_FORMAT_VERSION),
+            fingerprint.hexdigest()[:32])
+        self.memory_cache = (DecompositionCache()
+                             if memory_cache is None
+                             else memory_cache)
+
+    def get(self, key):
+        result = self.memory_cache.get(key)
+        if result is None:
+            result = self._load(key)
+            if result is not None:
+                self.memory_cache.put(key, result)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def _load(self, key):
+        path = self._path_for(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                stored_key, commands = pickle.load(f)
+        except Exception:
+            # Truncated, corrupted, or written by incompatible code.
+            return None
+        if stored_key != key:
+            return None
+        return commands
+
+    def put(self, key, commands):
+        self.memory_cache.put(key, commands)
+
+        path = self._path_for(key)
+        if path is None:
+            return
+        try:
+            data = pickle.dumps((key, commands), protocol=2)
+        except Exception:
+            return
+        _atomic_write(path, data)
+
+    def clear(self):
+        """Clears the in-memory entries. Files on disk are left alone."""
+        self.memory_cache.clear()
+
+    def commands_held(self):
+        return self.memory_cache.commands_held()
+
+    def bytes_held(self):
+        return self.memory_cache.bytes_held()
+
+    def stats(self):
+        result = DecompositionCache.stats(self)
+        result['evictions'] = self.memory_cache.evictions
+        return result
+
+    def reset_stats(self):
+        DecompositionCache.reset_stats(self)
+        self.memory_cache.reset_stats()
+
+    def __len__(self):
+        return len(self.memory_cache)
+
+    def _path_for(self, key):
+        try:
+            digest = hashlib.sha256(pickle.dumps(key, protocol=2)).hexdigest()
+        except Exception:
+            return None
+        return os.path.join(self.directory, digest[:2], digest + '.pickle')
+
+
+def _atomic_write(path, data):
+    directory = os.path.dirname(path)
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    except OSError:
+        # Possibly created concurrently by another process.
+        if not os.path.isdir(directory):
+            return
+
+    try:
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    except OSError:
+        return
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(data)
+        os.rename(temp_path, path)
+    except (IOError, OSError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _rule_set_fingerprint(decomposition_rule_set):
+    """
+    Hashes the gate classes, decomposer/recognizer bytecode, and the source
+    files defining the rules of a DecompositionRuleSet.
+
+    Returns:
+        str: A hex digest.
+    """
+    h = hashlib.sha256()
+    sources = set()
+    decompositions = decomposition_rule_set.decompositions
+    for class_name in sorted(decompositions):
+        h.update(class_name.encode('utf8'))
+        for decomposition in decompositions[class_name]:
+            for func in [decomposition.decompose, decomposition.check]:
+                code = getattr(func, '__code__', None)
+                if code is None:
+                    h.update(type(func).__name__.encode('utf8'))
+                    continue
+                h.update(code.co_code)
+                sources.add(code.co_filename)
+
+    for path in sorted(sources):
+        h.update(path.encode('utf8'))
+        try:
+            with open(path, 'rb') as f:
+                h.update(f.read())
+        except IOError:
+            pass
+    return h.hexdigest()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Precomputed lookup of the decomposition rules that apply to a command.
+"""
+
+from __future__ import unicode_literals
+
+import weakref
+
+from projectq.ops import DaggeredGate, get_inverse
+
+from ._command_predicates import reads_only_shape
+
+
+class DecompositionIndex(object):
+    """
+    Finds the decompositions in a DecompositionRuleSet that apply to a
+    command, in the same order as a plain scan of the rule set.
+
+    The candidate decompositions of each gate class, including the inverse
+    decompositions of its inverse's rules, are gathered once. Recognizers
+    built from dirty_period_finding's command predicates only look at a
+    command's shape (its register sizes, number of controls and amount of
+    workspace), so their results are memoized per shape. Any other
+    recognizer, including a combination of predicates with an arbitrary
+    function, is called every time.
+
+    Rules added to the rule set after an index is created aren't seen by it.
+    """
+    _shared = weakref.WeakKeyDictionary()
+
+    def __init__(self, decomposition_rule_set):
+        """
+        Args:
+            decomposition_rule_set (projectq.cengines.DecompositionRuleSet):
+                The rules to index.
+        """
+        self.decomposition_rule_set = decomposition_rule_set
+        self._rule_count = _rule_count(decomposition_rule_set)
+        self._entries = {}
+        self._shape_checks = {}
+        self._forward = {}
+
+    @staticmethod
+    def for_rule_set(decomposition_rule_set):
+        """
+        Args:
+            decomposition_rule_set (projectq.cengines.DecompositionRuleSet):
+                The rules to index.
+
+        Returns:
+            DecompositionIndex: An index shared by every caller using the same
+                (unmodified) rule set.
+        """
+        shared = DecompositionIndex._shared
+        index = shared.get(decomposition_rule_set)
+        if (index is None or
+                index._rule_count != _rule_count(decomposition_rule_set)):
+            index = DecompositionIndex(decomposition_rule_set)
+            shared[decomposition_rule_set] = index
+        return index
+
+    def applicable(self, cmd, first_only=False):
+        """
+        Args:
+            cmd (projectq.ops.Command): The command to decompose.
+            first_only (bool): Stop after the first applicable decomposition.
+
+        Returns:
+            list[tuple[_Decomposition, function]]: The applicable
+                decompositions, each paired with the recognizer of the rule it
+                came from (the forward rule, for inverse decompositions).
+        """
+        class_key, entries = self._entries_for(cmd.gate)
+        result = []
+        shape = None
+        for i, (decomposition, recognizer, shape_only) in enumerate(entries):
+            if shape_only:
+                if shape is None:
+                    shape = _shape_of(cmd)
+                memo_key = (class_key, i, shape)
+                applies = self._shape_checks.get(memo_key)
+                if applies is None:
+                    applies = bool(decomposition.check(cmd))
+                    self._shape_checks[memo_key] = applies
+            else:
+                applies = decomposition.check(cmd)
+            if applies:
+                result.append((decomposition, recognizer))
+                if first_only:
+                    break
+        return result
+
+    def _entries_for(self, gate):
+        class_key = _gate_class_key(gate)
+        entries = self._entries.get(class_key)
+        if entries is None:
+            ds = self.decomposition_rule_set.decompositions
+            forward = ds.get(type(gate).__name__, [])
+            backward = ds.get(type(get_inverse(gate)).__name__, [])
+            entries = [(d, d.check, reads_only_shape(d.check))
+                       for d in forward]
+            for d in backward:
+                inverse = d.get_inverse_decomposition()
+                self._forward[id(inverse)] = d
+                entries.append((inverse, d.check, reads_only_shape(d.check)))
+            self._entries[class_key] = entries
+        return class_key, entries
+
+    def forward_of(self, decomposition):
+        """
+        Args:
+            decomposition (_Decomposition): A decomposition returned by
+                applicable.
+
+        Returns:
+            _Decomposition: The decomposition registered by the rule it came
+                from (itself, unless it's an inverse decomposition).
+        """
+        return self._forward.get(id(decomposition), decomposition)
+
+
+def _gate_class_key(gate):
+    # The inverse of a daggered gate is the wrapped gate, whose class varies.
+    if isinstance(gate, DaggeredGate):
+        return DaggeredGate, _gate_class_key(gate._gate)
+    return type(gate)
+
+
+def _shape_of(cmd):
+    touched = set(q.id for reg in cmd.all_qubits for q in reg)
+    active = set(q.id for q in cmd.engine.main_engine.active_qubits)
+    return (len(cmd.control_qubits),
+            tuple(len(reg) for reg in cmd.qubits),
+            len(active - touched))
+
+
+def _rule_count(decomposition_rule_set):
+    return sum(len(v) for v in decomposition_rule_set.decompositions.values())
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Records where an AutoReplacerEx spends its time while decomposing.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import sys
+from timeit import default_timer
+
+from projectq.cengines import DecompositionRule
+from projectq.ops import DaggeredGate
+
+
+def gate_label(gate):
+    """
+    Returns:
+        str: The name of the gate's class (of the wrapped gate's class, marked
+            as inverted, for daggered gates).
+    """
+    if isinstance(gate, DaggeredGate):
+        return gate_label(gate._gate) + '^-1'
+    return type(gate).__name__
+
+
+def rule_name(decomposer):
+    """
+    Args:
+        decomposer (function): A decomposition rule's gate_decomposer.
+
+    Returns:
+        str: The name of the module-level variable holding the rule, in the
+            module defining the decomposer, prefixed by the module's name
+            (e.g. 'addition_rules.decompose_addition_controlled'). Falls back
+            to the decomposer's own name (and line, for lambdas).
+    """
+    module_name = getattr(decomposer, '__module__', None) or '?'
+    module = sys.modules.get(module_name)
+    prefix = module_name.split('.')[-1]
+    for var_name, value in sorted(getattr(module, '__dict__', {}).items()):
+        if (isinstance(value, DecompositionRule) and
+                value.gate_decomposer is decomposer):
+            return '{}.{}'.format(prefix, var_name)
+
+    name = getattr(decomposer, '__name__', type(decomposer).__name__)
+    code = getattr(decomposer, '__code__', None)
+    if name == '<lambda>' and code is not None:
+        name += ':{}'.format(code.co_firstlineno)
+    return '{}.{}'.format(prefix, name)
+
+
+class _Stats(object):
+    def __init__(self):
+        self.expansions = 0
+        self.hits = 0
+        self.misses = 0
+        self.leaves = 0
+        self.inclusive_seconds = 0.0
+        self.exclusive_seconds = 0.0
+
+    def to_dict(self):
+        return {
+            'expansions': self.expansions,
+            'hits': self.hits,
+            'misses': self.misses,
+            'leaves': self.leaves,
+            'inclusive_seconds': self.inclusive_seconds,
+            'exclusive_seconds': self.exclusive_seconds,
+        }
+
+
+class _Frame(object):
+    def __init__(self, gate):
+        self.gate = gate
+        self.rule = None
+        self.inclusive_seconds = 0.0
+        self.exclusive_seconds = 0.0
+        self.child_seconds = 0.0
+        self.start = None
+
+    @property
+    def label(self):
+        if self.rule is None:
+            return self.gate
+        return '{} [{}]'.format(self.gate, self.rule)
+
+
+class DecompositionProfiler(object):
+    """
+    Collects, per decomposition rule and per gate class, how many commands
+    were expanded, how many cache lookups hit or missed, how many leaf
+    commands the expansions produced, and the wall time spent in them.
+
+    Pass one to an AutoReplacerEx (or SymbolicGateCounter, or through a
+    CompilationContext's replacer arguments) as its profiler. A profiler can
+    be shared by several engines, as long as they don't decompose at the
+    same time.
+
+    Inclusive time covers an expansion and everything nested in it, and
+    exclusive time leaves out the nested expansions. Time spent outside of
+    the expansion (e.g. by the engines receiving a streamed decomposition)
+    isn't counted. When a gate class (or rule) is nested inside itself, only
+    the outermost expansion adds to its inclusive time. Cache hits are
+    attributed to gate classes, since the rule isn't looked at.
+    """
+    def __init__(self):
+        self.by_gate = {}
+        self.by_rule = {}
+        self.folded = {}
+        self.max_depth = 0
+        self._stack = []
+        self._rule_names = {}
+
+    def record_lookup(self, cmd, leaves=None):
+        """
+        Args:
+            cmd (projectq.ops.Command): A command being decomposed.
+            leaves (None|int): The number of leaves in the cached
+                decomposition found for the command, or None on a miss.
+        """
+        stats = self._stats(self.by_gate, gate_label(cmd.gate))
+        if leaves is None:
+            stats.misses += 1
+        else:
+            stats.hits += 1
+            stats.leaves += leaves
+
+    def record_rule(self, decomposition, forward):
+        """
+        Attributes the running expansion to the rule that made it.
+
+        Args:
+            decomposition (projectq.cengines._replacer._Decomposition): The
+                chosen decomposition.
+            forward (projectq.cengines._replacer._Decomposition): The
+                decomposition registered by the rule (see
+                DecompositionIndex.forward_of). Differs from the chosen one
+                when the rule's inverse is being used.
+        """
+        if not self._stack:
+            return
+        func = forward.decompose
+        name = self._rule_names.get(func)
+        if name is None:
+            name = self._rule_names[func] = rule_name(func)
+        if decomposition is not forward:
+            name += '^-1'
+        self._stack[-1].rule = name
+
+    def start_expansion(self, cmd):
+        """
+        Returns:
+            object: A frame for the expansion of the given command, to pass to
+                resume, suspend and finish_expansion.
+        """
+        return _Frame(gate_label(cmd.gate))
+
+    def resume(self, frame):
+        """Starts timing a stretch of work on the frame's expansion."""
+        self._stack.append(frame)
+        self.max_depth = max(self.max_depth, len(self._stack))
+        frame.child_seconds = 0.0
+        frame.start = default_timer()
+
+    def suspend(self, frame):
+        """Stops timing the frame's expansion (until it's resumed)."""
+        elapsed = default_timer() - frame.start
+        exclusive = elapsed - frame.child_seconds
+        path = ';'.join(f.label for f in self._stack)
+        self.folded[path] = self.folded.get(path, 0.0) + exclusive
+        popped = self._stack.pop()
+        assert popped is frame
+        if self._stack:
+            self._stack[-1].child_seconds += elapsed
+        frame.inclusive_seconds += elapsed
+        frame.exclusive_seconds += exclusive
+
+    def finish_expansion(self, frame, leaves):
+        """
+        Adds a completed expansion to the statistics.
+
+        Args:
+            frame (object): The expansion's frame, from start_expansion.
+            leaves (int): How many leaf commands the expansion produced.
+        """
+        for table, key, attr in [(self.by_gate, frame.gate, 'gate'),
+                                 (self.by_rule, frame.rule, 'rule')]:
+            if key is None:
+                continue
+            stats = self._stats(table, key)
+            stats.expansions += 1
+            stats.leaves += leaves
+            stats.exclusive_seconds += frame.exclusive_seconds
+            if all(getattr(f, attr) != key for f in self._stack):
+                stats.inclusive_seconds += frame.inclusive_seconds
+
+    def profile_pieces(self, cmd, pieces):
+        """
+        Times an expansion that's produced lazily, piece by piece.
+
+        Args:
+            cmd (projectq.ops.Command): The command being expanded.
+            pieces (iterable[CompactCommandList]): The expansion.
+
+        Yields:
+            CompactCommandList: The same pieces.
+        """
+        frame = self.start_expansion(cmd)
+        iterator = iter(pieces)
+        leaves = 0
+        while True:
+            self.resume(frame)
+            try:
+                piece = next(iterator, None)
+            finally:
+                self.suspend(frame)
+            if piece is None:
+                break
+            leaves += len(piece)
+            yield piece
+        self.finish_expansion(frame, leaves)
+
+    @staticmethod
+    def _stats(table, key):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = _Stats()
+        return stats
+
+    def summary(self):
+        """
+        Returns:
+            dict: The statistics per gate class ('gates') and per rule
+                ('rules'), and the deepest nesting of expansions
+                ('max_depth'). Ready to be written as JSON.
+        """
+        return {
+            'gates': {k: v.to_dict() for k, v in self.by_gate.items()},
+            'rules': {k: v.to_dict() for k, v in self.by_rule.items()},
+            'max_depth': self.max_depth,
+        }
+
+    def folded_stacks(self):
+        """
+        Returns:
+            list[str]: One line per nesting path of expansions, in the
+                folded format read by flame graph tools: the path's frames
+                separated by semicolons, then the exclusive time spent on the
+                path in microseconds.
+        """
+        return ['{} {}'.format(path, int(round(seconds * 1e6)))
+                for path, seconds in sorted(self.folded.items())]
+
+    def write_folded_stacks(self, path):
+        """Writes the folded stacks (see folded_stacks) to a file."""
+        text = ''.join(line + '\n' for line in self.folded_stacks())
+        with open(path, 'wb') as f:
+            f.write(text.encode('utf8'))
+
+    def write_summary(self, path):
+        """Writes the summary (see summary) to a file, as JSON."""
+        text = json.dumps(self.summary(), indent=2, sort_keys=True)
+        with open(path, 'wb') as f:
+            f.write(text.encode('utf8'))
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Circuit depth, Toffoli depth and critical paths of decomposed circuits.
+"""
+
+from __future__ import unicode_literals
+
+import numpy as np
+from projectq.cengines import BasicEngine, LastEngineException
+from projectq.ops import Allocate, Deallocate, FlushGate, Measure
+
+from ._symbolic_gate_counter import GateHistogram, SymbolicGateCounter
+
+# Marks pairs of qubits with no path between them in a DepthSummary. Far
+# enough below zero that adding a real length to it stays negative.
+NO_PATH = -(1 << 40)
+
+
+def is_toffoli(cmd):
+    """
+    Returns:
+        bool: Whether the command counts towards the Toffoli depth, i.e. has
+            at least two controls (the same criterion as toffoli_cost).
+    """
+    return len(cmd.control_qubits) >= 2
+
+
+def _has_duration(cmd):
+    return not (cmd.gate in (Allocate, Deallocate) or
+                isinstance(cmd.gate, FlushGate))
+
+
+def _qubit_ids(cmd):
+    return [q.id for reg in cmd.all_qubits for q in reg]
+
+
+class _PathNode(object):
+    """A command on a critical path, linked to the command it waited on."""
+    __slots__ = ('cmd', 'previous')
+
+    def __init__(self, cmd, previous):
+        self.cmd = cmd
+        self.previous = previous
+
+
+class DepthCounter(BasicEngine):
+    """
+    A backend (or pass-through engine) that tracks when each qubit becomes
+    free, scheduling every received command as early as the qubits it acts
+    on allow.
+
+    Allocations and deallocations take no time. Every other command takes
+    one layer, and commands with at least two controls take one Toffoli
+    layer.
+
+    Attributes:
+        depth (int): The number of layers needed so far.
+        toffoli_depth (int): The number of Toffoli layers needed so far,
+            counting only the Toffolis along each path.
+    """
+    def __init__(self, record_critical_path=False):
+        """
+        Args:
+            record_critical_path (bool): Remember, for every command, which
+                earlier command it had to wait for, so that critical_path can
+                trace back a longest chain. Keeps the commands alive.
+        """
+        BasicEngine.__init__(self)
+        self.record_critical_path = record_critical_path
+        self.depth = 0
+        self.toffoli_depth = 0
+        self._ready = {}
+        self._toffoli_ready = {}
+        self._last = {}
+        self._deepest = None
+
+    def is_available(self, cmd):
+        try:
+            return BasicEngine.is_available(self, cmd)
+        except LastEngineException:
+            return True
+
+    def _add_cmd(self, cmd):
+        if cmd.gate == Measure and self.is_last_engine:
+            for qureg in cmd.qubits:
+                for qubit in qureg:
+                    self.main_engine.set_measurement_result(qubit, 0)
+        if not _has_duration(cmd):
+            return
+
+        ids = _qubit_ids(cmd)
+        start, waited_on = max((self._ready.get(q, 0), q) for q in ids)
+        end = start + 1
+        toffoli_end = (max(self._toffoli_ready.get(q, 0) for q in ids) +
+                       int(is_toffoli(cmd)))
+        for q in ids:
+            self._ready[q] = end
+            self._toffoli_ready[q] = toffoli_end
+        self.toffoli_depth = max(self.toffoli_depth, toffoli_end)
+
+        if self.record_critical_path:
+            node = _PathNode(cmd, self._last.get(waited_on))
+            for q in ids:
+                self._last[q] = node
+            if end > self.depth:
+                self._deepest = node
+        self.depth = max(self.depth, end)
+
+    def critical_path(self):
+        """
+        Returns:
+            list[projectq.ops.Command]: A longest chain of received commands,
+                each acting on a qubit used by the one before it, in order.
+                Its length is the depth. Empty unless record_critical_path is
+                set.
+        """
+        path = []
+        node = self._deepest
+        while node is not None:
+            path.append(node.cmd)
+            node = node.previous
+        return path[::-1]
+
+    def receive(self, command_list):
+        for cmd in command_list:
+            if not isinstance(cmd.gate, FlushGate):
+                self._add_cmd(cmd)
+        if not self.is_last_engine:
+            self.send(command_list)
+
+    def __str__(self):
+        return 'Depth : {}\nToffoli depth : {}'.format(self.depth,
+                                                        self.toffoli_depth)
+
+
+class DepthSummary(GateHistogram):
+    """
+    A GateHistogram that also knows how long the paths through the counted
+    commands are, so the depth of a circuit built out of summarized parts can
+    be computed exactly without looking at their leaves.
+
+    Entry [i, j] of each length matrix is the length of the longest chain of
+    commands leading from the input of touched qubit i to the output of
+    touched qubit j (NO_PATH when there's none, and at least 0 on the
+    diagonal). Scheduling a part then amounts to a max-plus product of the
+    ready times of its qubits with its matrix.
+    """
+    def __init__(self, counts, touched, lengths, toffoli_lengths):
+        """
+        Args:
+            counts (dict[tuple[str, int], int]): See GateHistogram.
+            touched (numpy.ndarray): See GateHistogram.
+            lengths (numpy.ndarray): The longest path lengths, counting every
+                command with a duration.
+            toffoli_lengths (numpy.ndarray): The longest path lengths,
+                counting only commands with at least two controls.
+        """
+        GateHistogram.__init__(self, counts, touched)
+        self.lengths = lengths
+        self.toffoli_lengths = toffoli_lengths
+
+    @staticmethod
+    def sequence(parts, leaves):
+        """
+        Args:
+            parts (list[projectq.ops.Command|DepthSummary]): Consecutive
+                available commands and summaries of decomposed commands.
+            leaves (list[projectq.ops.Command]): The commands among the
+                parts.
+
+        Returns:
+            DepthSummary: The summary of the whole sequence.
+        """
+        summaries = [p for p in parts if isinstance(p, DepthSummary)]
+        histogram = GateHistogram.combine(
+            summaries + [GateHistogram.from_commands(leaves)])
+        touched = histogram.touched
+        column = {int(q): i for i, q in enumerate(touched)}
+        lengths = _identity_lengths(len(touched))
+        toffoli_lengths = _identity_lengths(len(touched))
+        for part in parts:
+            if isinstance(part, DepthSummary):
+                if not len(part.touched):
+                    continue
+                cols = [column[int(q)] for q in part.touched]
+                _extend_by_matrix(lengths, cols, part.lengths)
+                _extend_by_matrix(toffoli_lengths,
+                                  cols,
+                                  part.toffoli_lengths)
+            elif _has_duration(part):
+                cols = [column[q] for q in _qubit_ids(part)]
+                _extend_by_layer(lengths, cols, 1)
+                _extend_by_layer(toffoli_lengths, cols, int(is_toffoli(part)))
+        return DepthSummary(histogram.counts,
+                            touched,
+                            lengths,
+                            toffoli_lengths)
+
+    @property
+    def depth(self):
+        """int: The number of layers needed by the counted commands."""
+        return int(self.lengths.max()) if len(self.touched) else 0
+
+    @property
+    def toffoli_depth(self):
+        """int: The number of Toffoli layers needed by the commands."""
+        return int(self.toffoli_lengths.max()) if len(self.touched) else 0
+
+    def remapped(self, id_lookup):
+        new_ids = id_lookup[self.touched]
+        order = np.argsort(new_ids)
+        grid = np.ix_(order, order)
+        return DepthSummary(self.counts,
+                            new_ids[order],
+                            self.lengths[grid],
+                            self.toffoli_lengths[grid])
+
+    @property
+    def nbytes(self):
+        return (GateHistogram.nbytes.fget(self) +
+                self.lengths.nbytes +
+                self.toffoli_lengths.nbytes)
+
+    def __len__(self):
+        return GateHistogram.__len__(self) + self.lengths.size
+
+    def __repr__(self):
+        return 'DepthSummary({} gates, width {}, depth {})'.format(
+            self.total(), self.width, self.depth)
+
+
+def _identity_lengths(n):
+    lengths = np.full((n, n), NO_PATH, np.int64)
+    np.fill_diagonal(lengths, 0)
+    return lengths
+
+
+def _extend_by_layer(lengths, cols, duration):
+    """Appends a command acting on the given columns' qubits."""
+    longest = lengths[:, cols].max(axis=1)
+    longest = np.where(longest < 0, NO_PATH, longest + duration)
+    lengths[:, cols] = longest[:, None]
+
+
+def _extend_by_matrix(lengths, cols, part_lengths):
+    """Appends a summarized part acting on the given columns' qubits."""
+    longest = (lengths[:, cols][:, :, None] +
+               part_lengths[None, :, :]).max(axis=1)
+    lengths[:, cols] = np.where(longest < 0, NO_PATH, longest)
+
+
+class SymbolicDepthCounter(SymbolicGateCounter):
+    """
+    A SymbolicGateCounter that also computes the exact depth and Toffoli
+    depth of the decomposed circuit, as DepthCounter would, from a
+    DepthSummary memoized per canonical command.
+
+    A summary holds two matrices over the qubits its command touches, so
+    summaries cost quadratic space in the command's width, and combining
+    them cubic time, but the work still grows with the number of distinct
+    subcommands instead of the number of leaves.
+
+    Attributes:
+        depth (int): The number of layers needed so far.
+        toffoli_depth (int): The number of Toffoli layers needed so far.
+    """
+    summary_kind = 'depth-summary'
+
+    def __init__(self, decomposition_rule_set, **kwargs):
+        """
+        Args:
+            decomposition_rule_set (projectq.cengines.DecompositionRuleSet):
+                The rules used to break down unavailable commands.
+            **kwargs: Passed on to SymbolicGateCounter.
+        """
+        SymbolicGateCounter.__init__(self, decomposition_rule_set, **kwargs)
+        self.depth = 0
+        self.toffoli_depth = 0
+        self._ready = {}
+        self._toffoli_ready = {}
+
+    def _count_canonical(self, canonical_cmd, used, avail,
+                         decomposition=None):
+        children, qubits = self._expand_canonical(canonical_cmd,
+                                                  used,
+                                                  avail,
+                                                  decomposition)
+        leaves = []
+        parts = []
+        for child in children:
+            if self.is_available(child):
+                leaves.append(child)
+                parts.append(child)
+            else:
+                parts.append(self.count_decomposition(child))
+        assert qubits is not None
+        return DepthSummary.sequence(parts, leaves)
+
+    def _summarize_commands(self, commands):
+        return DepthSummary.sequence(commands, commands)
+
+    def _schedule(self, summary):
+        ids = [int(q) for q in summary.touched]
+        for ready, lengths in [(self._ready, summary.lengths),
+                               (self._toffoli_ready,
+                                summary.toffoli_lengths)]:
+            starts = np.array([ready.get(q, 0) for q in ids], np.int64)
+            ends = (starts[:, None] + lengths).max(axis=0)
+            for q, end in zip(ids, ends):
+                ready[q] = int(end)
+        if ids:
+            self.depth = max(self.depth,
+                             max(self._ready[q] for q in ids))
+            self.toffoli_depth = max(self.toffoli_depth,
+                                     max(self._toffoli_ready[q] for q in ids))
+
+    def _add_decomposed_cmd(self, cmd):
+        summary = self.count_decomposition(cmd)
+        self._add_histogram(summary)
+        self._schedule(summary)
+
+    def _add_available_cmd(self, cmd):
+        SymbolicGateCounter._add_available_cmd(self, cmd)
+        self._schedule(self._summarize_commands([cmd]))
+
+    def __str__(self):
+        return (SymbolicGateCounter.__str__(self) +
+                '\nDepth : {}\nToffoli depth : {}'.format(
+                    self.depth, self.toffoli_depth))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Worker processes that decompose independent subcommands for AutoReplacerEx.
+"""
+
+from __future__ import unicode_literals
+
+import multiprocessing
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine
+from projectq.types import Qureg
+
+from ._command_ex import CommandEx
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class DecompositionPool(object):
+    """
+    A pool of processes that flatten canonical commands in parallel.
+
+    Each worker builds its own compilation pipeline once, by calling the given
+    factory, and keeps it (and its decomposition cache) for every command it
+    is sent. The pipeline's first engine must be an AutoReplacerEx, and the
+    engines after it decide which commands count as available, so they should
+    match the engines after the AutoReplacerEx using the pool. Workers use a
+    DummyEngine as their backend.
+
+    Commands that a worker fails to decompose, or whose decompositions can't
+    be pickled, are reported as missing and are left to the caller.
+    """
+    def __init__(self, engine_list_factory, processes=None):
+        """
+        Args:
+            engine_list_factory (function() : list[BasicEngine]): A module
+                level function (so that it can be sent to workers) that
+                creates an AutoReplacerEx followed by the engines it feeds.
+            processes (None|int): Number of workers. Defaults to the number
+                of CPUs.
+        """
+        self._pool = multiprocessing.Pool(processes,
+                                          initializer=_init_worker,
+                                          initargs=(engine_list_factory,))
+
+    def decompose_keys(self, keys):
+        """
+        Args:
+            keys (list[tuple]): Canonical command keys, as produced by
+                AutoReplacerEx._canonicalize.
+
+        Returns:
+            list[None|CompactCommandList]: The flattened decomposition of each
+                key's command, acting on canonical qubit ids, or None where a
+                worker failed.
+        """
+        results = self._pool.map(_decompose_in_worker, keys, chunksize=1)
+        return [None if r is None else pickle.loads(r) for r in results]
+
+    def close(self):
+        """Waits for the workers to finish and stops them."""
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """Stops the workers immediately."""
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.terminate()
+
+
+# Per-process state of a pool worker.
+_worker_engines = []
+
+
+def _init_worker(engine_list_factory):
+    _worker_engines[:] = engine_list_factory()
+
+
+def _decompose_in_worker(key):
+    gate, layout, num_available = key
+    num_used = len(set(i for reg in layout for i in reg))
+
+    # A fresh main engine allocates ids from zero, so the qubit ids of the
+    # command are already its canonical ids.
+    eng = MainEngine(backend=DummyEngine(), engine_list=list(_worker_engines))
+    qubits = eng.allocate_qureg(num_used + num_available)
+    cmd = CommandEx(engine=eng,
+                    gate=gate,
+                    qubits=tuple(Qureg(qubits[i] for i in reg)
+                                 for reg in layout[1:]),
+                    controls=[qubits[i] for i in layout[0]])
+
+    replacer = _worker_engines[0]
+    try:
+        result = replacer._recursive_decompose(cmd)
+        return pickle.dumps(result, protocol=2)
+    except Exception:
+        # The caller decomposes the command itself, which reproduces any
+        # genuine error with a useful traceback.
+        return None
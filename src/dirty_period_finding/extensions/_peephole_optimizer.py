@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Removes redundant gates from decomposed reversible circuits.
+"""
+
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from projectq.cengines import BasicEngine
+from projectq.ops import (
+    AllocateQubitGate,
+    DeallocateQubitGate,
+    FlushGate,
+    MeasureGate,
+    NotInvertible,
+    XGate,
+)
+
+from ._command_ex import CommandEx
+
+
+# Gates that aren't unitary operations, even though some report an inverse
+# (e.g. Allocate's inverse is Deallocate).
+_NON_UNITARY_GATES = (
+    AllocateQubitGate,
+    DeallocateQubitGate,
+    FlushGate,
+    MeasureGate,
+)
+
+
+class _Entry(object):
+    """A buffered command, with the qubit ids used to reason about it."""
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.is_not = isinstance(cmd.gate, XGate)
+        self.is_unitary = not isinstance(cmd.gate, _NON_UNITARY_GATES)
+        self.is_cnot = (self.is_not and
+                        len(cmd.control_qubits) == 1 and
+                        [len(reg) for reg in cmd.qubits] == [1])
+        self.controls = frozenset(q.id for q in cmd.control_qubits)
+        ids = tuple(tuple(q.id for q in reg) for reg in cmd.qubits)
+        self.targets = frozenset(q for reg in ids for q in reg)
+        self.wiring = (ids, self.controls)
+
+
+def commutes(a, b):
+    """
+    Determines if two commands can trade places, going only by how they use
+    their qubits.
+
+    Qubits used as controls by both commands are fine (controls are
+    diagonal), and so are targets shared by two (controlled) NOTs. Anything
+    else must be disjoint.
+
+    Args:
+        a (_Entry): A buffered command.
+        b (_Entry): Another buffered command.
+
+    Returns:
+        bool: True when the commands definitely commute.
+    """
+    if a.targets & (b.targets | b.controls) and not (a.is_not and b.is_not):
+        return False
+    if b.targets & a.controls or a.targets & b.controls:
+        return False
+    return True
+
+
+def _cancels(a, b):
+    """
+    Returns:
+        bool: True when command b undoes command a.
+    """
+    if a.wiring != b.wiring or a.cmd.tags != b.cmd.tags:
+        return False
+    if not a.is_unitary or not b.is_unitary:
+        return False
+    if a.is_not and b.is_not:
+        return True
+    try:
+        return a.cmd.gate.get_inverse() == b.cmd.gate
+    except NotInvertible:
+        return False
+
+
+class PeepholeOptimizer(BasicEngine):
+    """
+    Cancels and shrinks gates within a window of recently received commands.
+
+    The dirty-ancilla constructions toggle and untoggle the same qubits over
+    and over, and applying them back to back (e.g. the two pivot flips in a
+    modular addition) leaves pairs of gates that undo each other, separated
+    by gates that commute with them. ProjectQ's LocalOptimizer only cancels
+    gates that end up adjacent. This engine instead scans back past
+    commuting commands (see commutes) and applies these rewrites:
+
+    - 'cancel': A command followed by its inverse, on the same qubits with
+        the same controls, is removed (along with the inverse).
+    - 'negated_control': X(c), CNOT(c, t), X(c) becomes CNOT(c, t), X(t).
+    - 'cnot_conjugation': CNOT(a, b), CNOT(b, t), CNOT(a, b) becomes
+        CNOT(b, t), CNOT(a, t), and CNOT(a, b), CNOT(t, a), CNOT(a, b) becomes
+        CNOT(t, a), CNOT(t, b). That is, a CNOT moved through the control (or
+        the target) of another CNOT leaves a single CNOT behind.
+
+    Only these templates are applied because they never add Toffolis or
+    need negated controls. E.g. moving a CNOT through a Toffoli's control
+    trades two CNOTs for a second Toffoli, and merging two Toffolis whose
+    controls differ in one qubit needs that qubit as a negated control.
+
+    Allocations, deallocations and measurements are never cancelled or
+    rewritten, and only commute with commands on other qubits.
+
+    Gates produced by a rewrite are reprocessed, in case they cancel
+    something further back. The number of gates each rewrite removed is
+    counted in eliminated.
+    """
+    def __init__(self, window=32):
+        """
+        Args:
+            window (int): How many commands are held back, waiting for a
+                command that cancels them.
+        """
+        BasicEngine.__init__(self)
+        self.window = window
+        self.eliminated = Counter()
+        self._buffer = []
+
+    def is_available(self, cmd):
+        return self.next_engine.is_available(cmd)
+
+    def receive(self, command_list):
+        ready = []
+        for cmd in command_list:
+            if isinstance(cmd.gate, FlushGate):
+                ready.extend(self._take(len(self._buffer)))
+                ready.append(cmd)
+            else:
+                self._add(_Entry(cmd))
+                ready.extend(self._take(len(self._buffer) - self.window))
+        if ready:
+            self.send(ready)
+
+    def _take(self, count):
+        """
+        Returns:
+            list[projectq.ops.Command]: The given number of the oldest
+                buffered commands, removed from the buffer.
+        """
+        if count <= 0:
+            return []
+        taken = self._buffer[:count]
+        del self._buffer[:count]
+        return [e.cmd for e in taken]
+
+    def _add(self, entry):
+        for i in range(len(self._buffer) - 1, -1, -1):
+            other = self._buffer[i]
+            if _cancels(other, entry):
+                del self._buffer[i]
+                self.eliminated['cancel'] += 2
+                return
+            if not commutes(other, entry):
+                break
+
+        if self._try_negated_control(entry):
+            return
+        if self._try_cnot_conjugation(entry):
+            return
+        self._buffer.append(entry)
+
+    def _try_negated_control(self, entry):
+        """
+        Rewrites X(c), CNOT(c, t), X(c) into CNOT(c, t), X(t) when the given
+        entry is the last NOT.
+        """
+        if len(self._buffer) < 2 or not entry.is_not or entry.controls:
+            return False
+        first, middle = self._buffer[-2:]
+        if (not first.is_not or first.controls or
+                first.targets != entry.targets or
+                not middle.is_not or middle.controls != entry.targets or
+                first.cmd.tags != entry.cmd.tags):
+            return False
+
+        target = middle.cmd.qubits[0]
+        del self._buffer[-2]
+        self.eliminated['negated_control'] += 1
+        self._add(_Entry(CommandEx(engine=entry.cmd.engine,
+                                   gate=entry.cmd.gate,
+                                   qubits=(target,),
+                                   tags=entry.cmd.tags)))
+        return True
+
+    def _try_cnot_conjugation(self, entry):
+        """
+        Rewrites CNOT(a, b), CNOT(b, t), CNOT(a, b) into CNOT(b, t),
+        CNOT(a, t), and CNOT(a, b), CNOT(t, a), CNOT(a, b) into CNOT(t, a),
+        CNOT(t, b), when the given entry is the last CNOT(a, b).
+        """
+        if len(self._buffer) < 2 or not entry.is_cnot:
+            return False
+        first, middle = self._buffer[-2:]
+        if (not middle.is_cnot or
+                first.wiring != entry.wiring or
+                first.cmd.tags != entry.cmd.tags or
+                middle.cmd.tags != entry.cmd.tags):
+            return False
+
+        if middle.controls == entry.targets:
+            if middle.targets & entry.controls:
+                return False
+            controls = entry.cmd.control_qubits
+            target = middle.cmd.qubits[0]
+        elif middle.targets == entry.controls:
+            if middle.controls & entry.targets:
+                return False
+            controls = middle.cmd.control_qubits
+            target = entry.cmd.qubits[0]
+        else:
+            return False
+
+        del self._buffer[-2:]
+        self.eliminated['cnot_conjugation'] += 1
+        self._add(_Entry(middle.cmd))
+        self._add(_Entry(CommandEx(engine=entry.cmd.engine,
+                                   gate=entry.cmd.gate,
+                                   qubits=(target,),
+                                   controls=controls,
+                                   tags=entry.cmd.tags)))
+        return True
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Emulates semi-classical phase estimation without a dense state vector.
+"""
+
+from __future__ import unicode_literals
+
+from ._sparse_state_engine import SparseStateEngine
+
+
+class PeriodFindingEmulator(SparseStateEngine):
+    """
+    A backend for semi-classical phase estimation circuits, such as the
+    period finding circuit in factor.py, whose cost grows with the period
+    instead of exponentially with the number of qubits.
+
+    Every qubit has a definite classical value except for:
+
+    - the phase qubit: at most one qubit at a time, put into superposition by
+        uncontrolled single-qubit gates (e.g. H) and made classical again by
+        measuring it,
+    - the tracked registers: registers hit by math gates (or NOTs) that are
+        controlled by the phase qubit or act on other tracked registers.
+
+    Their joint state is a sparse map from the phase qubit's value and the
+    tracked registers' values to an amplitude. A controlled modular
+    multiplication applied to a work register holding 1 only ever reaches
+    powers of the base, so the map never holds more than two entries per
+    element of the base's orbit. When measuring the phase qubit leaves a
+    single entry, the tracked registers become classical again.
+
+    Allows allocation, deallocation (of classical qubits), measuring,
+    flushing, controlled NOTs and controlled BasicMathGates (e.g. the
+    Toffoli-level decomposition of the arithmetic), and uncontrolled
+    single-qubit gates with a matrix. Gates outside of the structure above
+    (e.g. a Hadamard on a second qubit while the phase qubit is superposed)
+    raise a ValueError.
+    """
+    def __init__(self, rnd_seed=None):
+        """
+        Args:
+            rnd_seed (None|int): Seeds the measurement outcomes.
+        """
+        SparseStateEngine.__init__(self, (0,), rnd_seed)
+        self._bits = {}
+        self._phase_qubit = None
+        self._tracked = []
+        self._tracked_position = {}
+
+    @staticmethod
+    def _single_qubit_matrix(cmd):
+        if cmd.control_qubits:
+            return None
+        return SparseStateEngine._single_qubit_matrix(cmd)
+
+    def _is_quantum(self, qubit_id):
+        return qubit_id not in self._bits
+
+    def _value_in(self, key, qubit_id):
+        if qubit_id in self._bits:
+            return self._bits[qubit_id]
+        if qubit_id == self._phase_qubit:
+            return key[0]
+        reg, bit = self._tracked_position[qubit_id]
+        return (key[reg + 1] >> bit) & 1
+
+    def _track(self, qubit_ids):
+        """
+        Moves a register of classical qubits into the superposed state.
+
+        Returns:
+            int: The index of the register among the tracked registers.
+        """
+        value = 0
+        for i, q in enumerate(qubit_ids):
+            value |= self._bits.pop(q) << i
+        index = len(self._tracked)
+        self._tracked.append(qubit_ids)
+        for i, q in enumerate(qubit_ids):
+            self._tracked_position[q] = (index, i)
+        self._amplitudes = {k + (value,): a
+                            for k, a in self._amplitudes.items()}
+        return index
+
+    def _register_index(self, qubit_ids):
+        """
+        Returns:
+            int: The index of the given register among the tracked registers,
+                after tracking it if it's entirely classical.
+        """
+        if all(q in self._bits for q in qubit_ids):
+            return self._track(qubit_ids)
+        for q in qubit_ids:
+            if q == self._phase_qubit:
+                raise ValueError("Arithmetic on the phase qubit.")
+        index = self._tracked_position[qubit_ids[0]][0]
+        if self._tracked[index] != qubit_ids:
+            raise ValueError("Register overlaps a tracked register without "
+                             "matching it.")
+        return index
+
+    def _release(self):
+        """Makes everything classical again, if the state allows it."""
+        if self._phase_qubit is not None or len(self._amplitudes) != 1:
+            return
+        (key, amplitude), = self._amplitudes.items()
+        for reg, value in zip(self._tracked, key[1:]):
+            for i, q in enumerate(reg):
+                self._bits[q] = (value >> i) & 1
+        self._tracked = []
+        self._tracked_position = {}
+        self._amplitudes = {(0,): amplitude}
+
+    def _measure(self, qubit):
+        qubit_id = qubit.id
+        if not self._is_quantum(qubit_id):
+            return self._bits[qubit_id]
+
+        result = self._collapse(lambda k: self._value_in(k, qubit_id))
+
+        if qubit_id == self._phase_qubit:
+            self._phase_qubit = None
+            self._bits[qubit_id] = result
+            self._set_amplitudes({(0,) + k[1:]: a
+                                  for k, a in self._amplitudes.items()})
+        self._release()
+        return result
+
+    def _apply_single_qubit_gate(self, cmd, matrix):
+        self._apply_matrix(cmd.qubits[0][0].id, matrix)
+
+    def _apply_matrix(self, qubit_id, matrix):
+        if not self._is_quantum(qubit_id):
+            bit = self._bits[qubit_id]
+            if matrix[1 - bit][bit] == 0:
+                # Stays classical; only contributes a global phase.
+                return
+            if matrix[bit][bit] == 0:
+                # Flips, up to a global phase.
+                self._bits[qubit_id] = 1 - bit
+                return
+            if self._phase_qubit is not None:
+                raise ValueError("Only one qubit can be in superposition.")
+            self._phase_qubit = qubit_id
+            del self._bits[qubit_id]
+            self._amplitudes = {(bit,) + k[1:]: a
+                                for k, a in self._amplitudes.items()}
+        elif qubit_id != self._phase_qubit:
+            raise ValueError("Single-qubit gate on a tracked register.")
+
+        result = {}
+        for k, a in self._amplitudes.items():
+            rest = k[1:]
+            for out in [0, 1]:
+                c = matrix[out][k[0]]
+                if c != 0:
+                    kk = (out,) + rest
+                    result[kk] = result.get(kk, 0) + c * a
+        self._set_amplitudes(result)
+
+    def _apply_permutation(self, cmd, registers, func):
+        """
+        Args:
+            cmd (projectq.ops.Command): The controlled command.
+            registers (list[tuple[int]]): Target qubit ids, per register.
+            func (function(list[int]) : list[int]): Maps register values to
+                new (unreduced) register values.
+        """
+        controls = [q.id for q in cmd.control_qubits]
+        masks = [(1 << len(reg)) - 1 for reg in registers]
+
+        quantum = any(self._is_quantum(q)
+                      for q in controls + [q for reg in registers
+                                           for q in reg])
+        if not quantum:
+            if all(self._bits[q] for q in controls):
+                values = [sum(self._bits[q] << i for i, q in enumerate(reg))
+                          for reg in registers]
+                for reg, v, m in zip(registers, func(values), masks):
+                    for i, q in enumerate(reg):
+                        self._bits[q] = ((v & m) >> i) & 1
+            return
+
+        indices = [self._register_index(reg) for reg in registers]
+        result = {}
+        for k, a in self._amplitudes.items():
+            if all(self._value_in(k, q) for q in controls):
+                kk = list(k)
+                outs = func([k[i + 1] for i in indices])
+                for i, v, m in zip(indices, outs, masks):
+                    kk[i + 1] = v & m
+                k = tuple(kk)
+            result[k] = result.get(k, 0) + a
+        self._set_amplitudes(result)
+
+    def _toggle_phase_qubit(self, cmd):
+        controls = [q.id for q in cmd.control_qubits]
+        result = {}
+        for k, a in self._amplitudes.items():
+            if all(self._value_in(k, q) for q in controls):
+                k = (1 - k[0],) + k[1:]
+            result[k] = result.get(k, 0) + a
+        self._set_amplitudes(result)
+
+    def _allocate(self, qubit):
+        self._bits[qubit.id] = 0
+
+    def _deallocate(self, qubit):
+        if self._is_quantum(qubit.id):
+            raise ValueError("Deallocated a qubit in superposition.")
+        del self._bits[qubit.id]
+
+    def _apply_not(self, cmd):
+        target = cmd.qubits[0][0].id
+        if not cmd.control_qubits and (target == self._phase_qubit or
+                                       not self._is_quantum(target)):
+            self._apply_matrix(target, [[0, 1], [1, 0]])
+        elif target == self._phase_qubit:
+            self._toggle_phase_qubit(cmd)
+        elif self._is_quantum(target):
+            reg, bit = self._tracked_position[target]
+            self._apply_permutation(cmd,
+                                    [self._tracked[reg]],
+                                    lambda x: [x[0] ^ (1 << bit)])
+        else:
+            self._apply_permutation(cmd, [(target,)], lambda x: [x[0] ^ 1])
+
+    def _apply_math(self, cmd):
+        func = cmd.gate.get_math_function(cmd.qubits)
+        self._apply_permutation(
+            cmd,
+            [tuple(q.id for q in reg) for reg in cmd.qubits],
+            func)
@@ -16,6 +16,8 @@
 
 from __future__ import unicode_literals
 
+import heapq
+
 import numpy as np
 
 from projectq.cengines import BasicEngine
@@ -26,11 +28,70 @@ from projectq.ops import (XGate,
                           Allocate,
                           Deallocate)
 
+from ._vectorized_math import evaluate_math_gate, register_dtype
+
 
 class PermutationSimulator(BasicEngine):
-    def __init__(self):
+    """
+    Tracks where a circuit of classical operations sends each of a set of
+    input basis states.
+
+    By default every allocated qubit is an input: each allocation doubles the
+    number of tracked states, so a circuit on n qubits tracks all 2**n basis
+    states.
+
+    Alternatively, the input registers can be declared up front. Only the
+    combinations of register values under the given limits are tracked, the
+    states are created once instead of being doubled per allocation, and
+    qubits allocated beyond the declared registers (e.g. ancillae) start off
+    as 0. The declared registers must be the first qubits allocated, in order.
+
+    States are stored as uint64 bit strings, switching to arrays of python
+    ints once more than 64 bits are in use.
+    """
+    def __init__(self, register_sizes=None, register_limits=None):
+        """
+        Args:
+            register_sizes (None|list[int]): The sizes of the input registers,
+                in allocation order. Defaults to treating every allocated
+                qubit as an input.
+            register_limits (None|list[int]): Exclusive upper bounds on the
+                input values of each declared register. Defaults to covering
+                all of each register's values.
+        """
         BasicEngine.__init__(self)
-        self._states = np.array([0], np.int32)
+        self._positions = {}
+        self._free_positions = []
+        self._num_positions = 0
+
+        if register_sizes is None:
+            if register_limits is not None:
+                raise ValueError("Limits need declared registers.")
+            self._declared_positions = None
+            self._states = np.array([0], np.uint64)
+            self._inputs = self._states.copy()
+            return
+
+        if register_limits is None:
+            register_limits = [1 << n for n in register_sizes]
+        if len(register_limits) != len(register_sizes):
+            raise ValueError("Need a limit per register.")
+        self._declared_positions = sum(register_sizes)
+        self._states = np.zeros(1, np.uint64)
+        if self._declared_positions > 64:
+            self._states = self._states.astype(object)
+        offset = 0
+        for n, limit in zip(register_sizes, register_limits):
+            values = np.arange(min(limit, 1 << n)).astype(self._states.dtype)
+            if self._states.dtype == object:
+                values = np.array([v << offset for v in values.tolist()],
+                                  object)
+            else:
+                values <<= np.uint64(offset)
+            self._states = (self._states[np.newaxis, :] |
+                            values[:, np.newaxis]).reshape(-1)
+            offset += n
+        self._inputs = self._states.copy()
 
     @staticmethod
     def starting_permutation(register_sizes):
@@ -41,19 +102,41 @@ class PermutationSimulator(BasicEngine):
         return sim.get_permutation(quregs)
 
     def get_permutation(self, quregs):
-        n = sum(len(reg) for reg in quregs)
-        if len(self._states) != 1 << n:
-            raise ValueError("Need all allocated qubits.")
+        """
+        Args:
+            quregs (list[Qureg]): Registers covering every input qubit.
 
-        result = np.zeros((1 << n, len(quregs)), np.int32)
+        Returns:
+            numpy.ndarray: The current value of each register (columns) for
+                each tracked state (rows).
+        """
+        return self._register_values(self._states, quregs)
+
+    def get_starting_permutation(self, quregs):
+        """
+        Args:
+            quregs (list[Qureg]): Registers covering every input qubit.
+
+        Returns:
+            numpy.ndarray: The input value of each register (columns) for each
+                tracked state (rows), in the same order as get_permutation.
+        """
+        return self._register_values(self._inputs, quregs)
+
+    def _register_values(self, states, quregs):
+        if self._declared_positions is None:
+            n = sum(len(reg) for reg in quregs)
+            if len(self._states) != 1 << n:
+                raise ValueError("Need all allocated qubits.")
+
+        dtype = object
+        if all(register_dtype(len(reg)) is np.int64 for reg in quregs):
+            dtype = np.int64
+        result = np.zeros((len(states), len(quregs)), dtype)
         for i in range(len(quregs)):
-            result[:, i] = self._get_partial_permutation(quregs[i])
+            result[:, i] = self._gather(states, quregs[i])
         return result
 
-    def _get_partial_permutation(self, qureg):
-        return np.array(self._internal_order_to_given_order(
-            self._states, qureg))
-
     def permutation_equals(self,
                            quregs,
                            permutation_func,
@@ -68,32 +151,88 @@ class PermutationSimulator(BasicEngine):
             bool:
         """
         assert not register_limits or len(quregs) == len(register_limits)
-        actual = self.get_permutation(quregs)
+        inputs = self.get_starting_permutation(quregs).tolist()
+        actual = self.get_permutation(quregs).tolist()
         ns = tuple(len(reg) for reg in quregs)
-        for i in range(len(self._states)):
-            xs = []
-            t = 0
-            for reg in quregs:
-                xs.append((i >> t) & ((1 << len(reg)) - 1))
-                t += len(reg)
+        masks = [(1 << n) - 1 for n in ns]
+        for xs, zs in zip(inputs, actual):
             if register_limits is not None:
                 if any(x >= m for x, m in zip(xs, register_limits)):
                     continue
             ys = permutation_func(ns, xs)
-            ys = tuple(i & ((1 << len(a)) - 1) for i, a in zip(ys, quregs))
-            if ys != tuple(actual[i]):
+            ys = [y & m for y, m in zip(ys, masks)]
+            if ys != zs:
                 return False
         return True
 
-    def _internal_order_to_given_order(self, v, little_endian_qubits):
-        return sum(
-            ((v >> little_endian_qubits[i].id) & 1) << i
-            for i in range(len(little_endian_qubits)))
+    def _shift(self, position):
+        """
+        Returns:
+            int|numpy.uint64: A shift amount usable with the states' dtype.
+        """
+        if self._states.dtype == object:
+            return position
+        return np.uint64(position)
+
+    def _bit(self, position):
+        """
+        Returns:
+            int|numpy.uint64: A value, of the states' dtype, with only the
+                given bit set.
+        """
+        return self._states.dtype.type(1 << position)
+
+    def _mask(self, qureg):
+        mask = self._states.dtype.type(0)
+        for q in qureg:
+            mask |= self._bit(self._positions[q.id])
+        return mask
+
+    def _gather(self, states, qureg):
+        """
+        Args:
+            states (numpy.ndarray): Basis states, in internal order.
+            qureg (projectq.types.Qureg): A register, in little-endian order.
+
+        Returns:
+            numpy.ndarray: The register's value in each of the states.
+        """
+        dtype = register_dtype(len(qureg))
+        result = np.zeros(len(states), dtype)
+        one = self._bit(0)
+        for i, q in enumerate(qureg):
+            bits = (states >> self._shift(self._positions[q.id])) & one
+            result |= bits.astype(dtype) << i
+        return result
 
-    def _given_order_to_internal_order(self, v, little_endian_qubits):
-        return sum(
-            ((v >> i) & 1) << little_endian_qubits[i].id
-            for i in range(len(little_endian_qubits)))
+    def _scatter(self, values, qureg):
+        """
+        Args:
+            values (numpy.ndarray): Register values.
+            qureg (projectq.types.Qureg): A register, in little-endian order.
+
+        Returns:
+            numpy.ndarray: The values' bits moved to the register's positions
+                in the internal order.
+        """
+        dtype = self._states.dtype
+        result = np.zeros(len(values), dtype)
+        for i, q in enumerate(qureg):
+            bits = ((values >> i) & 1).astype(dtype)
+            result |= bits << self._shift(self._positions[q.id])
+        return result
+
+    def _allocate_position(self, qubit_id):
+        if self._free_positions:
+            position = heapq.heappop(self._free_positions)
+        else:
+            position = self._num_positions
+            self._num_positions += 1
+            if position == 64:
+                self._states = self._states.astype(object)
+                self._inputs = self._inputs.astype(object)
+        self._positions[qubit_id] = position
+        return position
 
     def is_available(self, cmd):
         return (cmd.gate == Measure or
@@ -109,52 +248,57 @@ class PermutationSimulator(BasicEngine):
         if not self.is_last_engine:
             self.send(command_list)
 
-    def _apply_operation(self, controls, func):
-        c = self._given_order_to_internal_order(
-            (1 << len(controls)) - 1, controls)
-        for i in range(len(self._states)):
-            if self._states[i] & c == c:
-                self._states[i] = func(self._states[i])
+    def _matching_states(self, controls):
+        """
+        Returns:
+            numpy.ndarray: Indices of the states where all controls are on.
+        """
+        c = self._mask(controls)
+        return np.flatnonzero(self._states & c == c)
 
     def _handle(self, cmd):
-        if (cmd.gate == Measure or
-                isinstance(cmd.gate, FlushGate) or
-                cmd.gate == Deallocate):
+        if cmd.gate == Measure or isinstance(cmd.gate, FlushGate):
+            return
+
+        if cmd.gate == Deallocate:
+            # Undeclared qubits aren't inputs, so their positions can be
+            # reused. (Without declared registers, every qubit is an input.)
+            position = self._positions[cmd.qubits[0][0].id]
+            if (self._declared_positions is not None and
+                    position >= self._declared_positions):
+                del self._positions[cmd.qubits[0][0].id]
+                heapq.heappush(self._free_positions, position)
             return
 
         if cmd.gate == Allocate:
-            new_id = cmd.qubits[0][0].id
-            if not (0 <= new_id < 32):
-                raise ValueError("Too many allocations.")
-            n = len(self._states)
-            self._states = np.resize(self._states, 2 * n)
-            self._states[n:] += 1 << new_id
+            position = self._allocate_position(cmd.qubits[0][0].id)
+            bit = self._bit(position)
+            if self._declared_positions is None:
+                self._states = np.concatenate([self._states,
+                                               self._states | bit])
+                self._inputs = np.concatenate([self._inputs,
+                                               self._inputs | bit])
+            elif position >= self._declared_positions:
+                # Reused positions may hold garbage left by the last owner.
+                self._states &= ~bit
             return
 
         if isinstance(cmd.gate, XGate):
             assert len(cmd.qubits) == 1 and len(cmd.qubits[0]) == 1
-            target = cmd.qubits[0][0]
-            self._apply_operation(cmd.control_qubits,
-                                  lambda x: x ^ (1 << target.id))
+            target = self._positions[cmd.qubits[0][0].id]
+            hits = self._matching_states(cmd.control_qubits)
+            self._states[hits] ^= self._bit(target)
             return
 
         if isinstance(cmd.gate, BasicMathGate):
-            def reordered_op(v):
-                xs = [self._internal_order_to_given_order(v, reg)
-                      for reg in cmd.qubits]
-                ys = cmd.gate.get_math_function(cmd.qubits)(xs)
-                pys = [
-                    self._given_order_to_internal_order(
-                        y & ((1 << len(reg)) - 1),
-                        reg)
-                    for y, reg in zip(ys, cmd.qubits)
-                ]
-                pxs = [
-                    self._given_order_to_internal_order(x, reg)
-                    for x, reg in zip(xs, cmd.qubits)
-                ]
-                return v + sum(pys) - sum(pxs)
-            self._apply_operation(cmd.control_qubits, reordered_op)
+            hits = self._matching_states(cmd.control_qubits)
+            states = self._states[hits]
+            xs = [self._gather(states, reg) for reg in cmd.qubits]
+            ys = evaluate_math_gate(cmd.gate, cmd.qubits, xs)
+            states &= ~self._mask([q for reg in cmd.qubits for q in reg])
+            for y, reg in zip(ys, cmd.qubits):
+                states |= self._scatter(y, reg)
+            self._states[hits] = states
             return
 
         raise ValueError(
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Resource estimates broken down along the decomposition tree.
+"""
+
+from __future__ import unicode_literals
+
+from projectq.ops import Allocate, Deallocate, FlushGate
+
+from ._decomposition_profiler import gate_label
+from ._symbolic_gate_counter import GateHistogram, SymbolicGateCounter
+
+
+class NodeEstimate(object):
+    """
+    The resources used by all instances of one node of the decomposition
+    tree (i.e. by the gates reached through one chain of ancestor gates).
+
+    Attributes:
+        instances (int): How many commands the node stands for.
+        gate_counts (dict[str, int]): Leaf counts summed over the instances,
+            keyed like ResourceCounter's.
+        max_width (int): The most qubits touched by one instance.
+        max_depth (int): The largest estimated depth of one instance.
+    """
+    def __init__(self):
+        self.instances = 0
+        self.gate_counts = {}
+        self.max_width = 0
+        self.max_depth = 0
+
+    def add(self, instances, gate_counts, width, depth):
+        self.instances += instances
+        for name, n in gate_counts.items():
+            self.gate_counts[name] = self.gate_counts.get(name, 0) + n
+        self.max_width = max(self.max_width, width)
+        self.max_depth = max(self.max_depth, depth)
+
+    def total(self):
+        """
+        Returns:
+            int: The number of leaf gates, not counting allocations.
+        """
+        return sum(n for name, n in self.gate_counts.items()
+                   if name not in ('Allocate', 'Deallocate'))
+
+
+def _add_subtree(nodes, label, summary):
+    """
+    Attributes a decomposed command, and its descendants, to the nodes under
+    the given label.
+
+    Args:
+        nodes (dict[tuple[str], NodeEstimate]): The nodes to add to, keyed
+            by chain of ancestor gate labels.
+        label (str): The decomposed command's gate label.
+        summary (ResourceSummary): The decomposed command's summary.
+    """
+    _node(nodes, (label,)).add(1,
+                               summary.gate_counts(),
+                               summary.width,
+                               summary.depth)
+    for path, node in summary.nodes.items():
+        _node(nodes, (label,) + path).add(node.instances,
+                                          node.gate_counts,
+                                          node.max_width,
+                                          node.max_depth)
+
+
+def _node(nodes, path):
+    node = nodes.get(path)
+    if node is None:
+        node = nodes[path] = NodeEstimate()
+    return node
+
+
+class _DepthTracker(object):
+    """
+    Estimates the depth of a command sequence by stacking its parts as soon
+    as the qubits they touch are free.
+    """
+    def __init__(self):
+        self.depth = 0
+        self._frontier = {}
+
+    def add(self, qubit_ids, depth):
+        """
+        Args:
+            qubit_ids (iterable[int]): The qubits a part touches. The part
+                occupies all of them for its whole duration.
+            depth (int): The part's depth.
+        """
+        if not depth:
+            return
+        qubit_ids = [int(q) for q in qubit_ids]
+        end = max([self._frontier.get(q, 0) for q in qubit_ids] + [0]) + depth
+        for q in qubit_ids:
+            self._frontier[q] = end
+        self.depth = max(self.depth, end)
+
+    def add_command(self, cmd):
+        if cmd.gate in (Allocate, Deallocate) or isinstance(cmd.gate,
+                                                            FlushGate):
+            return
+        self.add([q.id for reg in cmd.all_qubits for q in reg], 1)
+
+
+class ResourceSummary(GateHistogram):
+    """
+    A GateHistogram that also knows the estimated depth of the counted
+    commands, and how the counts split across the decomposition tree below
+    them.
+    """
+    def __init__(self, counts, touched, depth, nodes):
+        """
+        Args:
+            counts (dict[tuple[str, int], int]): See GateHistogram.
+            touched (numpy.ndarray): See GateHistogram.
+            depth (int): The estimated depth (see ResourceEstimator).
+            nodes (dict[tuple[str], NodeEstimate]): The resources used by the
+                decomposed commands among the counted ones, and by their
+                descendants, keyed by chain of gate labels.
+        """
+        GateHistogram.__init__(self, counts, touched)
+        self.depth = depth
+        self.nodes = nodes
+
+    @staticmethod
+    def from_commands(commands):
+        """
+        Args:
+            commands (list[projectq.ops.Command]): Available commands.
+
+        Returns:
+            ResourceSummary:
+        """
+        histogram = GateHistogram.from_commands(commands)
+        tracker = _DepthTracker()
+        for cmd in commands:
+            tracker.add_command(cmd)
+        return ResourceSummary(histogram.counts,
+                               histogram.touched,
+                               tracker.depth,
+                               {})
+
+    def remapped(self, id_lookup):
+        histogram = GateHistogram.remapped(self, id_lookup)
+        return ResourceSummary(histogram.counts,
+                               histogram.touched,
+                               self.depth,
+                               self.nodes)
+
+    def __repr__(self):
+        return 'ResourceSummary({} gates, width {}, depth {})'.format(
+            self.total(), self.width, self.depth)
+
+
+class ResourceEstimator(SymbolicGateCounter):
+    """
+    A SymbolicGateCounter that also attributes the counts to the gates that
+    decomposed into them, all the way up the decomposition tree.
+
+    Every decomposed command is a node, identified by the labels of its gate
+    and of its ancestors' gates (e.g. ('ModularBimultiplicationGate',
+    'ModularScaledAdditionGate')). Each node gets the leaf counts summed over
+    its instances, along with the largest width and depth of an instance.
+
+    Everything is computed from the cached summaries of the subcommands, so
+    the work still grows with the number of distinct subcommands rather than
+    the number of leaves (though the summaries grow with the number of
+    distinct chains below them).
+
+    Depths are estimates: each decomposed child is treated as a block
+    occupying all of its qubits for its whole depth, which overestimates the
+    depth of the leaf circuit when consecutive blocks could overlap.
+
+    Attributes:
+        nodes (dict[tuple[str], NodeEstimate]): The decomposition tree of the
+            received commands.
+        depth (int): The estimated depth of the received commands.
+    """
+    summary_kind = 'resource-summary'
+
+    def __init__(self, decomposition_rule_set, **kwargs):
+        """
+        Args:
+            decomposition_rule_set (projectq.cengines.DecompositionRuleSet):
+                The rules used to break down unavailable commands.
+            **kwargs: Passed on to SymbolicGateCounter.
+        """
+        SymbolicGateCounter.__init__(self, decomposition_rule_set, **kwargs)
+        self.nodes = {}
+        self._tracker = _DepthTracker()
+
+    @property
+    def depth(self):
+        return self._tracker.depth
+
+    def _count_canonical(self, canonical_cmd, used, avail,
+                         decomposition=None):
+        children, qubits = self._expand_canonical(canonical_cmd,
+                                                  used,
+                                                  avail,
+                                                  decomposition)
+        tracker = _DepthTracker()
+        nodes = {}
+        leaves = []
+        parts = []
+        for child in children:
+            if self.is_available(child):
+                leaves.append(child)
+                tracker.add_command(child)
+            else:
+                summary = self.count_decomposition(child)
+                tracker.add(summary.touched, summary.depth)
+                _add_subtree(nodes, gate_label(child.gate), summary)
+                parts.append(summary)
+        assert qubits is not None
+        parts.append(GateHistogram.from_commands(leaves))
+        histogram = GateHistogram.combine(parts)
+        return ResourceSummary(histogram.counts,
+                               histogram.touched,
+                               tracker.depth,
+                               nodes)
+
+    def _summarize_commands(self, commands):
+        return ResourceSummary.from_commands(commands)
+
+    def _add_decomposed_cmd(self, cmd):
+        summary = self.count_decomposition(cmd)
+        self._add_histogram(summary)
+        self._tracker.add(summary.touched, summary.depth)
+        _add_subtree(self.nodes, gate_label(cmd.gate), summary)
+
+    def _add_available_cmd(self, cmd):
+        SymbolicGateCounter._add_available_cmd(self, cmd)
+        self._tracker.add_command(cmd)
+
+    def breakdown(self, gate_names=('CCX',)):
+        """
+        Args:
+            gate_names (list[str]): The gate counts to show, besides the
+                total.
+
+        Returns:
+            str: The decomposition tree, one node per line, with each node's
+                children indented below it.
+        """
+        lines = []
+        for path, node in sorted(self.nodes.items()):
+            counts = ''.join(', {}: {}'.format(name,
+                                               node.gate_counts.get(name, 0))
+                             for name in gate_names)
+            lines.append('{}{} x{}: gates: {}{}, width: {}, depth: {}'.format(
+                '  ' * (len(path) - 1),
+                path[-1],
+                node.instances,
+                node.total(),
+                counts,
+                node.max_width,
+                node.max_depth))
+        return '\n'.join(lines)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Applies runs of classical reversible gates to a simulator's state at once.
+"""
+
+from __future__ import unicode_literals
+
+import numpy as np
+from projectq.cengines import BasicEngine
+from projectq.ops import (
+    XGate,
+    BasicMathGate,
+    Allocate,
+)
+from projectq.types import WeakQubitRef
+
+from ._vectorized_math import evaluate_math_gate
+
+
+def _is_reversible(cmd):
+    return (isinstance(cmd.gate, XGate) or
+            isinstance(cmd.gate, BasicMathGate))
+
+
+class ReversibleGateFuser(BasicEngine):
+    """
+    Buffers runs of NOTs, controlled NOTs, Toffolis and math gates headed to
+    a projectq Simulator, and applies each run as one permutation of the
+    state vector.
+
+    The Simulator spends a full pass over its 2**n amplitudes on every gate,
+    and a Python call per amplitude on every math gate. Classical reversible
+    gates only move amplitudes between basis states, so a run of them can
+    instead be applied to the indices of the basis states that have an
+    amplitude: the fuser reads the state (with cheat), pushes those indices
+    through the whole run with vectorized numpy operations, and writes the
+    permuted state back (with set_wavefunction). Arithmetic circuits keep
+    the state sparse (the period finding circuit only puts one qubit at a
+    time into superposition), so the cost of a run is a couple of passes over
+    the state vector no matter how many gates it contains.
+
+    Runs that are too short to pay for reading and writing the state, or
+    that arrive while the state is too dense to gain anything from only
+    touching its nonzero entries, are forwarded unchanged. So is everything
+    when the next engine isn't a simulator that is the last engine.
+    """
+    def __init__(self, min_run_length=128, sparsity_threshold=16):
+        """
+        Args:
+            min_run_length (int): Runs with fewer gates than this are
+                forwarded to the simulator one gate at a time.
+            sparsity_threshold (int): Runs are only fused when the state
+                vector has at least this many entries per nonzero amplitude.
+        """
+        BasicEngine.__init__(self)
+        self.min_run_length = min_run_length
+        self.sparsity_threshold = sparsity_threshold
+        self.fused_runs = 0
+        self.fused_gates = 0
+        self._run = []
+
+    def is_available(self, cmd):
+        return self.next_engine.is_available(cmd)
+
+    def receive(self, command_list):
+        for cmd in command_list:
+            if _is_reversible(cmd):
+                self._run.append(cmd)
+            elif cmd.gate == Allocate:
+                # Buffered gates can't touch a qubit that doesn't exist yet.
+                self.send([cmd])
+            else:
+                self._flush_run()
+                self.send([cmd])
+
+    def _can_fuse(self):
+        simulator = self.next_engine
+        return (simulator.is_last_engine and
+                hasattr(simulator, 'cheat') and
+                hasattr(simulator, 'set_wavefunction'))
+
+    def _flush_run(self):
+        run = self._run
+        self._run = []
+        if not run:
+            return
+        if len(run) < self.min_run_length or not self._can_fuse():
+            self.send(run)
+            return
+
+        mapping, state = self.next_engine.cheat()
+        state = np.array(state, complex)
+        support = np.flatnonzero(state)
+        if len(support) * self.sparsity_threshold > len(state):
+            self.send(run)
+            return
+
+        states = support.astype(np.int64)
+        for cmd in run:
+            states = _permute(cmd, states, mapping)
+        permuted = np.zeros(len(state), complex)
+        permuted[states] = state[support]
+
+        order = sorted(mapping, key=mapping.get)
+        self.next_engine.set_wavefunction(
+            permuted.tolist(),
+            [WeakQubitRef(self.main_engine, q) for q in order])
+        self.fused_runs += 1
+        self.fused_gates += len(run)
+
+
+def _mask(qubits, mapping):
+    mask = 0
+    for q in qubits:
+        mask |= 1 << mapping[q.id]
+    return mask
+
+
+def _gather(states, qureg, mapping):
+    """
+    Args:
+        states (numpy.ndarray): Basis state indices.
+        qureg (projectq.types.Qureg): A register, in little-endian order.
+        mapping (dict[int, int]): Qubit ids to bit positions in the indices.
+
+    Returns:
+        numpy.ndarray: The register's value in each of the states.
+    """
+    result = np.zeros(len(states), np.int64)
+    for i, q in enumerate(qureg):
+        result |= ((states >> mapping[q.id]) & 1) << i
+    return result
+
+
+def _scatter(values, qureg, mapping):
+    """
+    Args:
+        values (numpy.ndarray): Register values.
+        qureg (projectq.types.Qureg): A register, in little-endian order.
+        mapping (dict[int, int]): Qubit ids to bit positions in the indices.
+
+    Returns:
+        numpy.ndarray: The values' bits moved to the register's positions.
+    """
+    result = np.zeros(len(values), np.int64)
+    for i, q in enumerate(qureg):
+        result |= ((values >> i) & 1) << mapping[q.id]
+    return result
+
+
+def _permute(cmd, states, mapping):
+    """
+    Args:
+        cmd (projectq.ops.Command): A controlled NOT or math gate.
+        states (numpy.ndarray): Basis state indices.
+        mapping (dict[int, int]): Qubit ids to bit positions in the indices.
+
+    Returns:
+        numpy.ndarray: Where the command sends each of the basis states.
+    """
+    controls = _mask(cmd.control_qubits, mapping)
+    active = states & controls == controls
+
+    if isinstance(cmd.gate, XGate):
+        target = _mask(cmd.qubits[0], mapping)
+        return np.where(active, states ^ target, states)
+
+    hit = states[active]
+    inputs = [_gather(hit, reg, mapping) for reg in cmd.qubits]
+    outputs = evaluate_math_gate(cmd.gate, cmd.qubits, inputs)
+    hit &= ~sum(_mask(reg, mapping) for reg in cmd.qubits)
+    for y, reg in zip(outputs, cmd.qubits):
+        hit |= _scatter(y, reg, mapping)
+    result = states.copy()
+    result[active] = hit
+    return result
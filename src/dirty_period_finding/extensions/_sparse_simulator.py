@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A quantum simulator that only stores the basis states with amplitude.
+"""
+
+from __future__ import unicode_literals
+
+import heapq
+
+import numpy as np
+
+from ._sparse_state_engine import NEGLIGIBLE, SparseStateEngine
+
+
+class SparseSimulator(SparseStateEngine):
+    """
+    A state vector simulator that stores only the nonzero amplitudes, in a
+    dict keyed by basis state index.
+
+    Arithmetic circuits are mostly NOTs, CNOTs, Toffolis and math gates, which
+    just relabel basis states, so the number of stored amplitudes grows with
+    the number of qubits put into superposition instead of with the number of
+    qubits allocated. Single-qubit gates split (and, through interference,
+    merge) entries.
+
+    Allows allocation, deallocation (of qubits in a classical state),
+    measuring, flushing, and any controlled single-qubit gate with a matrix
+    (including NOTs) or BasicMathGate. Like projectq's Simulator, cheat()
+    exposes the state, as a dense vector.
+
+    Bit positions of deallocated qubits are recycled.
+    """
+    def __init__(self, rnd_seed=None):
+        """
+        Args:
+            rnd_seed (None|int): Seeds the measurement outcomes.
+        """
+        SparseStateEngine.__init__(self, 0, rnd_seed)
+        self._bit_positions = {}
+        self._free_positions = []
+        self._num_positions = 0
+
+    def cheat(self):
+        """
+        Returns:
+            tuple[dict[int, int], list[complex]]: Maps each allocated qubit's
+                id to its bit in the state vector's indices, and the state
+                vector (which has an entry for each of the 2**n basis states
+                of the n allocated qubits).
+        """
+        live = sorted(self._bit_positions.items(), key=lambda e: e[1])
+        mapping = {q: i for i, (q, _) in enumerate(live)}
+        state = np.zeros(1 << len(live), complex)
+        for k, a in self._amplitudes.items():
+            index = 0
+            for i, (_, p) in enumerate(live):
+                index |= ((k >> p) & 1) << i
+            state[index] = a
+        return mapping, state.tolist()
+
+    def _bit(self, qubit):
+        return 1 << self._bit_positions[qubit.id]
+
+    def _controls_mask(self, cmd):
+        mask = 0
+        for q in cmd.control_qubits:
+            mask |= self._bit(q)
+        return mask
+
+    @staticmethod
+    def _bit_value(bit):
+        return lambda k: 1 if k & bit else 0
+
+    def _measure(self, qubit):
+        return self._collapse(self._bit_value(self._bit(qubit)))
+
+    def _apply_not(self, cmd):
+        controls = self._controls_mask(cmd)
+        target = self._bit(cmd.qubits[0][0])
+        self._amplitudes = {
+            (k ^ target if k & controls == controls else k): a
+            for k, a in self._amplitudes.items()}
+
+    def _apply_single_qubit_gate(self, cmd, matrix):
+        controls = self._controls_mask(cmd)
+        target = self._bit(cmd.qubits[0][0])
+        (m00, m01), (m10, m11) = matrix
+
+        if m01 == 0 and m10 == 0:
+            # Diagonal gates only rescale entries.
+            self._set_amplitudes({
+                k: (a * (m11 if k & target else m00)
+                    if k & controls == controls else a)
+                for k, a in self._amplitudes.items()})
+            return
+
+        result = {}
+        for k, a in self._amplitudes.items():
+            if k & controls != controls:
+                result[k] = result.get(k, 0) + a
+                continue
+            k0 = k & ~target
+            k1 = k | target
+            if k & target:
+                c0, c1 = m01, m11
+            else:
+                c0, c1 = m00, m10
+            if c0 != 0:
+                result[k0] = result.get(k0, 0) + c0 * a
+            if c1 != 0:
+                result[k1] = result.get(k1, 0) + c1 * a
+        self._set_amplitudes(result)
+
+    def _apply_math(self, cmd):
+        controls = self._controls_mask(cmd)
+        positions = [[self._bit_positions[q.id] for q in reg]
+                     for reg in cmd.qubits]
+        clear = ~sum(1 << p for reg in positions for p in reg)
+        func = cmd.gate.get_math_function(cmd.qubits)
+        masks = [(1 << len(reg)) - 1 for reg in positions]
+
+        memo = {}
+        result = {}
+        for k, a in self._amplitudes.items():
+            if k & controls == controls:
+                inputs = tuple(sum(((k >> p) & 1) << i
+                                   for i, p in enumerate(reg))
+                               for reg in positions)
+                outputs = memo.get(inputs)
+                if outputs is None:
+                    outputs = memo[inputs] = func(list(inputs))
+                k &= clear
+                for reg, v, m in zip(positions, outputs, masks):
+                    v &= m
+                    for i, p in enumerate(reg):
+                        k |= ((v >> i) & 1) << p
+            result[k] = result.get(k, 0) + a
+        self._amplitudes = result
+
+    def _allocate(self, qubit):
+        if self._free_positions:
+            position = heapq.heappop(self._free_positions)
+        else:
+            position = self._num_positions
+            self._num_positions += 1
+        self._bit_positions[qubit.id] = position
+
+    def _deallocate(self, qubit):
+        bit = self._bit(qubit)
+        weights = self._weights(self._bit_value(bit))
+        if weights[0] > NEGLIGIBLE and weights[1] > NEGLIGIBLE:
+            raise ValueError("Deallocated a qubit in superposition.")
+        if weights[1] > NEGLIGIBLE:
+            # Recycled positions must start off cleared.
+            self._amplitudes = {k & ~bit: a
+                                for k, a in self._amplitudes.items()}
+        heapq.heappush(self._free_positions,
+                       self._bit_positions.pop(qubit.id))
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Shared scaffolding for backends that store a sparse map of amplitudes.
+"""
+
+from __future__ import unicode_literals
+
+import random
+
+import numpy as np
+from projectq.cengines import BasicEngine
+from projectq.ops import (
+    Allocate,
+    BasicMathGate,
+    Deallocate,
+    FlushGate,
+    Measure,
+    XGate,
+)
+
+# Amplitudes smaller than this are treated as having cancelled out.
+NEGLIGIBLE = 1e-12
+
+
+class SparseStateEngine(BasicEngine):
+    """
+    Base class for backends whose state is a dict from keys (identifying
+    basis states) to nonzero amplitudes.
+
+    Handles availability, forwarding, measurement sampling and dispatching
+    each command to the hook for its kind: _allocate, _deallocate, _measure,
+    _apply_not, _apply_math and _apply_single_qubit_gate.
+    """
+    def __init__(self, initial_key, rnd_seed=None):
+        """
+        Args:
+            initial_key (hashable): The key of the initial basis state.
+            rnd_seed (None|int): Seeds the measurement outcomes.
+        """
+        BasicEngine.__init__(self)
+        self._rng = random.Random(rnd_seed)
+        self._amplitudes = {initial_key: 1}
+        self.max_state_count = 1
+
+    @property
+    def state_count(self):
+        """
+        int: The number of stored (non-negligible) amplitudes.
+        """
+        return len(self._amplitudes)
+
+    def is_available(self, cmd):
+        if (cmd.gate == Measure or
+                cmd.gate == Allocate or
+                cmd.gate == Deallocate or
+                isinstance(cmd.gate, BasicMathGate) or
+                isinstance(cmd.gate, FlushGate) or
+                isinstance(cmd.gate, XGate)):
+            return True
+        return self._single_qubit_matrix(cmd) is not None
+
+    def receive(self, command_list):
+        for cmd in command_list:
+            self._handle(cmd)
+        if not self.is_last_engine:
+            self.send(command_list)
+
+    @staticmethod
+    def _single_qubit_matrix(cmd):
+        """
+        Returns:
+            None|list[list[complex]]: The 2x2 matrix of the command's gate,
+                or None when it doesn't act on a single target qubit.
+        """
+        if len(cmd.qubits) != 1 or len(cmd.qubits[0]) != 1:
+            return None
+        try:
+            matrix = np.array(cmd.gate.matrix, complex)
+        except Exception:
+            return None
+        if matrix.shape != (2, 2):
+            return None
+        return matrix.tolist()
+
+    def _set_amplitudes(self, amplitudes):
+        self._amplitudes = {k: a
+                            for k, a in amplitudes.items()
+                            if abs(a) > NEGLIGIBLE}
+        self.max_state_count = max(self.max_state_count,
+                                   len(self._amplitudes))
+
+    def _weights(self, value_of):
+        """
+        Args:
+            value_of (function(key) : int): A qubit's value in a basis state.
+
+        Returns:
+            list[float]: The probabilities of the qubit being 0 and being 1.
+        """
+        weights = [0.0, 0.0]
+        for k, a in self._amplitudes.items():
+            weights[value_of(k)] += abs(a)**2
+        return weights
+
+    def _collapse(self, value_of):
+        """
+        Samples a qubit's value, then drops and renormalizes amplitudes.
+
+        Args:
+            value_of (function(key) : int): The qubit's value in a basis
+                state.
+
+        Returns:
+            int: The measured value.
+        """
+        weights = self._weights(value_of)
+        result = int(self._rng.random() * sum(weights) >= weights[0])
+        norm = weights[result]**0.5
+        self._set_amplitudes({k: a / norm
+                              for k, a in self._amplitudes.items()
+                              if value_of(k) == result})
+        return result
+
+    def _handle(self, cmd):
+        if isinstance(cmd.gate, FlushGate):
+            return
+
+        if cmd.gate == Measure:
+            for qr in cmd.qubits:
+                for q in qr:
+                    self.main_engine.set_measurement_result(q,
+                                                            self._measure(q))
+            return
+
+        if cmd.gate == Allocate:
+            self._allocate(cmd.qubits[0][0])
+            return
+
+        if cmd.gate == Deallocate:
+            self._deallocate(cmd.qubits[0][0])
+            return
+
+        if isinstance(cmd.gate, XGate):
+            assert len(cmd.qubits) == 1 and len(cmd.qubits[0]) == 1
+            self._apply_not(cmd)
+            return
+
+        if isinstance(cmd.gate, BasicMathGate):
+            self._apply_math(cmd)
+            return
+
+        matrix = self._single_qubit_matrix(cmd)
+        if matrix is not None:
+            self._apply_single_qubit_gate(cmd, matrix)
+            return
+
+        raise ValueError("Only support alloc/dealloc/measure/not/math ops "
+                         "and single-qubit gates.")
+
+    def _allocate(self, qubit):
+        raise NotImplementedError()
+
+    def _deallocate(self, qubit):
+        raise NotImplementedError()
+
+    def _measure(self, qubit):
+        raise NotImplementedError()
+
+    def _apply_not(self, cmd):
+        raise NotImplementedError()
+
+    def _apply_math(self, cmd):
+        raise NotImplementedError()
+
+    def _apply_single_qubit_gate(self, cmd, matrix):
+        raise NotImplementedError()
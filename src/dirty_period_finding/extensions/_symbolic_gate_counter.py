@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Gate counting that sums memoized per-decomposition histograms instead of
+producing the decomposed leaf commands.
+"""
+
+from __future__ import unicode_literals
+
+import sys
+
+import numpy as np
+from projectq.cengines._replacer import NoGateDecompositionError
+from projectq.ops import Allocate, Deallocate, FlushGate, Measure
+
+from ._cached_auto_replacer import AutoReplacerEx, _id_lookup
+
+
+class GateHistogram(object):
+    """
+    How many times each gate, with each number of controls, appears in a
+    sequence of commands, along with the qubits those commands touch.
+    """
+    def __init__(self, counts, touched):
+        """
+        Args:
+            counts (dict[tuple[str, int], int]): Maps (gate name, control
+                count) pairs to the number of occurrences.
+            touched (numpy.ndarray): Sorted ids of the qubits acted upon.
+        """
+        self.counts = counts
+        self.touched = touched
+
+    @staticmethod
+    def from_commands(commands):
+        """
+        Args:
+            commands (list[projectq.ops.Command]): The commands to count.
+
+        Returns:
+            GateHistogram:
+        """
+        counts = {}
+        touched = set()
+        for cmd in commands:
+            k = (str(cmd.gate), len(cmd.control_qubits))
+            counts[k] = counts.get(k, 0) + 1
+            for reg in cmd.all_qubits:
+                touched.update(q.id for q in reg)
+        return GateHistogram(counts, np.array(sorted(touched), np.int64))
+
+    @staticmethod
+    def combine(parts):
+        """
+        Args:
+            parts (list[GateHistogram]): Histograms of consecutive command
+                sequences, over the same qubit ids.
+
+        Returns:
+            GateHistogram: The histogram of the whole sequence.
+        """
+        if len(parts) == 1:
+            return parts[0]
+        counts = {}
+        for part in parts:
+            for k, n in part.counts.items():
+                counts[k] = counts.get(k, 0) + n
+        touched = np.unique(np.concatenate(
+            [np.zeros(0, np.int64)] + [part.touched for part in parts]))
+        return GateHistogram(counts, touched.astype(np.int64))
+
+    def remapped(self, id_lookup):
+        """
+        Args:
+            id_lookup (numpy.ndarray): Maps each current qubit id (used as an
+                index) to its new qubit id.
+
+        Returns:
+            GateHistogram: The same counts, over the new qubit ids.
+        """
+        return GateHistogram(self.counts, np.sort(id_lookup[self.touched]))
+
+    def gate_counts(self):
+        """
+        Returns:
+            dict[str, int]: Counts keyed by gate names prefixed with a 'C' per
+                control, the same way ResourceCounter names them.
+        """
+        result = {}
+        for (name, controls), n in self.counts.items():
+            k = controls * 'C' + name
+            result[k] = result.get(k, 0) + n
+        return result
+
+    def total(self):
+        """
+        Returns:
+            int: The number of counted commands.
+        """
+        return sum(self.counts.values())
+
+    @property
+    def width(self):
+        """
+        int: The number of distinct qubits acted upon.
+        """
+        return len(self.touched)
+
+    @property
+    def nbytes(self):
+        """
+        int: Approximate memory used.
+        """
+        return self.touched.nbytes + sys.getsizeof(self.counts)
+
+    def __len__(self):
+        # Caches weigh entries by length; a histogram's storage cost grows
+        # with its number of bins, not with the number of gates it counts.
+        return len(self.counts)
+
+    def __repr__(self):
+        return 'GateHistogram({} gates, width {})'.format(self.total(),
+                                                          self.width)
+
+
+class SymbolicGateCounter(AutoReplacerEx):
+    """
+    A replacement for an AutoReplacerEx followed by a ResourceCounter, for
+    when only the counts are needed.
+
+    Commands that the next engine can't handle are decomposed exactly as
+    AutoReplacerEx would decompose them, but the resulting leaf commands are
+    never materialized or sent onward. Instead each canonical command key
+    caches a GateHistogram, and the histogram of a command is the sum of the
+    histograms of its children. Repeated subcircuits are therefore counted
+    once, and the work done grows with the number of distinct subcommands
+    instead of the number of leaves.
+
+    Available commands are counted and forwarded as usual.
+
+    Attributes:
+        gate_counts (dict[str, int]): Counts keyed like ResourceCounter's.
+        max_width (int): Maximum number of simultaneously allocated qubits.
+    """
+    # Distinguishes this class's cached values from decomposition entries
+    # (and from the values of subclasses summarizing differently).
+    summary_kind = 'histogram'
+
+    def __init__(self, decomposition_rule_set, **kwargs):
+        """
+        Args:
+            decomposition_rule_set (projectq.cengines.DecompositionRuleSet):
+                The rules used to break down unavailable commands.
+            **kwargs: Passed on to AutoReplacerEx. A given cache stores
+                histograms, under keys distinct from decomposition entries.
+        """
+        AutoReplacerEx.__init__(self, decomposition_rule_set, **kwargs)
+        self.gate_counts = {}
+        self.max_width = 0
+        self._active_qubits = 0
+
+    def count_decomposition(self, cmd, all_workspace=False):
+        """
+        Args:
+            cmd (projectq.ops.Command): The command to count.
+            all_workspace (bool): Decompose using every spare qubit, even when
+                minimal_workspace_keys is set.
+
+        Returns:
+            GateHistogram: Counts of the available commands implementing the
+                given command, over the same qubits.
+        """
+        if self.is_available(cmd):
+            return self._summarize_commands([cmd])
+
+        canonical_cmd, id_map, key, used, avail = self._canonicalize(
+            cmd, all_workspace)
+        key = (self.summary_kind, key)
+        histogram = self.cache.get(key)
+        if self.profiler is not None:
+            self.profiler.record_lookup(
+                cmd, None if histogram is None else histogram.total())
+        if histogram is not None:
+            return histogram.remapped(_id_lookup(id_map))
+
+        # See AutoReplacerEx._decompose_pieces.
+        can_widen = self.minimal_workspace_keys and not all_workspace
+        if can_widen and (key in self._failed or key in self._in_progress):
+            return self.count_decomposition(cmd, all_workspace=True)
+
+        self._enter(key, cmd)
+        frame = None
+        if self.profiler is not None:
+            frame = self.profiler.start_expansion(cmd)
+            self.profiler.resume(frame)
+        try:
+            histogram = self._count_canonical(canonical_cmd, used, avail)
+        except NoGateDecompositionError:
+            self._remember_failure(key)
+            if not can_widen:
+                raise
+            return self.count_decomposition(cmd, all_workspace=True)
+        finally:
+            self._in_progress.discard(key)
+            if frame is not None:
+                self.profiler.suspend(frame)
+        if frame is not None:
+            self.profiler.finish_expansion(frame, histogram.total())
+        self._remember(key, histogram)
+
+        return histogram.remapped(_id_lookup(id_map))
+
+    def _count_canonical(self, canonical_cmd, used, avail,
+                         decomposition=None):
+        children, qubits = self._expand_canonical(canonical_cmd,
+                                                  used,
+                                                  avail,
+                                                  decomposition)
+        leaves = []
+        parts = []
+        for child in children:
+            if self.is_available(child):
+                leaves.append(child)
+            else:
+                parts.append(self.count_decomposition(child))
+        assert qubits is not None
+        parts.append(GateHistogram.from_commands(leaves))
+        return GateHistogram.combine(parts)
+
+    def _remember(self, key, histogram):
+        self.cache.put(key, histogram)
+
+    def _remember_failure(self, key):
+        self._failed.add(key)
+
+    def _summarize_commands(self, commands):
+        return GateHistogram.from_commands(commands)
+
+    def _add_histogram(self, histogram):
+        for name, n in histogram.gate_counts().items():
+            self.gate_counts[name] = self.gate_counts.get(name, 0) + n
+
+    def _add_decomposed_cmd(self, cmd):
+        self._add_histogram(self.count_decomposition(cmd))
+
+    def _add_available_cmd(self, cmd):
+        if cmd.gate == Allocate:
+            self._active_qubits += 1
+        elif cmd.gate == Deallocate:
+            self._active_qubits -= 1
+        elif cmd.gate == Measure:
+            for qureg in cmd.qubits:
+                for qubit in qureg:
+                    self.main_engine.set_measurement_result(qubit, 0)
+        self.max_width = max(self.max_width, self._active_qubits)
+        self._add_histogram(GateHistogram.from_commands([cmd]))
+
+    def receive(self, command_list):
+        for cmd in command_list:
+            if self.is_available(cmd):
+                if not isinstance(cmd.gate, FlushGate):
+                    self._add_available_cmd(cmd)
+                self.send([cmd])
+            else:
+                self._add_decomposed_cmd(cmd)
+
+    def __str__(self):
+        if not self.gate_counts:
+            return "(No quantum resources used)"
+        gate_list = ['{} : {}'.format(gate, num)
+                     for gate, num in self.gate_counts.items()]
+        return ("\n".join(sorted(gate_list)) +
+                "\n\nMax. width (number of qubits) : " +
+                str(self.max_width) + ".")
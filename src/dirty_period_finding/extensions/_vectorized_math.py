@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Applies math gates to whole arrays of register values, for the simulators.
+"""
+
+from __future__ import unicode_literals
+
+import numpy as np
+
+# Registers wider than this hold python ints instead of int64 values.
+MAX_INT64_BITS = 62
+
+
+def register_dtype(size):
+    """
+    Args:
+        size (int): A register's number of qubits.
+
+    Returns:
+        type: The numpy dtype used for arrays of the register's values.
+    """
+    return np.int64 if size <= MAX_INT64_BITS else object
+
+
+def exact_int_arrays(arrays, result_bits):
+    """
+    Converts arrays of integers to a dtype that can hold a computation's
+    intermediate results without overflowing.
+
+    Args:
+        arrays (list[numpy.ndarray]): Integer arrays.
+        result_bits (int): An upper bound on the bit length of the magnitude
+            of any intermediate result.
+
+    Returns:
+        list[numpy.ndarray]: The arrays as int64 arrays when the results fit,
+            otherwise as arrays of python ints.
+    """
+    arrays = [np.asarray(a) for a in arrays]
+    if (result_bits <= MAX_INT64_BITS and
+            all(a.dtype != object for a in arrays)):
+        return [a.astype(np.int64) for a in arrays]
+    return [a.astype(object) for a in arrays]
+
+
+def bit_length_bound(values):
+    """
+    Args:
+        values (numpy.ndarray): Integers.
+
+    Returns:
+        int: An upper bound on the bit length of the values' magnitudes.
+            Arrays of python ints are assumed to be too wide for int64.
+    """
+    values = np.asarray(values)
+    if values.dtype == object:
+        return MAX_INT64_BITS + 1
+    if values.size == 0:
+        return 0
+    return int(np.abs(values.astype(np.int64)).max()).bit_length()
+
+
+def _int_array(values):
+    """
+    Args:
+        values (list[int]): Python ints.
+
+    Returns:
+        numpy.ndarray: The values, as int64 if they all fit, else as objects.
+    """
+    result = np.array(values)
+    if result.dtype != np.int64:
+        result = np.array(values, object)
+    return result
+
+
+def vectorize_scalar_function(func, inputs):
+    """
+    Applies a scalar math function to arrays of inputs, calling it once per
+    distinct input.
+
+    Args:
+        func (function(list[int]) : tuple[int]): A math function, as returned
+            by BasicMathGate.get_math_function.
+        inputs (list[numpy.ndarray]): Equal-length arrays with each
+            register's values.
+
+    Returns:
+        list[numpy.ndarray]: Each register's resulting values (unreduced).
+    """
+    inputs = [np.asarray(x) for x in inputs]
+    count = len(inputs[0])
+    if count == 0:
+        return [np.zeros(0, np.int64) for _ in inputs]
+
+    if all(x.dtype != object for x in inputs):
+        stacked = np.stack([x.astype(np.int64) for x in inputs], axis=1)
+        distinct, inverse = np.unique(stacked, axis=0, return_inverse=True)
+        results = [tuple(func(xs)) for xs in distinct.tolist()]
+        return [_int_array(column)[inverse] for column in zip(*results)]
+
+    memo = {}
+    results = []
+    for xs in zip(*[x.tolist() for x in inputs]):
+        ys = memo.get(xs)
+        if ys is None:
+            ys = memo[xs] = tuple(func(list(xs)))
+        results.append(ys)
+    return [_int_array(column) for column in zip(*results)]
+
+
+def evaluate_math_gate(gate, qubits, inputs):
+    """
+    Applies a math gate's function to many register assignments at once.
+
+    Gates with a get_vectorized_math_function method (taking the qubits, like
+    get_math_function, and returning a function from a list of input arrays
+    to a list of output arrays) are handed all of the inputs at once.
+    Otherwise the gate's scalar math function is called once per distinct
+    assignment.
+
+    Args:
+        gate (projectq.ops.BasicMathGate): The gate to apply.
+        qubits (tuple[projectq.types.Qureg]): The registers the gate acts on.
+        inputs (list[numpy.ndarray]): Equal-length arrays with each
+            register's values.
+
+    Returns:
+        list[numpy.ndarray]: Each register's resulting values, reduced modulo
+            two to the register's size.
+    """
+    get_vectorized = getattr(gate, 'get_vectorized_math_function', None)
+    if get_vectorized is not None:
+        outputs = get_vectorized(qubits)(inputs)
+    else:
+        outputs = vectorize_scalar_function(gate.get_math_function(qubits),
+                                            inputs)
+
+    results = []
+    for y, reg in zip(outputs, qubits):
+        dtype = register_dtype(len(reg))
+        y = np.asarray(y)
+        if dtype is object or y.dtype == object:
+            y = y.astype(object)
+        else:
+            y = y.astype(np.int64)
+        results.append((y & ((1 << len(reg)) - 1)).astype(dtype))
+    return results
@@ -23,6 +23,9 @@ class AdditionGate(BasicMathGateEx):
     def do_operation(self, x, y):
         return x, y + x
 
+    def do_vectorized_operation(self, x, y):
+        return x, y + x
+
     def get_inverse(self):
         return SubtractionGate()
 
@@ -46,6 +49,9 @@ class SubtractionGate(BasicMathGateEx):
     def do_operation(self, x, y):
         return x, y - x
 
+    def do_vectorized_operation(self, x, y):
+        return x, y - x
+
     def get_inverse(self):
         return AdditionGate()
 
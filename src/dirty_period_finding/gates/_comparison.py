@@ -16,9 +16,13 @@
 
 from __future__ import unicode_literals
 
+import numpy as np
+
 from dirty_period_finding.extensions import (
     BasicSizedMathGateEx,
     SelfInverseGateEx,
+    bit_length_bound,
+    exact_int_arrays,
 )
 
 
@@ -57,6 +61,11 @@ class XorOffsetCarrySignalsGate(BasicSizedMathGateEx, SelfInverseGateEx):
 
         return args[0], args[1] ^ _carry_signals(args[0], self.offset)
 
+    def do_vectorized_operation(self, sizes, args):
+        bits = max(bit_length_bound(args[0]), self.offset.bit_length()) + 1
+        x, t = exact_int_arrays(args, bits)
+        return x, t ^ _carry_signals(x, self.offset)
+
     def __eq__(self, other):
         return (isinstance(other, XorOffsetCarrySignalsGate) and
                 self.offset == other.offset)
@@ -102,6 +111,13 @@ class PredictOffsetOverflowGate(BasicSizedMathGateEx, SelfInverseGateEx):
         b = (v + self.offset) & m
         return v, args[1] ^ (1 if b else 0)
 
+    def do_vectorized_operation(self, sizes, args):
+        bits = max(bit_length_bound(args[0]), self.offset.bit_length()) + 1
+        v, t = exact_int_arrays(args, max(bits, sizes[0]))
+        m = ~0 << sizes[0]
+        b = (v + self.offset) & m
+        return v, np.where(b != 0, t ^ 1, t)
+
     def __eq__(self, other):
         return (isinstance(other, PredictOffsetOverflowGate) and
                 self.offset == other.offset)
@@ -141,6 +157,11 @@ class LessThanConstantGate(BasicSizedMathGateEx, SelfInverseGateEx):
         assert sizes[1] == 1
         return args[0], args[1] ^ (1 if args[0] < self.comparand else 0)
 
+    def do_vectorized_operation(self, sizes, args):
+        bits = max(bit_length_bound(args[0]), self.comparand.bit_length()) + 1
+        x, t = exact_int_arrays(args, bits)
+        return x, np.where(x < self.comparand, t ^ 1, t)
+
     def __eq__(self, other):
         return (isinstance(other, LessThanConstantGate) and
                 self.comparand == other.comparand)
@@ -23,6 +23,9 @@ class IncrementGate(BasicMathGateEx):
     def do_operation(self, x):
         return x + 1,
 
+    def do_vectorized_operation(self, x):
+        return x + 1,
+
     def get_inverse(self):
         return DecrementGate()
 
@@ -46,6 +49,9 @@ class DecrementGate(BasicMathGateEx):
     def do_operation(self, x):
         return x - 1,
 
+    def do_vectorized_operation(self, x):
+        return x - 1,
+
     def get_inverse(self):
         return IncrementGate()
 
@@ -16,7 +16,13 @@
 
 from __future__ import unicode_literals
 
-from dirty_period_finding.extensions import BasicMathGateEx
+import numpy as np
+
+from dirty_period_finding.extensions import (
+    BasicMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
+)
 
 
 class ModularAdditionGate(BasicMathGateEx):
@@ -29,6 +35,14 @@ class ModularAdditionGate(BasicMathGateEx):
             return x, y
         return x, (y + x) % self.modulus
 
+    def do_vectorized_operation(self, x, y):
+        bits = max(bit_length_bound(x),
+                   bit_length_bound(y),
+                   self.modulus.bit_length()) + 1
+        x, y = exact_int_arrays([x, y], bits)
+        valid = (x < self.modulus) & (y < self.modulus)
+        return x, np.where(valid, (y + x) % self.modulus, y)
+
     def get_inverse(self):
         return ModularSubtractionGate(self.modulus)
 
@@ -59,6 +73,14 @@ class ModularSubtractionGate(BasicMathGateEx):
             return x, y
         return x, (y - x) % self.modulus
 
+    def do_vectorized_operation(self, x, y):
+        bits = max(bit_length_bound(x),
+                   bit_length_bound(y),
+                   self.modulus.bit_length()) + 1
+        x, y = exact_int_arrays([x, y], bits)
+        valid = (x < self.modulus) & (y < self.modulus)
+        return x, np.where(valid, (y - x) % self.modulus, y)
+
     def get_inverse(self):
         return ModularAdditionGate(self.modulus)
 
@@ -90,6 +112,13 @@ class ModularOffsetGate(BasicMathGateEx):
             return x,
         return (x + self.offset) % self.modulus,
 
+    def do_vectorized_operation(self, x):
+        bits = max(bit_length_bound(x),
+                   self.offset.bit_length(),
+                   self.modulus.bit_length()) + 1
+        x, = exact_int_arrays([x], bits)
+        return np.where(x < self.modulus, (x + self.offset) % self.modulus, x),
+
     def get_inverse(self):
         return ModularOffsetGate(-self.offset, self.modulus)
 
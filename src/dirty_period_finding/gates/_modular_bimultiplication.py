@@ -16,10 +16,13 @@
 
 from __future__ import unicode_literals
 
+import numpy as np
 from projectq.ops import NotMergeable
 
 from dirty_period_finding.extensions import (
     BasicMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
     multiplicative_inverse,
 )
 
@@ -41,6 +44,15 @@ class ModularBimultiplicationGate(BasicMathGateEx):
         return ((x * self.factor) % self.modulus,
                 (y * self.inverse_factor) % self.modulus)
 
+    def do_vectorized_operation(self, x, y):
+        bits = max(bit_length_bound(x) + self.factor.bit_length(),
+                   bit_length_bound(y) + self.inverse_factor.bit_length(),
+                   self.modulus.bit_length()) + 1
+        x, y = exact_int_arrays([x, y], bits)
+        valid = (x < self.modulus) & (y < self.modulus)
+        return (np.where(valid, (x * self.factor) % self.modulus, x),
+                np.where(valid, (y * self.inverse_factor) % self.modulus, y))
+
     def get_inverse(self):
         return ModularBimultiplicationGate(
             self.inverse_factor,
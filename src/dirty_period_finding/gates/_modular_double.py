@@ -16,8 +16,12 @@
 
 from __future__ import unicode_literals
 
+import numpy as np
+
 from dirty_period_finding.extensions import (
     BasicMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
     multiplicative_inverse,
 )
 
@@ -35,6 +39,11 @@ class ModularDoubleGate(BasicMathGateEx):
             return x,
         return x * 2 % self.modulus,
 
+    def do_vectorized_operation(self, x):
+        bits = max(bit_length_bound(x) + 1, self.modulus.bit_length()) + 1
+        x, = exact_int_arrays([x], bits)
+        return np.where(x < self.modulus, x * 2 % self.modulus, x),
+
     def get_inverse(self):
         return ModularUndoubleGate(self.modulus)
 
@@ -64,6 +73,13 @@ class ModularUndoubleGate(BasicMathGateEx):
             return x,
         return x * multiplicative_inverse(2, self.modulus) % self.modulus,
 
+    def do_vectorized_operation(self, x):
+        half = multiplicative_inverse(2, self.modulus)
+        bits = max(bit_length_bound(x) + half.bit_length(),
+                   self.modulus.bit_length()) + 1
+        x, = exact_int_arrays([x], bits)
+        return np.where(x < self.modulus, x * half % self.modulus, x),
+
     def get_inverse(self):
         return ModularDoubleGate(self.modulus)
 
@@ -16,7 +16,14 @@
 
 from __future__ import unicode_literals
 
-from dirty_period_finding.extensions import BasicMathGateEx, SelfInverseGateEx
+import numpy as np
+
+from dirty_period_finding.extensions import (
+    BasicMathGateEx,
+    SelfInverseGateEx,
+    bit_length_bound,
+    exact_int_arrays,
+)
 
 
 class ModularNegate(BasicMathGateEx, SelfInverseGateEx):
@@ -30,9 +37,13 @@ class ModularNegate(BasicMathGateEx, SelfInverseGateEx):
             return x,
         return -x % self.modulus,
 
+    def do_vectorized_operation(self, x):
+        bits = max(bit_length_bound(x), self.modulus.bit_length()) + 1
+        x, = exact_int_arrays([x], bits)
+        return np.where(x < self.modulus, -x % self.modulus, x),
+
     def __repr__(self):
-        return 'ModularNegate(modulus={})'.format(
-            self.factor, self.modulus)
+        return 'ModularNegate(modulus={})'.format(self.modulus)
 
     def __str__(self):
         return '×-1 % {}'.format(self.modulus)
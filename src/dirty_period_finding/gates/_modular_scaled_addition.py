@@ -16,9 +16,14 @@
 
 from __future__ import unicode_literals
 
+import numpy as np
 from projectq.ops import NotMergeable
 
-from dirty_period_finding.extensions import BasicMathGateEx
+from dirty_period_finding.extensions import (
+    BasicMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
+)
 
 
 class ModularScaledAdditionGate(BasicMathGateEx):
@@ -36,6 +41,14 @@ class ModularScaledAdditionGate(BasicMathGateEx):
             return x, y
         return x, (y + x * self.factor) % self.modulus
 
+    def do_vectorized_operation(self, x, y):
+        bits = max(bit_length_bound(x) + self.factor.bit_length(),
+                   bit_length_bound(y),
+                   self.modulus.bit_length()) + 1
+        x, y = exact_int_arrays([x, y], bits)
+        valid = (x < self.modulus) & (y < self.modulus)
+        return x, np.where(valid, (y + x * self.factor) % self.modulus, y)
+
     def get_inverse(self):
         return ModularScaledAdditionGate(
             -self.factor % self.modulus,
@@ -24,6 +24,9 @@ class MultiNotGate(BasicMathGateEx, SelfInverseGate):
     def do_operation(self, x):
         return ~x,
 
+    def do_vectorized_operation(self, x):
+        return ~x,
+
     def __repr__(self):
         return "MultiNot"
 
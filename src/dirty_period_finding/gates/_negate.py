@@ -21,6 +21,8 @@ from projectq.ops import NotMergeable
 from dirty_period_finding.extensions import (
     SelfInverseGateEx,
     BasicSizedMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
 )
 
 
@@ -29,6 +31,11 @@ class NegateGate(SelfInverseGateEx, BasicSizedMathGateEx):
         mask = ~(~0 << sizes[0])
         return -args[0] & mask,
 
+    def do_vectorized_operation(self, sizes, args):
+        mask = ~(~0 << sizes[0])
+        x, = exact_int_arrays(args, max(sizes[0], bit_length_bound(args[0])))
+        return -x & mask,
+
     def get_merged(self, other):
         raise NotMergeable()
 
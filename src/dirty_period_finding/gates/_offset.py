@@ -18,7 +18,11 @@ from __future__ import unicode_literals
 
 from projectq.ops import NotMergeable
 
-from dirty_period_finding.extensions import BasicMathGateEx
+from dirty_period_finding.extensions import (
+    BasicMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
+)
 
 
 class OffsetGate(BasicMathGateEx):
@@ -29,6 +33,11 @@ class OffsetGate(BasicMathGateEx):
     def do_operation(self, x):
         return x + self.offset,
 
+    def do_vectorized_operation(self, x):
+        bits = max(bit_length_bound(x), self.offset.bit_length()) + 1
+        x, = exact_int_arrays([x], bits)
+        return x + self.offset,
+
     def get_inverse(self):
         return OffsetGate(-self.offset)
 
@@ -16,7 +16,14 @@
 
 from __future__ import unicode_literals
 
-from dirty_period_finding.extensions import BasicMathGateEx, SelfInverseGateEx
+import numpy as np
+
+from dirty_period_finding.extensions import (
+    BasicMathGateEx,
+    SelfInverseGateEx,
+    bit_length_bound,
+    exact_int_arrays,
+)
 
 
 class PivotFlipGate(BasicMathGateEx, SelfInverseGateEx):
@@ -29,6 +36,11 @@ class PivotFlipGate(BasicMathGateEx, SelfInverseGateEx):
             return pivot, x
         return pivot, pivot - x - 1
 
+    def do_vectorized_operation(self, pivot, x):
+        bits = max(bit_length_bound(pivot), bit_length_bound(x)) + 1
+        pivot, x = exact_int_arrays([pivot, x], bits)
+        return pivot, np.where(x >= pivot, x, pivot - x - 1)
+
     def __eq__(self, other):
         return isinstance(other, PivotFlipGate)
 
@@ -56,6 +68,11 @@ class ConstPivotFlipGate(BasicMathGateEx, SelfInverseGateEx):
             return x,
         return self.pivot - x - 1,
 
+    def do_vectorized_operation(self, x):
+        bits = max(bit_length_bound(x), self.pivot.bit_length()) + 1
+        x, = exact_int_arrays([x], bits)
+        return np.where(x >= self.pivot, x, self.pivot - x - 1),
+
     def __eq__(self, other):
         return (isinstance(other, ConstPivotFlipGate) and
                 self.pivot == other.pivot)
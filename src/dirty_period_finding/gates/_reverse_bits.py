@@ -19,6 +19,8 @@ from __future__ import unicode_literals
 from dirty_period_finding.extensions import (
     SelfInverseGateEx,
     BasicSizedMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
 )
 
 
@@ -30,6 +32,14 @@ class ReverseBitsGate(BasicSizedMathGateEx, SelfInverseGateEx):
         v = args[0]
         return sum(((v >> i) & 1) << (n - i - 1) for i in range(n)),
 
+    def do_vectorized_operation(self, sizes, args):
+        n = sizes[0]
+        v, = exact_int_arrays(args, max(n, bit_length_bound(args[0])))
+        result = v & 0
+        for i in range(n):
+            result |= ((v >> i) & 1) << (n - i - 1)
+        return result,
+
     def __repr__(self):
         return "ReverseBits"
 
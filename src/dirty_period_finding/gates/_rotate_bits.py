@@ -18,7 +18,11 @@ from __future__ import unicode_literals
 
 from projectq.ops import NotMergeable
 
-from dirty_period_finding.extensions import BasicSizedMathGateEx
+from dirty_period_finding.extensions import (
+    BasicSizedMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
+)
 
 
 class RotateBitsGate(BasicSizedMathGateEx):
@@ -38,6 +42,16 @@ class RotateBitsGate(BasicSizedMathGateEx):
         high, low = v & m, v & ~m
         return (low << r) | (high >> (n - r)),
 
+    def do_vectorized_operation(self, sizes, args):
+        n = sizes[0]
+        v, = exact_int_arrays(args, max(n, bit_length_bound(args[0])))
+        if n == 0:
+            return v,
+        r = self.amount % n
+        m = ~0 << (n - r)
+        high, low = v & m, v & ~m
+        return (low << r) | (high >> (n - r)),
+
     def get_merged(self, other):
         if not isinstance(other, RotateBitsGate):
             raise NotMergeable()
@@ -20,6 +20,8 @@ from projectq.ops import NotMergeable
 
 from dirty_period_finding.extensions import (
     BasicSizedMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
     multiplicative_inverse,
 )
 
@@ -42,6 +44,14 @@ class ScaleGate(BasicSizedMathGateEx):
         mask = ~(~0 << n)
         return (args[0] * self.net_factor_for_size(n)) & mask,
 
+    def do_vectorized_operation(self, sizes, args):
+        n = sizes[0]
+        mask = ~(~0 << n)
+        factor = self.net_factor_for_size(n)
+        x, = exact_int_arrays(args,
+                              bit_length_bound(args[0]) + factor.bit_length())
+        return (x * factor) & mask,
+
     def get_inverse(self):
         return ScaleGate(self.inverse_factor, self.factor)
 
@@ -18,7 +18,11 @@ from __future__ import unicode_literals
 
 from projectq.ops import NotMergeable
 
-from dirty_period_finding.extensions import BasicSizedMathGateEx
+from dirty_period_finding.extensions import (
+    BasicSizedMathGateEx,
+    bit_length_bound,
+    exact_int_arrays,
+)
 
 
 class ScaledAdditionGate(BasicSizedMathGateEx):
@@ -31,6 +35,13 @@ class ScaledAdditionGate(BasicSizedMathGateEx):
         mask = ~(~0 << sizes[1])
         return inp, (out + inp * self.factor) & mask
 
+    def do_vectorized_operation(self, sizes, args):
+        mask = ~(~0 << sizes[1])
+        bits = max(bit_length_bound(args[0]) + self.factor.bit_length(),
+                   bit_length_bound(args[1])) + 1
+        inp, out = exact_int_arrays(args, bits)
+        return inp, (out + inp * self.factor) & mask
+
     def get_inverse(self):
         return ScaledAdditionGate(-self.factor)
 
@@ -21,11 +21,11 @@ from __future__ import unicode_literals
 
 import fractions
 import math
+import multiprocessing
 import random
 import sys
 from fractions import Fraction
 
-from projectq import MainEngine
 from projectq.backends import Simulator
 from projectq.cengines import DecompositionRuleSet
 from projectq.ops import X, Z
@@ -35,7 +35,11 @@ import dirty_period_finding.decompositions as decompositions
 from dirty_period_finding.extensions import (
     H,
     LimitedCapabilityEngine,
-    AutoReplacerEx,
+    CompilationContext,
+    FileDecompositionCache,
+    PeriodFindingEmulator,
+    ReversibleGateFuser,
+    SparseSimulator,
 )
 from dirty_period_finding.gates import ModularBimultiplicationGate
 
@@ -44,6 +48,27 @@ from dirty_period_finding.gates import ModularBimultiplicationGate
 # all of them makes things ridiculously slow. So... it's up to you, reader.
 DECOMPOSE_INTO_TOFFOLIS_AND_GO_VERY_VERY_SLOW = False
 
+# Set to a directory path to reuse decompositions across runs.
+DECOMPOSITION_CACHE_DIRECTORY = None
+
+# Number of processes sampling periods at once. None uses every CPU.
+SAMPLING_PROCESSES = None
+
+# Set to emulate the period finding circuit with a PeriodFindingEmulator,
+# which only tracks the states reachable from the work register's initial
+# value, instead of simulating the full state vector of 3n+1 qubits. Works
+# for moduli far beyond what fits in a state vector (time and memory grow
+# with the period instead).
+EMULATE_PERIOD_FINDING = False
+
+# Set to apply runs of toffolis to the dense simulator's state all at once
+# with a ReversibleGateFuser, instead of one pass over the state per gate.
+FUSE_REVERSIBLE_GATES = True
+
+# Set to simulate with a SparseSimulator, which only stores the basis states
+# with nonzero amplitude, instead of the dense state vector simulator.
+SPARSE_SIMULATION = False
+
 
 def shor_find_period(base,
                      modulus,
@@ -98,16 +123,64 @@ def shor_find_period(base,
     return frac.limit_denominator(modulus - 1).denominator
 
 
-def simulate_sample_period(base, modulus):
-    sim = Simulator()
-    eng = MainEngine(backend=sim, engine_list=[
-        AutoReplacerEx(DecompositionRuleSet(modules=[decompositions])),
+def _make_capability_engines():
+    return [
         LimitedCapabilityEngine(
             allow_arithmetic=not DECOMPOSE_INTO_TOFFOLIS_AND_GO_VERY_VERY_SLOW,
             allow_toffoli=True,
             allow_single_qubit_gates=True
         ),
-    ])
+    ]
+
+
+def make_compilation_context():
+    """
+    Returns:
+        CompilationContext: Compiles the circuits sent to the simulator. It
+            can be reused for many samples, so that decompositions cached
+            while sampling one period are reused when sampling the next.
+    """
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    cache = None
+    if DECOMPOSITION_CACHE_DIRECTORY is not None:
+        cache = FileDecompositionCache(
+            DECOMPOSITION_CACHE_DIRECTORY,
+            rule_set,
+            namespace='factor-toffoli'
+            if DECOMPOSE_INTO_TOFFOLIS_AND_GO_VERY_VERY_SLOW
+            else 'factor-arithmetic')
+    return CompilationContext(rule_set,
+                              engine_list_factory=_make_capability_engines,
+                              cache=cache)
+
+
+def _make_backend():
+    if EMULATE_PERIOD_FINDING:
+        return PeriodFindingEmulator()
+    if SPARSE_SIMULATION:
+        return SparseSimulator()
+    return Simulator()
+
+
+def simulate_sample_period(base, modulus, context=None):
+    """
+    Args:
+        base (int): The number whose multiplicative order is sampled.
+        modulus (int): The number being factored.
+        context (None|CompilationContext): A context from
+            make_compilation_context to reuse. Defaults to a new one.
+
+    Returns:
+        int:
+            A number related to the period.
+    """
+    if context is None:
+        context = make_compilation_context()
+    backend = _make_backend()
+    backend_engines = []
+    if FUSE_REVERSIBLE_GATES and isinstance(backend, Simulator):
+        backend_engines.append(ReversibleGateFuser())
+    eng = context.main_engine(backend, backend_engines)
 
     n = int(math.ceil(math.log(modulus, 2)))
 
@@ -172,22 +245,84 @@ def random_base(modulus):
             return base
 
 
-def partial_factorize(n, attempts=10):
+def sample_factors(base, modulus, context=None):
+    """
+    Samples the period of the base and tries to turn it into factors.
+
+    Args:
+        base (int): A number coprime to the modulus.
+        modulus (int): The number being factored.
+        context (None|CompilationContext): A context from
+            make_compilation_context to reuse. Defaults to a new one.
+
+    Returns:
+        None|list[int]: Two factors of the modulus, or None if the sample
+            wasn't useful.
+    """
+    p_raw = simulate_sample_period(base, modulus, context)
+    p = cleanup_period(base, p_raw, modulus)
+    return period_to_factors(base, modulus, p)
+
+
+def partial_factorize(n, attempts=10, shots_per_base=1, processes=1):
+    """
+    Args:
+        n (int): The number to factor.
+        attempts (int): How many random bases to try.
+        shots_per_base (int): How many periods to sample for each base.
+        processes (None|int): How many processes sample periods at once.
+            None means one per CPU. With 1, samples are taken one after
+            another in this process.
+
+    Returns:
+        list[int]: Two factors of n.
+    """
     if n % 2 == 0:
         return [n // 2, 2]
 
-    for _ in range(attempts):
-        base = random_base(n)
-
-        p_raw = simulate_sample_period(base, n)
-        p = cleanup_period(base, p_raw, n)
-        factors = period_to_factors(base, n, p)
-        if factors is not None:
-            return factors
+    jobs = [(base, n)
+            for base in [random_base(n) for _ in range(attempts)]
+            for _ in range(shots_per_base)]
+
+    if processes == 1:
+        context = make_compilation_context()
+        for base, modulus in jobs:
+            factors = sample_factors(base, modulus, context)
+            if factors is not None:
+                return factors
+    else:
+        pool = multiprocessing.Pool(processes,
+                                    initializer=_init_sampling_worker)
+        try:
+            for factors in pool.imap_unordered(_sample_factors_in_worker,
+                                               jobs):
+                if factors is not None:
+                    return factors
+        finally:
+            # Cancels the samples that are still pending or running.
+            pool.terminate()
+            pool.join()
 
     raise RuntimeError("Failed to factor in {} attempts.".format(attempts))
 
 
+# Compilation context of a sampling worker process, kept between jobs.
+_worker_context = None
+
+
+def _init_sampling_worker():
+    global _worker_context
+    # Forked workers inherit the parent's random state, and the simulator
+    # seeds itself from it.
+    random.seed()
+    _worker_context = make_compilation_context()
+
+
+def _sample_factors_in_worker(job):
+    base, modulus = job
+    return sample_factors(base, modulus, _worker_context)
+
+
 def main():
     if len(sys.argv) < 2:
         raise ValueError("Give a number to factor as a command line argument.")
@@ -195,7 +330,7 @@ def main():
     if n < 4:
         raise ValueError("Give a positive composite number.")
 
-    factors = partial_factorize(n)
+    factors = partial_factorize(n, processes=SAMPLING_PROCESSES)
     print(' * '.join(str(e) for e in factors))
 
 
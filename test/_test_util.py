@@ -25,23 +25,32 @@ import random
 import numpy as np
 from projectq import MainEngine
 from projectq.backends import Simulator
-from projectq.cengines import DummyEngine, DecompositionRule
+from projectq.cengines import (
+    DummyEngine,
+    DecompositionRule,
+    DecompositionRuleSet,
+)
 from projectq.meta import Dagger
 from projectq.ops import H, All, Rz, Measure, X
 
+import dirty_period_finding.decompositions as decompositions
 from dirty_period_finding.extensions import (
-    ClassicalSimulator,
+    AutoReplacerEx,
+    BatchClassicalSimulator,
+    LimitedCapabilityEngine,
     PermutationSimulator,
     commands_to_ascii_circuit,
     CommandEx,
     BasicGateEx,
 )
+from dirty_period_finding.gates import ModularBimultiplicationGate
 
 
 def check_phase_circuit(register_sizes,
                         expected_turns,
                         engine_list,
-                        actions):
+                        actions,
+                        simulator=None):
     """
     Args:
         register_sizes (list[int]):
@@ -49,9 +58,11 @@ def check_phase_circuit(register_sizes,
                                  register_vals: tuple[int])):
         engine_list (list[projectq.cengines.BasicEngine]):
         actions (function(eng: MainEngine, registers: list[Qureg])):
+        simulator (projectq.cengines.BasicEngine|None): A backend with a
+            cheat method like Simulator's. Defaults to a new Simulator.
     """
 
-    sim = Simulator()
+    sim = Simulator() if simulator is None else simulator
     rec = DummyEngine(save_commands=True)
     eng = MainEngine(backend=sim, engine_list=list(engine_list) + [rec])
     registers = [eng.allocate_qureg(size) for size in register_sizes]
@@ -109,7 +120,7 @@ def check_permutation_circuit(register_sizes,
         register_limits (list[int]|None)
     """
 
-    sim = PermutationSimulator()
+    sim = PermutationSimulator(register_sizes, register_limits)
     rec = DummyEngine(save_commands=True)
     eng = MainEngine(backend=sim, engine_list=list(engine_list) + [rec])
     registers = [eng.allocate_qureg(size) for size in register_sizes]
@@ -128,7 +139,7 @@ def check_permutation_circuit(register_sizes,
         print("Register Sizes", register_sizes)
         print("Register Limits", register_limits)
         print("Differing Permutations [input --> actual != expected]:")
-        starts = PermutationSimulator.starting_permutation(register_sizes)
+        starts = sim.get_starting_permutation(registers)
         for a, b in zip(starts, sim.get_permutation(registers)):
             b = list(b)
             c = permutation(register_sizes, a)
@@ -216,7 +227,8 @@ def fuzz_permutation_circuit(register_sizes,
                              permutation,
                              actions,
                              engine_list=(),
-                             register_limits=None):
+                             register_limits=None,
+                             samples=64):
     """
     Args:
         register_sizes (list[int]):
@@ -226,42 +238,78 @@ def fuzz_permutation_circuit(register_sizes,
         actions (function(eng: MainEngine, registers: list[Qureg])):
         engine_list (list[projectq.cengines.BasicEngine]):
         register_limits (list[int]):
+        samples (int): How many random inputs to simulate (side by side).
     """
 
     n = len(register_sizes)
     if register_limits is None:
         register_limits = [1 << size for size in register_sizes]
     assert len(register_limits) == n
-    inputs = tuple(random.randint(0, limit - 1) for limit in register_limits)
-    outputs = [e % (1 << d)
-               for e, d in zip(permutation(register_sizes, inputs),
-                               register_sizes)]
-
-    sim = ClassicalSimulator()
+    inputs = [tuple(random.randint(0, limit - 1) for limit in register_limits)
+              for _ in range(samples)]
+    outputs = [[e % (1 << d)
+                for e, d in zip(permutation(register_sizes, xs),
+                                register_sizes)]
+               for xs in inputs]
+
+    sim = BatchClassicalSimulator(samples)
     rec = DummyEngine(save_commands=True)
     eng = MainEngine(backend=sim, engine_list=list(engine_list) + [rec])
     registers = tuple(eng.allocate_qureg(size) for size in register_sizes)
 
     # Encode inputs.
+    eng.flush()
     for i in range(n):
-        for b in range(register_sizes[i]):
-            if inputs[i] & (1 << b):
-                X | registers[i][b]
+        sim.write_register(registers[i], [xs[i] for xs in inputs])
 
     # Simulate.
     rec.received_commands = []
     actions(eng, registers)
+    eng.flush()
 
     # Compare outputs.
-    actual_outputs = [sim.read_register(registers[i]) for i in range(n)]
-    if outputs != actual_outputs:
-        print(commands_to_ascii_circuit(rec.received_commands))
-        print("Register Sizes", register_sizes)
-        print("Register Limits", register_limits)
-        print("Inputs", inputs)
-        print("Expected Outputs", outputs)
-        print("Actual Outputs", actual_outputs)
-    assert outputs == actual_outputs
+    lanes = [sim.read_register(reg).tolist() for reg in registers]
+    for k in range(samples):
+        actual_outputs = [lane[k] for lane in lanes]
+        if outputs[k] != actual_outputs:
+            print(commands_to_ascii_circuit(rec.received_commands))
+            print("Register Sizes", register_sizes)
+            print("Register Limits", register_limits)
+            print("Inputs", inputs[k])
+            print("Expected Outputs", outputs[k])
+            print("Actual Outputs", actual_outputs)
+        assert outputs[k] == actual_outputs
+
+
+def toffoli_engine():
+    """
+    Returns:
+        LimitedCapabilityEngine: Allows Toffolis, CNOTs, NOTs and
+            single-qubit gates, so that everything else gets decomposed.
+    """
+    return LimitedCapabilityEngine(allow_toffoli=True,
+                                   allow_single_qubit_gates=True)
+
+
+def ordered_state(sim, qubits):
+    """
+    Args:
+        sim (projectq.backends.Simulator|SparseSimulator): A simulator whose
+            cheat method returns a qubit id mapping and a state vector.
+        qubits (list[projectq.types.Qubit]): The allocated qubits, in the
+            order of the result's bits (least significant first).
+
+    Returns:
+        numpy.ndarray: The simulator's state vector, indexed by the values of
+            the given qubits.
+    """
+    mapping, state = sim.cheat()
+    order = [mapping[q.id] for q in qubits]
+    result = np.zeros(len(state), complex)
+    for i, a in enumerate(state):
+        j = sum(((i >> p) & 1) << k for k, p in enumerate(order))
+        result[j] = a
+    return result
 
 
 def cover(n, cut=10, min=0):
@@ -407,3 +455,59 @@ def decomposition_to_ascii(gate,
                                                           control_size,
                                                           workspace),
                                      ascii_only=ascii_only)
+
+
+class CountingAutoReplacer(AutoReplacerEx):
+    """An AutoReplacerEx that counts the canonical commands it expands."""
+    def __init__(self, *args, **kwargs):
+        AutoReplacerEx.__init__(self, *args, **kwargs)
+        self.expansions = 0
+
+    def _decompose_canonical(self, *args):
+        self.expansions += 1
+        return AutoReplacerEx._decompose_canonical(self, *args)
+
+
+class BatchRecorder(DummyEngine):
+    """A recording DummyEngine that also notes the size of each batch."""
+    def __init__(self):
+        DummyEngine.__init__(self, save_commands=True)
+        self.batch_sizes = []
+
+    def receive(self, command_list):
+        self.batch_sizes.append(len(command_list))
+        DummyEngine.receive(self, command_list)
+
+
+def run_controlled_bimultiply(register_size=4,
+                              factor=7,
+                              modulus=13,
+                              **kwargs):
+    """
+    Decomposes a controlled ModularBimultiplicationGate into Toffolis.
+
+    Args:
+        register_size (int): The size of both multiplied registers.
+        factor (int): The factor the first register is multiplied by.
+        modulus (int): The modulus of the multiplication.
+        **kwargs: Passed on to the CountingAutoReplacer.
+
+    Returns:
+        tuple[CountingAutoReplacer, BatchRecorder]: The replacer, and the
+            backend holding the commands received after the allocations.
+    """
+    rec = BatchRecorder()
+    replacer = CountingAutoReplacer(
+        DecompositionRuleSet(modules=[decompositions]),
+        **kwargs)
+    eng = MainEngine(backend=rec, engine_list=[
+        replacer,
+        LimitedCapabilityEngine(allow_toffoli=True),
+    ])
+    a = eng.allocate_qureg(register_size)
+    b = eng.allocate_qureg(register_size)
+    c = eng.allocate_qubit()
+    rec.received_commands = []
+    rec.batch_sizes = []
+    ModularBimultiplicationGate(factor, modulus) & c | (a, b)
+    return replacer, rec
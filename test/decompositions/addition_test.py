@@ -44,6 +44,7 @@ from dirty_period_finding.gates import (
     Add,
 )
 from .._test_util import (
+    check_permutation_circuit,
     check_permutation_decomposition,
     cover,
     decomposition_to_ascii)
@@ -67,6 +68,24 @@ def test_toffoli_size_of_addition():
     assert 5000 < len(backend.received_commands) < 7000
 
 
+def test_controlled_addition_through_auto_replacer():
+    for control_size in [1, 2]:
+        check_permutation_circuit(
+            register_sizes=[3, 4, control_size, 1],
+            permutation=lambda sizes, (a, b, c, d):
+                (a, b + a if c + 1 == 1 << sizes[2] else b, c, d),
+            engine_list=[
+                AutoReplacerEx(DecompositionRuleSet(modules=[
+                    addition_rules,
+                    increment_rules,
+                    multi_not_rules,
+                    swap2cnot,
+                ])),
+                LimitedCapabilityEngine(allow_toffoli=True),
+            ],
+            actions=lambda eng, regs: Add & regs[2] | (regs[0], regs[1]))
+
+
 def test_decompose_addition_uncontrolled():
     for input_register_size in cover(50):
         for target_register_size in cover(50):
@@ -86,6 +86,10 @@ def test_bimultiplication_operation():
     assert ModularNegate(13).do_operation(14) == (14,)
 
 
+def test_repr():
+    assert repr(ModularNegate(7)) == 'ModularNegate(modulus=7)'
+
+
 def test_decompose_modular_negate():
     for register_size in cover(100, min=1):
         for control_size in cover(3):
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import random
+
+import numpy as np
+import pytest
+from projectq import MainEngine
+from projectq.meta import Control
+from projectq.ops import BasicMathGate, X
+
+from dirty_period_finding.extensions import (
+    BatchClassicalSimulator,
+    ClassicalSimulator,
+)
+
+
+def _random_circuit(eng, qs, rng):
+    class Offset(BasicMathGate):
+        def __init__(self, amount):
+            BasicMathGate.__init__(self, lambda x: (x + amount,))
+
+    class Sub(BasicMathGate):
+        def __init__(self):
+            BasicMathGate.__init__(self, lambda x, y: (x, y - x))
+
+    for _ in range(60):
+        k = rng.randint(0, 3)
+        picked = rng.sample(qs, 5)
+        if k == 0:
+            X | picked[0]
+        elif k == 1:
+            X & picked[1] | picked[0]
+        elif k == 2:
+            X & picked[1:3] | picked[0]
+        else:
+            with Control(eng, picked[4]):
+                Sub() | (picked[0:2], picked[2:4])
+            Offset(rng.randint(0, 7)) | picked[0:3]
+
+
+def test_matches_classical_simulator():
+    lanes = 100
+    inputs = [random.randint(0, (1 << 8) - 1) for _ in range(lanes)]
+    seed = random.randint(0, 1 << 30)
+
+    batch = BatchClassicalSimulator(lanes)
+    eng = MainEngine(backend=batch, engine_list=[])
+    qs = eng.allocate_qureg(8)
+    batch.write_register(qs, inputs)
+    _random_circuit(eng, list(qs), random.Random(seed))
+    batched_outputs = batch.read_register(qs)
+
+    for lane, x in enumerate(inputs):
+        sim = ClassicalSimulator()
+        eng = MainEngine(backend=sim, engine_list=[])
+        qs = eng.allocate_qureg(8)
+        sim.write_register(qs, x)
+        _random_circuit(eng, list(qs), random.Random(seed))
+        assert sim.read_register(qs) == batched_outputs[lane]
+
+
+def test_controlled_not_per_lane():
+    sim = BatchClassicalSimulator(3)
+    eng = MainEngine(backend=sim, engine_list=[])
+    a, b, c = eng.allocate_qureg(3)
+    sim.write_bit(a, [0, 1, 1])
+    sim.write_bit(b, [1, 0, 1])
+
+    X & [a, b] | c
+    assert list(sim.read_bit(c)) == [False, False, True]
+    X | c
+    assert list(sim.read_bit(c)) == [True, True, False]
+
+
+def test_reuses_deallocated_rows():
+    sim = BatchClassicalSimulator(70)
+    eng = MainEngine(backend=sim, engine_list=[])
+    a = eng.allocate_qureg(3)
+    sim.write_register(a, np.arange(70) % 8)
+    b = eng.allocate_qureg(2)
+    X | b[1]
+    eng.deallocate_qubit(b[1])
+    del b
+
+    c = eng.allocate_qubit()
+    assert not sim.read_bit(c[0]).any()
+    assert list(sim.read_register(a)) == list(np.arange(70) % 8)
+
+
+def test_wide_registers():
+    sim = BatchClassicalSimulator(2)
+    eng = MainEngine(backend=sim, engine_list=[])
+    a = eng.allocate_qureg(80)
+    sim.write_register(a, [3 << 70, 5])
+    assert sim.read_register(a).tolist() == [3 << 70, 5]
+
+    with pytest.raises(ValueError):
+        sim.write_register(a, [1 << 80, 0])
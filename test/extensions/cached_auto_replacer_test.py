@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from projectq import MainEngine
+from projectq.backends import ResourceCounter
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+from projectq.ops import X
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    AutoReplacerEx,
+    DecompositionCache,
+    LimitedCapabilityEngine,
+    MergeRule,
+    SimpleAdjacentCombiner,
+)
+from dirty_period_finding.gates import (
+    Add,
+    Increment,
+    ModularBimultiplicationGate,
+    MultiNot,
+    MultiNotGate,
+    OffsetGate,
+    Subtract,
+)
+from .._test_util import (
+    CountingAutoReplacer,
+    check_permutation_circuit,
+    run_controlled_bimultiply,
+)
+
+
+class _LargestEntryCache(DecompositionCache):
+    def __init__(self):
+        DecompositionCache.__init__(self)
+        self.largest_entry = 0
+
+    def put(self, key, commands):
+        self.largest_entry = max(self.largest_entry, len(commands))
+        DecompositionCache.put(self, key, commands)
+
+
+def test_streaming_matches_batch_output():
+    _, batch = run_controlled_bimultiply()
+    cache = _LargestEntryCache()
+    _, streamed = run_controlled_bimultiply(cache=cache,
+                                            streaming_chunk_size=100,
+                                            streaming_cache_limit=500)
+
+    assert ([str(cmd) for cmd in streamed.received_commands] ==
+            [str(cmd) for cmd in batch.received_commands])
+    assert batch.batch_sizes == [len(batch.received_commands)]
+
+    sizes = streamed.batch_sizes
+    assert len(sizes) > 10
+    assert all(size == 100 for size in sizes[:-1])
+    assert 0 < sizes[-1] <= 100
+
+    assert 0 < cache.largest_entry <= 500
+    assert len(cache) > 0
+
+
+def test_streaming_reuses_cached_subtrees():
+    cache = DecompositionCache()
+    _, first = run_controlled_bimultiply(cache=cache,
+                                         streaming_chunk_size=64,
+                                         streaming_cache_limit=500)
+    hits = cache.hits
+    _, second = run_controlled_bimultiply(cache=cache,
+                                          streaming_chunk_size=64,
+                                          streaming_cache_limit=500)
+
+    assert cache.hits > hits
+    assert ([str(cmd) for cmd in first.received_commands] ==
+            [str(cmd) for cmd in second.received_commands])
+
+
+def test_minimal_workspace_keys_decomposition_is_correct():
+    gate = ModularBimultiplicationGate(3, 7)
+
+    def permutation(sizes, vals):
+        if not vals[2]:
+            return vals
+        a, b = gate.get_math_function(([None] * 3, [None] * 3))(vals[:2])
+        return (a, b) + tuple(vals[2:])
+
+    check_permutation_circuit(
+        register_sizes=[3, 3, 1, 2],
+        register_limits=[7, 7, 2, 4],
+        permutation=permutation,
+        actions=lambda eng, regs: gate & regs[2] | (regs[0], regs[1]),
+        engine_list=[
+            AutoReplacerEx(DecompositionRuleSet(modules=[decompositions]),
+                           minimal_workspace_keys=True),
+            LimitedCapabilityEngine(allow_toffoli=True),
+        ])
+
+
+def test_minimal_workspace_keys_ignore_spare_qubits():
+    cache = DecompositionCache()
+    outputs = []
+    for spare in [0, 3, 1]:
+        rec = DummyEngine(save_commands=True)
+        replacer = CountingAutoReplacer(
+            DecompositionRuleSet(modules=[decompositions]),
+            cache=cache,
+            minimal_workspace_keys=True)
+        eng = MainEngine(backend=rec, engine_list=[
+            replacer,
+            LimitedCapabilityEngine(allow_toffoli=True),
+        ])
+        a = eng.allocate_qureg(3)
+        b = eng.allocate_qureg(3)
+        c = eng.allocate_qubit()
+        extra = eng.allocate_qureg(spare)
+        rec.received_commands = []
+        ModularBimultiplicationGate(3, 7) & c | (a, b)
+        outputs.append([str(cmd) for cmd in rec.received_commands])
+        if spare:
+            assert replacer.expansions == 0
+        assert extra is not None
+
+    assert outputs[0] == outputs[1] == outputs[2]
+
+
+def _gate_counts_with_spare_qubits(gate, minimal_workspace_keys):
+    counter = ResourceCounter()
+    eng = MainEngine(backend=counter, engine_list=[
+        AutoReplacerEx(DecompositionRuleSet(modules=[decompositions]),
+                       minimal_workspace_keys=minimal_workspace_keys),
+        LimitedCapabilityEngine(allow_toffoli=True,
+                                allow_single_qubit_gates=True,
+                                allow_classes=[]),
+    ])
+    c = eng.allocate_qubit()
+    r = eng.allocate_qureg(4)
+    spare = eng.allocate_qureg(3)
+    gate & c | r
+    eng.flush()
+    assert spare is not None
+    return dict(counter.gate_counts)
+
+
+def test_minimal_workspace_keys_keep_chosen_rules():
+    for gate in [Increment, OffsetGate(5)]:
+        assert (_gate_counts_with_spare_qubits(gate, True) ==
+                _gate_counts_with_spare_qubits(gate, False))
+
+
+class _RecordingRule(MergeRule):
+    def __init__(self, window, gate_classes):
+        self.window = window
+        self.gate_classes = gate_classes
+        self.seen = []
+
+    def try_rewrite(self, commands):
+        self.seen.append([str(cmd.gate) for cmd in commands])
+        return None
+
+
+def _combine(combiner, actions):
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[combiner])
+    regs = [eng.allocate_qureg(2), eng.allocate_qureg(3), eng.allocate_qubit()]
+    eng.flush()
+    rec.received_commands = []
+    actions(regs)
+    eng.flush()
+    return [str(cmd) for cmd in rec.received_commands[:-1]]
+
+
+def test_adjacent_combiner_indexes_rules_by_gate_class():
+    rule = _RecordingRule(3, (MultiNotGate,))
+    combiner = SimpleAdjacentCombiner([rule])
+    assert combiner.lookback == 2
+
+    def actions(regs):
+        X | regs[2]
+        X | regs[2]
+        MultiNot | regs[1]
+        X | regs[0][0]
+        MultiNot | regs[1]
+    _combine(combiner, actions)
+    assert rule.seen == [['X', 'X', 'MultiNot'], ['MultiNot', 'X', 'MultiNot']]
+
+
+def test_adjacent_combiner_lookback_limits_window():
+    rule = _RecordingRule(3, None)
+    combiner = SimpleAdjacentCombiner([rule], lookback=1)
+
+    def actions(regs):
+        for _ in range(4):
+            MultiNot | regs[1]
+    _combine(combiner, actions)
+    assert rule.seen == []
+
+
+def test_adjacent_combiner_counts_pair_merges():
+    combiner = SimpleAdjacentCombiner([])
+
+    def actions(regs):
+        Add & regs[2] | (regs[0], regs[1])
+        Subtract | (regs[0], regs[1])
+    cmds = _combine(combiner, actions)
+    assert len(cmds) == 3
+    assert combiner.fire_counts == {'InverseControlMergeRule': 1}
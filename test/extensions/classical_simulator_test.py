@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import pytest
+from projectq import MainEngine
+from projectq.ops import X
+from projectq.types import Qureg
+
+from dirty_period_finding.extensions import ClassicalSimulator
+from dirty_period_finding.gates import ModularOffsetGate
+
+
+def test_deallocation_keeps_other_bits():
+    sim = ClassicalSimulator()
+    eng = MainEngine(backend=sim, engine_list=[])
+    a = eng.allocate_qureg(4)
+    b = eng.allocate_qureg(3)
+    c = eng.allocate_qureg(4)
+    sim.write_register(a, 9)
+    sim.write_register(b, 7)
+    sim.write_register(c, 5)
+
+    eng.deallocate_qubit(b[1])
+    assert sim.read_register(a) == 9
+    assert sim.read_register(c) == 5
+    assert sim.read_register(Qureg([b[0], b[2]])) == 3
+
+    # The freed position is reused, and starts off cleared.
+    d = eng.allocate_qubit()
+    assert sim.read_bit(d[0]) == 0
+    X | d
+    assert sim.read_bit(d[0]) == 1
+    assert sim.read_register(a) == 9
+    assert sim.read_register(c) == 5
+
+
+def test_scattered_registers():
+    sim = ClassicalSimulator()
+    eng = MainEngine(backend=sim, engine_list=[])
+    q = eng.allocate_qureg(10)
+    reg = Qureg([q[3], q[4], q[5], q[0], q[9], q[8]])
+
+    for value in [0, 1, 0b101101, 0b111111, 0b010010]:
+        sim.write_register(reg, value)
+        assert sim.read_register(reg) == value
+        assert [sim.read_bit(e) for e in reg] == [
+            (value >> i) & 1 for i in range(6)]
+    assert sim.read_register(Qureg([q[1], q[2], q[6], q[7]])) == 0
+
+    with pytest.raises(ValueError):
+        sim.write_register(reg, 64)
+
+
+def test_wide_modular_arithmetic():
+    modulus = (1 << 4095) + 12345
+    sim = ClassicalSimulator()
+    eng = MainEngine(backend=sim, engine_list=[])
+    a = eng.allocate_qureg(4096)
+    sim.write_register(a, modulus - 10)
+
+    for _ in range(20):
+        work = eng.allocate_qureg(8)
+        ModularOffsetGate(7, modulus) | a
+        del work
+
+    assert sim.read_register(a) == (modulus - 10 + 140) % modulus
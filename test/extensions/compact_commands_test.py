@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import numpy as np
+from projectq import MainEngine
+from projectq.cengines import DummyEngine
+from projectq.ops import X
+
+from dirty_period_finding.extensions import CompactCommandList, Swap
+from dirty_period_finding.gates import Add, ModularOffsetGate
+
+
+def _sample_actions(qs):
+    X | qs[0]
+    X & qs[1] | qs[2]
+    X & qs[3:5] | qs[0]
+    Add & qs[7] | (qs[0:3], qs[3:6])
+    ModularOffsetGate(3, 7) | qs[5:8]
+    Swap | (qs[1], qs[6])
+    X & qs[1] | qs[2]
+
+
+def _record(qubit_ids):
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[])
+    qs = eng.allocate_qureg(max(qubit_ids) + 1)
+    rec.received_commands = []
+    _sample_actions([qs[i] for i in qubit_ids])
+    return rec.received_commands
+
+
+def _sample_commands():
+    return _record(range(8))
+
+
+def test_round_trip():
+    commands = _sample_commands()
+    compact = CompactCommandList.from_commands(commands)
+
+    assert len(compact) == len(commands)
+    assert [str(c) for c in compact.to_commands(None)] == [
+        str(c) for c in commands]
+
+
+def test_interns_tables():
+    compact = CompactCommandList.from_commands(_sample_commands())
+
+    assert len(compact.gates) == 4
+    assert len(compact.layouts) == 6
+    assert compact.tag_lists == [()]
+
+
+def test_remapped():
+    commands = _sample_commands()
+    lookup = np.array([10 + 2 * i for i in range(8)])
+    compact = CompactCommandList.from_commands(commands).remapped(lookup,
+                                                                  ['tag'])
+
+    actual = compact.to_commands(None)
+    assert [str(c) for c in actual] == [
+        str(c) for c in _record([10 + 2 * i for i in range(8)])]
+    assert all(c.tags == ['tag'] for c in actual)
+
+
+def test_concatenate():
+    commands = _sample_commands()
+    a = CompactCommandList.from_commands(commands[:3])
+    b = CompactCommandList.from_commands(commands[3:])
+    empty = CompactCommandList.from_commands([])
+
+    joined = CompactCommandList.concatenate([a, empty, b, a])
+    assert [str(c) for c in joined.to_commands(None)] == [
+        str(c) for c in commands + commands[:3]]
+    assert len(joined.gates) == 4
+
+    assert len(CompactCommandList.concatenate([empty, empty])) == 0
+    assert CompactCommandList.concatenate([a]) is a
+
+
+def test_sliced():
+    commands = _sample_commands()
+    compact = CompactCommandList.from_commands(commands)
+
+    assert [str(c) for c in compact.sliced(2, 5).to_commands(None)] == [
+        str(c) for c in commands[2:5]]
+    assert [str(c) for c in compact.sliced(4).to_commands(None)] == [
+        str(c) for c in commands[4:]]
+    assert [str(c) for c in compact.to_commands(None, 1, 3)] == [
+        str(c) for c in commands[1:3]]
+    assert len(compact.sliced(3, 3)) == 0
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    CompilationContext,
+    LimitedCapabilityEngine,
+)
+from dirty_period_finding.gates import ModularBimultiplicationGate
+
+
+def _toffoli_engines():
+    return [LimitedCapabilityEngine(allow_toffoli=True)]
+
+
+def _bimultiply(eng, factor, modulus, size):
+    a = eng.allocate_qureg(size)
+    b = eng.allocate_qureg(size)
+    c = eng.allocate_qubit()
+    ModularBimultiplicationGate(factor, modulus) & c | (a, b)
+    eng.flush()
+
+
+def test_attempts_share_cache():
+    context = CompilationContext(
+        DecompositionRuleSet(modules=[decompositions]),
+        engine_list_factory=_toffoli_engines)
+
+    first = DummyEngine(save_commands=True)
+    _bimultiply(context.main_engine(first), 2, 7, 3)
+    cold = context.stats()
+    assert cold['pipelines'] == 1
+    assert cold['misses'] > 0
+
+    context.reset_stats()
+    second = DummyEngine(save_commands=True)
+    _bimultiply(context.main_engine(second), 2, 7, 3)
+    warm = context.stats()
+    assert warm['misses'] == 0
+    assert warm['hits'] == 1
+    assert warm['pipelines'] == 0
+    assert ([str(cmd) for cmd in first.received_commands] ==
+            [str(cmd) for cmd in second.received_commands])
+
+    # Another base reuses the subgates cached for the first one.
+    context.reset_stats()
+    _bimultiply(context.main_engine(DummyEngine()), 3, 7, 3)
+    assert 0 < context.stats()['misses'] < cold['misses']
+
+
+def test_counters_share_cache():
+    context = CompilationContext(
+        DecompositionRuleSet(modules=[decompositions]),
+        engine_list_factory=_toffoli_engines)
+
+    counts = []
+    misses = []
+    for _ in range(2):
+        context.reset_stats()
+        engine_list = context.new_counting_engine_list()
+        _bimultiply(MainEngine(backend=DummyEngine(),
+                               engine_list=engine_list), 3, 11, 4)
+        counts.append(engine_list[0].gate_counts)
+        misses.append(context.stats()['misses'])
+        assert context.stats()['counters'] == 1
+    assert counts[0] == counts[1]
+    assert misses[0] > 0
+    assert misses[1] == 0
+
+
+def test_reset():
+    context = CompilationContext(
+        DecompositionRuleSet(modules=[decompositions]),
+        engine_list_factory=_toffoli_engines)
+    engines = context.engine_list()
+    assert context.engine_list() is engines
+    _bimultiply(context.main_engine(DummyEngine()), 2, 7, 3)
+    assert context.stats()['entries'] > 0
+
+    context.reset()
+    assert context.stats()['entries'] == 0
+    assert context.engine_list() is not engines
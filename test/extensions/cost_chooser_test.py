@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from projectq import MainEngine
+from projectq.backends import ResourceCounter
+from projectq.cengines import DecompositionRule, DecompositionRuleSet
+from projectq.ops import X
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    AutoReplacerEx,
+    BasicGateEx,
+    GateHistogram,
+    LimitedCapabilityEngine,
+    MinimumCostChooser,
+    toffoli_cost,
+)
+from dirty_period_finding.gates import (
+    ModularBimultiplicationGate,
+    ModularScaledAdditionGate,
+)
+from .._test_util import check_permutation_circuit, toffoli_engine
+
+
+def _count(**kwargs):
+    cnt = ResourceCounter()
+    eng = MainEngine(backend=cnt, engine_list=[
+        AutoReplacerEx(DecompositionRuleSet(modules=[decompositions]),
+                       **kwargs),
+        toffoli_engine(),
+    ])
+    a = eng.allocate_qureg(4)
+    b = eng.allocate_qureg(4)
+    c = eng.allocate_qubit()
+    ModularBimultiplicationGate(7, 13) & c | (a, b)
+    ModularScaledAdditionGate(5, 13) | (a, b)
+    return cnt
+
+
+def test_toffoli_cost():
+    h = GateHistogram({('X', 0): 3, ('X', 2): 2, ('X', 3): 1}, None)
+    assert toffoli_cost(h) == (3, 6)
+
+
+def test_never_costlier_than_first_rule():
+    default = _count()
+    chooser = MinimumCostChooser()
+    cheapest = _count(decomposition_chooser=chooser)
+
+    assert cheapest.gate_counts['CCX'] < default.gate_counts['CCX']
+    assert cheapest.max_width == default.max_width
+    assert chooser.counter is not None
+
+
+def test_decomposition_is_correct():
+    gate = ModularScaledAdditionGate(3, 7)
+
+    def permutation(sizes, vals):
+        a, b = gate.get_math_function(([None] * 3, [None] * 3))(vals[:2])
+        return (a, b) + tuple(vals[2:])
+
+    check_permutation_circuit(
+        register_sizes=[3, 3, 2],
+        register_limits=[7, 7, 4],
+        permutation=permutation,
+        actions=lambda eng, regs: gate | (regs[0], regs[1]),
+        engine_list=[
+            AutoReplacerEx(DecompositionRuleSet(modules=[decompositions]),
+                           decomposition_chooser=MinimumCostChooser()),
+            LimitedCapabilityEngine(allow_toffoli=True),
+        ])
+
+
+class _CycleGate(BasicGateEx):
+    def __init__(self, name):
+        BasicGateEx.__init__(self)
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return isinstance(other, _CycleGate) and self.name == other.name
+
+    def __hash__(self):
+        return hash((_CycleGate, self.name))
+
+
+def _toffolis(count):
+    def decompose(cmd):
+        qs = list(cmd.qubits[0])
+        for _ in range(count):
+            X & qs[:2] | qs[2]
+            qs = qs[1:] + qs[:1]
+    return decompose
+
+
+def _apply(gate):
+    def decompose(cmd):
+        gate | cmd.qubits[0]
+    return decompose
+
+
+def _recognize_gate(gate):
+    return lambda cmd: cmd.gate == gate
+
+
+def test_choices_below_a_cycle_are_not_memoized():
+    # A -> B or 1 Toffoli. B -> A or 3 Toffolis. While choosing for A, B's
+    # rule leading back to A is skipped, but on its own B should use it.
+    a = _CycleGate('A')
+    b = _CycleGate('B')
+    rules = [
+        DecompositionRule(_CycleGate, _apply(b), _recognize_gate(a)),
+        DecompositionRule(_CycleGate, _toffolis(1), _recognize_gate(a)),
+        DecompositionRule(_CycleGate, _apply(a), _recognize_gate(b)),
+        DecompositionRule(_CycleGate, _toffolis(3), _recognize_gate(b)),
+    ]
+    cnt = ResourceCounter()
+    eng = MainEngine(backend=cnt, engine_list=[
+        AutoReplacerEx(DecompositionRuleSet(rules=rules),
+                       decomposition_chooser=MinimumCostChooser()),
+        toffoli_engine(),
+    ])
+    qs = eng.allocate_qureg(3)
+    a | qs
+    eng.flush()
+    assert cnt.gate_counts['CCX'] == 1
+
+    b | qs
+    eng.flush()
+    assert cnt.gate_counts['CCX'] == 2
+
+
+def test_winner_is_not_expanded_again():
+    chooser = MinimumCostChooser()
+    replacer = AutoReplacerEx(DecompositionRuleSet(modules=[decompositions]),
+                              decomposition_chooser=chooser)
+    expansions = []
+    apply_decomposition = chooser.counter._apply_decomposition
+
+    def recording_apply(canonical_cmd, used, avail, decomposition):
+        layout = tuple(tuple(q.id for q in reg)
+                       for reg in canonical_cmd.all_qubits)
+        expansions.append((canonical_cmd.gate,
+                           layout,
+                           avail,
+                           id(decomposition)))
+        return apply_decomposition(canonical_cmd, used, avail, decomposition)
+
+    chooser.counter._apply_decomposition = recording_apply
+    eng = MainEngine(backend=ResourceCounter(),
+                     engine_list=[replacer, toffoli_engine()])
+    a = eng.allocate_qureg(4)
+    b = eng.allocate_qureg(4)
+    ModularScaledAdditionGate(5, 13) | (a, b)
+
+    assert expansions
+    assert len(set(expansions)) == len(expansions)
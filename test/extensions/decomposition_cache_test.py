@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import pickle
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    BoundedDecompositionCache,
+    CompactCommandList,
+    DecompositionCache,
+    FileDecompositionCache,
+)
+from dirty_period_finding.gates import (
+    Add,
+    ModularBimultiplicationGate,
+    ModularOffsetGate,
+    RotateBitsGate,
+)
+from .._test_util import run_controlled_bimultiply
+
+
+def _run_controlled_bimultiply(cache):
+    replacer, rec = run_controlled_bimultiply(3, 3, 7, cache=cache)
+    return replacer, [str(cmd) for cmd in rec.received_commands]
+
+
+def _recorded_commands():
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[])
+    a = eng.allocate_qureg(5)
+    for i in range(10):
+        ModularOffsetGate(i, 31) & a[0] | a[1:]
+    return CompactCommandList.from_commands(rec.received_commands[-10:])
+
+
+def test_math_gates_survive_pickling():
+    for gate in [Add,
+                 ModularOffsetGate(5, 13),
+                 ModularBimultiplicationGate(7, 13),
+                 RotateBitsGate(3)]:
+        restored = pickle.loads(pickle.dumps(gate, protocol=2))
+        assert restored == gate
+        assert hash(restored) == hash(gate)
+
+
+def test_memory_cache():
+    cache = DecompositionCache()
+    assert cache.get('a') is None
+    cache.put('a', [1, 2])
+    assert cache.get('a') == [1, 2]
+    assert len(cache) == 1
+    cache.clear()
+    assert cache.get('a') is None
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+
+def test_bounded_cache_evicts_least_recently_used():
+    empty = CompactCommandList.from_commands([])
+    cache = BoundedDecompositionCache(max_commands=5)
+    cache.put('a', empty)
+    cache.put('b', empty)
+    cache.put('c', empty)
+    assert cache.get('a') is empty
+
+    cache.put('d', empty)
+    cache.put('e', empty)
+    cache.put('f', empty)
+    assert cache.commands_held() == 0
+    assert len(cache) == 6
+
+    cache = BoundedDecompositionCache(max_commands=5, max_entries=2)
+    cache.put('a', empty)
+    cache.put('b', empty)
+    assert cache.get('a') is empty
+    cache.put('c', empty)
+    assert cache.get('b') is None
+    assert cache.get('a') is empty
+    assert cache.get('c') is empty
+    assert cache.evictions == 1
+
+
+def test_bounded_cache_weighs_entries_by_command_count():
+    commands = _recorded_commands()
+    small = CompactCommandList.from_commands(commands.to_commands(None)[:3])
+    big = CompactCommandList.from_commands(commands.to_commands(None)[:8])
+    huge = CompactCommandList.concatenate([commands, commands])
+
+    cache = BoundedDecompositionCache(max_commands=10)
+    cache.put('small1', small)
+    cache.put('small2', small)
+    cache.put('small3', small)
+    assert cache.commands_held() == 9
+    assert cache.evictions == 0
+
+    cache.put('big', big)
+    assert cache.commands_held() == 8
+    assert cache.evictions == 3
+    assert cache.get('small3') is None
+    assert cache.get('big') is big
+
+    cache.put('huge', huge)
+    assert cache.get('huge') is None
+    assert cache.get('big') is big
+
+    stats = cache.stats()
+    assert stats['entries'] == 1
+    assert stats['commands'] == 8
+    assert stats['evictions'] == 3
+    assert stats['hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['bytes'] > 0
+
+    cache.clear()
+    assert cache.stats()['bytes'] == 0
+    assert cache.commands_held() == 0
+
+
+def test_bounded_cache_matches_unbounded_output():
+    bounded = BoundedDecompositionCache(max_commands=200)
+    replacer, bounded_commands = _run_controlled_bimultiply(bounded)
+    _, plain_commands = _run_controlled_bimultiply(None)
+
+    assert bounded_commands == plain_commands
+    assert bounded.evictions > 0
+    assert bounded.commands_held() <= 200
+
+
+def test_file_cache_reused_across_replacers(tmpdir):
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    directory = str(tmpdir)
+
+    cold, cold_commands = _run_controlled_bimultiply(
+        FileDecompositionCache(directory, rule_set))
+    warm, warm_commands = _run_controlled_bimultiply(
+        FileDecompositionCache(directory, rule_set))
+    plain, plain_commands = _run_controlled_bimultiply(None)
+
+    assert cold.expansions > 0
+    assert warm.expansions == 0
+    assert cold_commands == warm_commands == plain_commands
+
+
+def test_file_cache_namespaces_are_separate(tmpdir):
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    directory = str(tmpdir)
+
+    _run_controlled_bimultiply(
+        FileDecompositionCache(directory, rule_set, 'a'))
+    other, _ = _run_controlled_bimultiply(
+        FileDecompositionCache(directory, rule_set, 'b'))
+
+    assert other.expansions > 0
+
+
+def test_file_cache_ignores_corrupt_entries(tmpdir):
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    cache = FileDecompositionCache(str(tmpdir), rule_set)
+    _run_controlled_bimultiply(cache)
+
+    for path in tmpdir.visit('*.pickle'):
+        path.write_binary(b'garbage')
+
+    again, commands = _run_controlled_bimultiply(
+        FileDecompositionCache(str(tmpdir), rule_set))
+    _, plain_commands = _run_controlled_bimultiply(None)
+    assert again.expansions > 0
+    assert commands == plain_commands
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+from projectq.ops import get_inverse, X
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import DecompositionIndex
+from dirty_period_finding.gates import (
+    Decrement,
+    Increment,
+    OffsetGate,
+    Subtract,
+)
+
+
+def _scan(rule_set, cmd):
+    """Recognizers of the applicable rules, found the slow way."""
+    ds = rule_set.decompositions
+    forward = [(d, d.check)
+               for d in ds.get(cmd.gate.__class__.__name__, [])]
+    backward = [(d.get_inverse_decomposition(), d.check)
+                for d in ds.get(get_inverse(cmd.gate).__class__.__name__, [])]
+    return [r for d, r in forward + backward if d.check(cmd)]
+
+
+def _sample_commands():
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[])
+    q = eng.allocate_qureg(10)
+    rec.received_commands = []
+    X & q[0:4] | q[4]
+    X & q[0:2] | q[4]
+    Increment | q[0:5]
+    Increment & q[5] | q[0:3]
+    Decrement & q[5] | q[0:3]
+    Subtract | (q[0:3], q[3:6])
+    OffsetGate(6) & q[9] | q[0:4]
+    OffsetGate(5) & q[9] | q[0:4]
+    # Some offset recognizers look at the offset, not just the shape.
+    for offset in [5, 101, -9]:
+        OffsetGate(offset) | q[0:9]
+    for offset in [3, -101, 101]:
+        OffsetGate(offset) | q[0:8]
+    return eng, q, rec.received_commands
+
+
+def test_matches_scan():
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    index = DecompositionIndex(rule_set)
+    eng, q, commands = _sample_commands()
+
+    def check_all():
+        for cmd in commands:
+            expected = _scan(rule_set, cmd)
+            assert [r for _, r in index.applicable(cmd)] == expected
+            assert ([r for _, r in index.applicable(cmd, first_only=True)] ==
+                    expected[:1])
+
+    check_all()
+    # Memoized shape checks must notice the workspace changing.
+    extra = eng.allocate_qureg(6)
+    check_all()
+    eng.deallocate_qubit(extra[0])
+    check_all()
+
+
+def test_caches_inverse_decompositions():
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    index = DecompositionIndex(rule_set)
+    eng, q, commands = _sample_commands()
+    decrement = commands[4]
+
+    first = [d for d, r in index.applicable(decrement)]
+    second = [d for d, r in index.applicable(decrement)]
+    assert first
+    assert all(a is b for a, b in zip(first, second))
+
+
+def test_shared_per_rule_set():
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    index = DecompositionIndex.for_rule_set(rule_set)
+    assert DecompositionIndex.for_rule_set(rule_set) is index
+    other = DecompositionRuleSet(modules=[decompositions])
+    assert DecompositionIndex.for_rule_set(other) is not index
+
+    rule_set.add_decomposition_rules(
+        decompositions.all_defined_decomposition_rules[:1])
+    assert DecompositionIndex.for_rule_set(rule_set) is not index
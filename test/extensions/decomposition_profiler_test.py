@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    AutoReplacerEx,
+    DecompositionCache,
+    DecompositionProfiler,
+    LimitedCapabilityEngine,
+    SymbolicGateCounter,
+)
+from dirty_period_finding.gates import ModularBimultiplicationGate
+
+_TOP = ('ModularBimultiplicationGate '
+        '[modular_bimultiplication_rules.decompose_into_adds_and_rotate]')
+
+
+def _bimultiply(replacer):
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[
+        replacer,
+        LimitedCapabilityEngine(allow_toffoli=True),
+    ])
+    a = eng.allocate_qureg(4)
+    b = eng.allocate_qureg(4)
+    c = eng.allocate_qubit()
+    eng.flush()
+    rec.received_commands = []
+    ModularBimultiplicationGate(3, 11) & c | (a, b)
+    return rec.received_commands
+
+
+def test_profiles_replacer():
+    profiler = DecompositionProfiler()
+    cache = DecompositionCache()
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    commands = _bimultiply(AutoReplacerEx(rule_set,
+                                          cache=cache,
+                                          profiler=profiler))
+
+    summary = profiler.summary()
+    top = summary['gates']['ModularBimultiplicationGate']
+    assert top['expansions'] == 1
+    assert top['misses'] == 1
+    assert top['hits'] == 0
+    assert top['leaves'] == len(commands)
+    rule = summary['rules'][
+        'modular_bimultiplication_rules.decompose_into_adds_and_rotate']
+    assert rule['leaves'] == len(commands)
+    assert any(name.endswith('^-1') for name in summary['rules'])
+    assert summary['max_depth'] > 2
+    total = sum(s['expansions'] for s in summary['gates'].values())
+    assert total == sum(s['expansions'] for s in summary['rules'].values())
+    assert total == sum(s['misses'] for s in summary['gates'].values())
+
+    # Exclusive times add up to the time of the outermost expansion.
+    lines = profiler.folded_stacks()
+    assert all(line.startswith(_TOP) for line in lines)
+    micros = sum(int(line.rsplit(' ', 1)[1]) for line in lines)
+    assert abs(micros - top['inclusive_seconds'] * 1e6) <= len(lines)
+    exclusive = sum(s['exclusive_seconds'] for s in summary['gates'].values())
+    assert abs(exclusive - top['inclusive_seconds']) < 1e-6
+
+    # A warm cache turns the expansion into a hit.
+    warm = DecompositionProfiler()
+    _bimultiply(AutoReplacerEx(rule_set, cache=cache, profiler=warm))
+    assert warm.summary() == {
+        'gates': {'ModularBimultiplicationGate': {
+            'expansions': 0,
+            'hits': 1,
+            'misses': 0,
+            'leaves': len(commands),
+            'inclusive_seconds': 0.0,
+            'exclusive_seconds': 0.0,
+        }},
+        'rules': {},
+        'max_depth': 0,
+    }
+
+
+def test_profiles_counter():
+    profiler = DecompositionProfiler()
+    counter = SymbolicGateCounter(
+        DecompositionRuleSet(modules=[decompositions]),
+        profiler=profiler)
+    _bimultiply(counter)
+    summary = profiler.summary()
+    top = summary['gates']['ModularBimultiplicationGate']
+    assert top['expansions'] == 1
+    assert top['leaves'] == sum(n
+                                for name, n in counter.gate_counts.items()
+                                if name != 'Allocate')
+    assert all(line.startswith(_TOP) for line in profiler.folded_stacks())
+
+
+def test_writes_files():
+    profiler = DecompositionProfiler()
+    _bimultiply(AutoReplacerEx(DecompositionRuleSet(modules=[decompositions]),
+                               profiler=profiler))
+    directory = tempfile.mkdtemp()
+    try:
+        folded_path = os.path.join(directory, 'profile.folded')
+        json_path = os.path.join(directory, 'profile.json')
+        profiler.write_folded_stacks(folded_path)
+        profiler.write_summary(json_path)
+        with open(folded_path) as f:
+            assert f.read().splitlines() == profiler.folded_stacks()
+        with open(json_path) as f:
+            assert json.load(f) == profiler.summary()
+    finally:
+        shutil.rmtree(directory)
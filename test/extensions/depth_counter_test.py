@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import numpy as np
+from projectq import MainEngine
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+from projectq.ops import H, Measure, X
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    AutoReplacerEx,
+    DecompositionCache,
+    DepthCounter,
+    DepthSummary,
+    SymbolicDepthCounter,
+)
+from dirty_period_finding.extensions._depth_counter import NO_PATH
+from dirty_period_finding.gates import (
+    ModularBimultiplicationGate,
+    ModularScaledAdditionGate,
+)
+from .._test_util import toffoli_engine
+
+
+def _apply_gates(qs):
+    X | qs[0]
+    X & qs[0] | qs[1]
+    X & qs[0:2] | qs[2]
+    H | qs[3]
+    X & qs[3] | qs[4]
+    X & qs[1:3] | qs[4]
+
+
+def _apply_arithmetic(eng):
+    a = eng.allocate_qureg(4)
+    b = eng.allocate_qureg(4)
+    c = eng.allocate_qubit()
+    ModularBimultiplicationGate(7, 13) & c | (a, b)
+    X | a[0]
+    ModularScaledAdditionGate(5, 11) | (b, a)
+
+
+def test_depth_counter():
+    counter = DepthCounter(record_critical_path=True)
+    eng = MainEngine(backend=counter, engine_list=[])
+    qs = eng.allocate_qureg(5)
+    _apply_gates(qs)
+    Measure | qs[4]
+    eng.flush()
+    assert counter.depth == 5
+    assert counter.toffoli_depth == 2
+    assert [str(cmd) for cmd in counter.critical_path()] == [
+        'Command(X | (Q[0],))',
+        'Command(X & Q[0] | (Q[1],))',
+        'Command(X & Q[0-1] | (Q[2],))',
+        'Command(X & Q[1-2] | (Q[4],))',
+        'Command(Measure | (Q[4],))',
+    ]
+    assert str(counter) == 'Depth : 5\nToffoli depth : 2'
+
+
+def test_depth_counter_forwards():
+    rec = DummyEngine(save_commands=True)
+    counter = DepthCounter()
+    eng = MainEngine(backend=rec, engine_list=[counter])
+    qs = eng.allocate_qureg(5)
+    _apply_gates(qs)
+    eng.flush()
+    assert counter.depth == 4
+    assert counter.critical_path() == []
+    assert len(rec.received_commands) == 12
+
+
+def test_summary_lengths():
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[])
+    qs = eng.allocate_qureg(5)
+    eng.flush()
+    rec.received_commands = []
+    _apply_gates(qs)
+    commands = rec.received_commands
+    s = DepthSummary.sequence(commands, commands)
+    assert s.depth == 4
+    assert s.toffoli_depth == 2
+    assert s.lengths[0, 4] == 4
+    assert s.lengths[3, 0] == NO_PATH
+    assert s.toffoli_lengths[3, 4] == 1
+
+    # Remapping reorders the matrices along with the qubits.
+    r = s.remapped(np.array([4, 3, 2, 1, 0]))
+    assert list(r.touched) == [0, 1, 2, 3, 4]
+    assert r.lengths[4, 0] == 4
+    assert r.lengths[1, 4] == NO_PATH
+
+    # Halves combine into the same summary as the whole.
+    first = DepthSummary.sequence(commands[:3], commands[:3])
+    second = DepthSummary.sequence(commands[3:], commands[3:])
+    both = DepthSummary.sequence([first, second], [])
+    np.testing.assert_array_equal(both.lengths, s.lengths)
+    np.testing.assert_array_equal(both.toffoli_lengths, s.toffoli_lengths)
+
+
+def test_symbolic_matches_leaf_depths():
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    leaf = DepthCounter(record_critical_path=True)
+    _apply_arithmetic(MainEngine(backend=leaf, engine_list=[
+        AutoReplacerEx(rule_set),
+        toffoli_engine(),
+    ]))
+
+    symbolic = SymbolicDepthCounter(rule_set)
+    _apply_arithmetic(MainEngine(backend=DummyEngine(), engine_list=[
+        symbolic,
+        toffoli_engine(),
+    ]))
+
+    assert symbolic.depth == leaf.depth
+    assert symbolic.toffoli_depth == leaf.toffoli_depth
+    assert 0 < leaf.toffoli_depth < leaf.depth
+    assert len(leaf.critical_path()) == leaf.depth
+    assert str(symbolic).endswith('Depth : {}\nToffoli depth : {}'.format(
+        leaf.depth, leaf.toffoli_depth))
+
+
+def test_symbolic_reuses_cached_summaries():
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    cache = DecompositionCache()
+    depths = []
+    for _ in range(2):
+        counter = SymbolicDepthCounter(rule_set, cache=cache)
+        _apply_arithmetic(MainEngine(backend=DummyEngine(), engine_list=[
+            counter,
+            toffoli_engine(),
+        ]))
+        depths.append((counter.depth, counter.toffoli_depth))
+        misses = cache.misses
+    assert depths[0] == depths[1]
+    assert cache.misses == misses
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    AutoReplacerEx,
+    DecompositionPool,
+    LimitedCapabilityEngine,
+)
+from dirty_period_finding.gates import ModularBimultiplicationGate
+from .._test_util import run_controlled_bimultiply
+
+
+def _engine_list():
+    return [
+        AutoReplacerEx(DecompositionRuleSet(modules=[decompositions])),
+        LimitedCapabilityEngine(allow_toffoli=True),
+    ]
+
+
+def _run_controlled_bimultiply(pool):
+    replacer, rec = run_controlled_bimultiply(decomposition_pool=pool)
+    return replacer, [str(cmd) for cmd in rec.received_commands]
+
+
+def test_parallel_matches_sequential():
+    sequential, sequential_commands = _run_controlled_bimultiply(None)
+    with DecompositionPool(_engine_list, processes=2) as pool:
+        parallel, parallel_commands = _run_controlled_bimultiply(pool)
+
+    assert parallel_commands == sequential_commands
+    assert parallel.expansions < sequential.expansions // 4
+
+
+def test_pool_decomposes_keys():
+    replacer = _engine_list()[0]
+    eng = MainEngine(backend=DummyEngine(), engine_list=[
+        replacer,
+        LimitedCapabilityEngine(allow_toffoli=True),
+    ])
+    a = eng.allocate_qureg(4)
+    b = eng.allocate_qureg(4)
+    gate = ModularBimultiplicationGate(7, 13)
+    key = replacer._canonicalize(gate.generate_command((a, b)))[2]
+    bad_key = (gate, ((), (0, 1), (2, 3)), 0)
+
+    with DecompositionPool(_engine_list, processes=1) as pool:
+        result, missing = pool.decompose_keys([key, bad_key])
+
+    assert missing is None
+    expected = replacer._recursive_decompose(gate.generate_command((a, b)))
+    assert ([str(cmd) for cmd in result.to_commands(None)] ==
+            [str(cmd) for cmd in expected.to_commands(None)])
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+from projectq.ops import (
+    AllocateQubitGate,
+    DeallocateQubitGate,
+    FlushGate,
+    H,
+    Measure,
+    MeasureGate,
+    T,
+    X,
+)
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    AutoReplacerEx,
+    CommandEx,
+    LimitedCapabilityEngine,
+    PeepholeOptimizer,
+)
+from dirty_period_finding.extensions._peephole_optimizer import (
+    _Entry,
+    commutes,
+)
+from dirty_period_finding.gates import (
+    Increment,
+    ModularBimultiplicationGate,
+)
+from .._test_util import check_permutation_circuit
+
+
+def _optimize(actions, window=32):
+    rec = DummyEngine(save_commands=True)
+    optimizer = PeepholeOptimizer(window)
+    eng = MainEngine(backend=rec, engine_list=[optimizer])
+    qs = eng.allocate_qureg(4)
+    eng.flush()
+    rec.received_commands = []
+    actions(qs)
+    eng.flush()
+    return [str(cmd) for cmd in rec.received_commands[:-1]], optimizer
+
+
+def test_commutes():
+    eng = MainEngine(backend=DummyEngine(), engine_list=[])
+    a, b, c, d = eng.allocate_qureg(4)
+
+    def entry(gate, target, controls=()):
+        return _Entry(CommandEx(eng, gate, ([target],), controls))
+
+    assert commutes(entry(X, a, [b]), entry(X, a, [c]))
+    assert commutes(entry(X, a, [b]), entry(X, c, [b]))
+    assert commutes(entry(X, a), entry(H, b))
+    assert not commutes(entry(X, a, [b]), entry(X, b, [c]))
+    assert not commutes(entry(X, a, [b]), entry(X, c, [a]))
+    assert not commutes(entry(X, a), entry(H, a))
+    assert not commutes(entry(H, a), entry(X, b, [a]))
+
+
+def test_cancels_past_commuting_gates():
+    def actions(qs):
+        X & qs[0] | qs[1]
+        X & qs[2] | qs[1]
+        X & qs[3] | qs[0]
+        X & qs[0] | qs[1]
+    cmds, optimizer = _optimize(actions)
+    assert len(cmds) == 4
+    assert optimizer.eliminated['cancel'] == 0
+
+    def actions(qs):
+        X & qs[0] | qs[1]
+        X & qs[2] | qs[1]
+        X & qs[3] | qs[2]
+        H | qs[3]
+        X & qs[0] | qs[1]
+    cmds, optimizer = _optimize(actions)
+    assert len(cmds) == 3
+    assert optimizer.eliminated['cancel'] == 2
+
+    def actions(qs):
+        Increment & qs[3] | qs[0:2]
+        X | qs[2]
+        Increment.get_inverse() & qs[3] | qs[0:2]
+    cmds, optimizer = _optimize(actions)
+    assert len(cmds) == 1
+    assert optimizer.eliminated['cancel'] == 2
+
+
+def test_window_limits_lookback():
+    def actions(qs):
+        X | qs[0]
+        for _ in range(3):
+            T | qs[1]
+        X | qs[0]
+    assert len(_optimize(actions, window=2)[0]) == 5
+    assert len(_optimize(actions, window=4)[0]) == 3
+
+
+def test_negated_control():
+    def actions(qs):
+        X | qs[1]
+        X | qs[0]
+        X & qs[0] | qs[1]
+        X | qs[0]
+    cmds, optimizer = _optimize(actions)
+    assert len(cmds) == 1
+    assert optimizer.eliminated['negated_control'] == 1
+    assert optimizer.eliminated['cancel'] == 2
+
+
+def test_cnot_conjugation():
+    def actions(qs):
+        X & qs[0] | qs[1]
+        X & qs[1] | qs[2]
+        X & qs[0] | qs[1]
+    cmds, optimizer = _optimize(actions)
+    assert cmds == ['Command(X & Q[1] | (Q[2],))',
+                    'Command(X & Q[0] | (Q[2],))']
+    assert optimizer.eliminated['cnot_conjugation'] == 1
+
+    def actions(qs):
+        X & qs[0] | qs[1]
+        X & qs[2] | qs[0]
+        X & qs[0] | qs[1]
+    cmds, optimizer = _optimize(actions)
+    assert cmds == ['Command(X & Q[2] | (Q[0],))',
+                    'Command(X & Q[2] | (Q[1],))']
+    assert optimizer.eliminated['cnot_conjugation'] == 1
+
+    def actions(qs):
+        X & qs[0] | qs[1]
+        X & qs[1] | qs[0]
+        X & qs[0] | qs[1]
+    cmds, optimizer = _optimize(actions)
+    assert len(cmds) == 3
+    assert optimizer.eliminated['cnot_conjugation'] == 0
+
+
+def test_cnot_conjugation_preserves_permutation():
+    def actions(eng, regs):
+        a, b, t = regs[0][0], regs[0][1], regs[0][2]
+        X & a | b
+        X & b | t
+        X & a | b
+        X & t | a
+        X & a | b
+        X & t | a
+        eng.flush()
+
+    def permutation(_, (x,)):
+        a, b, t = x & 1, x >> 1 & 1, x >> 2 & 1
+        b ^= a
+        t ^= b
+        b ^= a
+        a ^= t
+        b ^= a
+        a ^= t
+        return (a | b << 1 | t << 2,)
+
+    optimizer = PeepholeOptimizer()
+    check_permutation_circuit(
+        register_sizes=[3],
+        permutation=permutation,
+        engine_list=[optimizer],
+        actions=actions)
+    assert optimizer.eliminated['cnot_conjugation'] > 0
+
+
+def test_keeps_allocation_and_measurement():
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[PeepholeOptimizer()])
+    q = eng.allocate_qubit()
+    eng.deallocate_qubit(q[0])
+    q = eng.allocate_qubit()
+    Measure | q
+    Measure | q
+    eng.flush()
+    assert [type(cmd.gate) for cmd in rec.received_commands] == [
+        AllocateQubitGate,
+        DeallocateQubitGate,
+        AllocateQubitGate,
+        MeasureGate,
+        MeasureGate,
+        FlushGate,
+    ]
+
+
+def test_preserves_decomposed_permutation():
+    optimizer = PeepholeOptimizer()
+    modulus = 13
+    factor = 5
+
+    def actions(eng, regs):
+        ModularBimultiplicationGate(factor, modulus) & regs[2] | (regs[0],
+                                                                   regs[1])
+        eng.flush()
+
+    check_permutation_circuit(
+        register_sizes=[4, 4, 1],
+        register_limits=[modulus, modulus, 2],
+        permutation=lambda _, (a, b, c):
+            (a * factor % modulus,
+             b * pow(factor, modulus - 2, modulus) % modulus,
+             1) if c else (a, b, 0),
+        engine_list=[
+            AutoReplacerEx(DecompositionRuleSet(modules=[decompositions])),
+            LimitedCapabilityEngine(allow_toffoli=True),
+            optimizer,
+        ],
+        actions=actions)
+    assert optimizer.eliminated['cancel'] > 0
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from fractions import Fraction
+
+import pytest
+from projectq import MainEngine
+from projectq.ops import H, X, Z
+
+from dirty_period_finding.extensions import PeriodFindingEmulator
+from dirty_period_finding.gates import (
+    Decrement,
+    Increment,
+    ModularBimultiplicationGate,
+)
+
+
+def _sample_phase(seed, base, modulus, precision, ancilla_value):
+    emulator = PeriodFindingEmulator(rnd_seed=seed)
+    eng = MainEngine(backend=emulator, engine_list=[])
+    n = modulus.bit_length()
+    phase_qubit = eng.allocate_qubit()
+    work = eng.allocate_qureg(n)
+    ancilla = eng.allocate_qureg(n)
+    X | work[0]
+    for i in range(ancilla_value.bit_length()):
+        if ancilla_value & (1 << i):
+            X | ancilla[i]
+
+    frac = Fraction(0, 1)
+    for i in range(precision):
+        op = ModularBimultiplicationGate(
+            pow(base, 1 << (precision - i - 1), modulus), modulus)
+        H | phase_qubit
+        op & phase_qubit | (work, ancilla)
+        Z**frac | phase_qubit
+        H | phase_qubit
+        b = phase_qubit.measure()
+        frac /= 2
+        if b:
+            X | phase_qubit
+            frac += Fraction(1, 2)
+
+    fixup = work.measure()
+    ModularBimultiplicationGate(fixup, modulus) | (ancilla, work)
+    assert work.measure() == 1
+    assert ancilla.measure() == ancilla_value
+    return frac, emulator
+
+
+def test_phase_estimation_of_exact_period():
+    # 7 has order 4 modulo 15, so every sampled phase is a multiple of 1/4.
+    seen = set()
+    for seed in range(20):
+        frac, emulator = _sample_phase(seed, 7, 15, 6, ancilla_value=5)
+        assert (frac * 4).denominator == 1
+        assert emulator.max_state_count <= 2 * 4
+        assert emulator.state_count == 1
+        seen.add(frac)
+    assert seen == {Fraction(k, 4) for k in range(4)}
+
+
+def test_large_modulus():
+    modulus = 1000003 * 101
+    frac, emulator = _sample_phase(1, 2, modulus, 8, ancilla_value=3)
+    assert emulator.state_count == 1
+
+
+def test_interference():
+    for seed in range(5):
+        emulator = PeriodFindingEmulator(rnd_seed=seed)
+        eng = MainEngine(backend=emulator, engine_list=[])
+        p = eng.allocate_qubit()
+        reg = eng.allocate_qureg(3)
+        X | reg[1]
+
+        H | p
+        Increment & p | reg
+        Decrement & p | reg
+        H | p
+        assert not p.measure()
+        assert reg.measure() == 2
+
+        H | p
+        Increment & p | reg
+        Decrement & p | reg
+        Z | p
+        H | p
+        assert p.measure()
+        assert emulator.state_count == 1
+
+
+def test_entanglement():
+    outcomes = set()
+    for seed in range(20):
+        emulator = PeriodFindingEmulator(rnd_seed=seed)
+        eng = MainEngine(backend=emulator, engine_list=[])
+        p = eng.allocate_qubit()
+        t = eng.allocate_qubit()
+        reg = eng.allocate_qureg(3)
+        H | p
+        X & p | t
+        Increment & p | reg
+        b = t.measure()
+        assert p.measure() == b
+        assert reg.measure() == b
+        outcomes.add(b)
+    assert outcomes == {False, True}
+
+
+def test_rejects_second_superposition():
+    eng = MainEngine(backend=PeriodFindingEmulator(), engine_list=[])
+    a = eng.allocate_qubit()
+    b = eng.allocate_qubit()
+    H | a
+    with pytest.raises(ValueError):
+        H | b
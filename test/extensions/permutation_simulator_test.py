@@ -15,6 +15,7 @@
 # limitations under the License.
 
 from projectq import MainEngine
+from projectq.meta import Control
 from projectq.ops import BasicMathGate, X
 
 from dirty_period_finding.extensions import PermutationSimulator
@@ -84,3 +85,78 @@ def test_simulator_arithmetic():
         [a, b],
         lambda ns, xs: ((xs[0] + 2) & 0b111,
                         (xs[1] + 8 - 3*((xs[0] + 2) & 0b111)) & 0b1111))
+
+
+def test_simulator_controlled_arithmetic():
+    class Sub(BasicMathGate):
+        def __init__(self):
+            BasicMathGate.__init__(self, lambda x, y: (x, y-x))
+
+    class VectorizedSub(Sub):
+        def get_vectorized_math_function(self, qubits):
+            return lambda xs: (xs[0], xs[1] - xs[0])
+
+    for gate in [Sub(), VectorizedSub()]:
+        sim = PermutationSimulator()
+        eng = MainEngine(sim, [])
+        a = eng.allocate_qureg(2)
+        c = eng.allocate_qubit()
+        b = eng.allocate_qureg(3)
+
+        with Control(eng, c):
+            gate | (a, b)
+        X & a[0] | b[2]
+
+        assert sim.permutation_equals(
+            [a, c, b],
+            lambda ns, xs: (
+                xs[0],
+                xs[1],
+                ((xs[2] - xs[0] if xs[1] else xs[2]) ^ (xs[0] & 1) << 2) &
+                0b111))
+
+
+def test_declared_registers_with_limits():
+    sim = PermutationSimulator(register_sizes=[20, 20, 1],
+                               register_limits=[3, 5, 2])
+    eng = MainEngine(sim, [])
+    a = eng.allocate_qureg(20)
+    b = eng.allocate_qureg(20)
+    c = eng.allocate_qubit()
+    assert len(sim.get_permutation([a, b, c])) == 3 * 5 * 2
+
+    # Ancillae start off cleared, and their positions get reused.
+    for _ in range(40):
+        t = eng.allocate_qubit()
+        X & c | t
+        X & a[0] | b[19]
+        X & c | t
+        eng.deallocate_qubit(t[0])
+        del t
+    assert sim.permutation_equals([a, b, c], lambda ns, xs: xs)
+
+    X & c | b[19]
+    assert sim.permutation_equals(
+        [a, b, c],
+        lambda ns, xs: (xs[0], xs[1] ^ (xs[2] << 19), xs[2]))
+
+
+def test_more_than_64_qubits():
+    class Sub(BasicMathGate):
+        def __init__(self):
+            BasicMathGate.__init__(self, lambda x, y: (x, y-x))
+
+    sim = PermutationSimulator(register_sizes=[40, 40],
+                               register_limits=[4, 8])
+    eng = MainEngine(sim, [])
+    a = eng.allocate_qureg(40)
+    b = eng.allocate_qureg(40)
+    Sub() | (a, b)
+    X & a[1] | b[39]
+
+    assert sim.permutation_equals(
+        [a, b],
+        lambda ns, xs: (xs[0],
+                        ((xs[1] - xs[0]) % (1 << 40)) ^
+                        (((xs[0] >> 1) & 1) << 39)))
+    assert not sim.permutation_equals([a, b], lambda ns, xs: xs)
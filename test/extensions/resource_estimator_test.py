@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from projectq import MainEngine
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+from projectq.ops import X
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    DecompositionCache,
+    ResourceEstimator,
+    ResourceSummary,
+    SymbolicGateCounter,
+)
+from dirty_period_finding.gates import ModularBimultiplicationGate
+from .._test_util import toffoli_engine
+
+_TOP = ('ModularBimultiplicationGate',)
+
+
+def _run(counter):
+    eng = MainEngine(backend=DummyEngine(), engine_list=[
+        counter,
+        toffoli_engine(),
+    ])
+    a = eng.allocate_qureg(4)
+    b = eng.allocate_qureg(4)
+    c = eng.allocate_qubit()
+    ModularBimultiplicationGate(7, 13) & c | (a, b)
+    ModularBimultiplicationGate(7, 13) & c | (a, b)
+    X | c
+    return counter
+
+
+def test_summary_depth():
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[])
+    q = eng.allocate_qureg(4)
+    X | q[0]
+    X | q[1]
+    X & q[0] | q[2]
+    X & q[2] | q[3]
+    X | q[1]
+    s = ResourceSummary.from_commands(rec.received_commands)
+    assert s.depth == 3
+    assert s.width == 4
+    assert s.total() == 9
+    assert s.nodes == {}
+
+
+def test_matches_symbolic_counter():
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    flat = _run(SymbolicGateCounter(rule_set))
+    estimator = _run(ResourceEstimator(rule_set))
+    assert estimator.gate_counts == flat.gate_counts
+    assert estimator.max_width == flat.max_width
+    assert str(estimator) == str(flat)
+
+    top = estimator.nodes[_TOP]
+    assert top.instances == 2
+    assert top.max_width == 9
+    assert top.max_depth > 0
+    assert estimator.depth == top.max_depth * 2 + 1
+    assert top.gate_counts['CCX'] == flat.gate_counts['CCX']
+
+    # Children account for no more than their parents.
+    for path, node in estimator.nodes.items():
+        if len(path) > 1:
+            parent = estimator.nodes[path[:-1]]
+            assert node.total() <= parent.total()
+            assert node.max_width <= parent.max_width
+            assert node.max_depth <= parent.max_depth
+
+    children = [node for path, node in estimator.nodes.items()
+                if len(path) == 2]
+    assert sum(node.total() for node in children) <= top.total()
+    assert any(path[1] == 'ModularScaledAdditionGate'
+               for path in estimator.nodes)
+
+    lines = estimator.breakdown().split('\n')
+    assert lines[0].startswith('ModularBimultiplicationGate x2: gates: ')
+    assert len(lines) == len(estimator.nodes)
+    assert all(line.startswith('  ') for line in lines[1:])
+
+
+def test_reuses_cached_summaries():
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    cache = DecompositionCache()
+    cold = _run(ResourceEstimator(rule_set, cache=cache))
+    misses = cache.misses
+    warm = _run(ResourceEstimator(rule_set, cache=cache))
+    assert cache.misses == misses
+    assert warm.nodes.keys() == cold.nodes.keys()
+    assert all(warm.nodes[k].__dict__ == cold.nodes[k].__dict__
+               for k in cold.nodes)
+    assert warm.depth == cold.depth
+
+    # Plain histograms are cached apart from summaries.
+    _run(SymbolicGateCounter(rule_set, cache=cache))
+    assert cache.misses > misses
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import random
+
+import numpy as np
+from projectq import MainEngine
+from projectq.backends import Simulator
+from projectq.cengines import DummyEngine
+from projectq.ops import H, T, X
+
+from dirty_period_finding.extensions import ReversibleGateFuser
+from dirty_period_finding.gates import (
+    Increment,
+    ModularBimultiplicationGate,
+)
+from .._test_util import ordered_state
+
+
+def _reversible_circuit(qs, rng):
+    for _ in range(60):
+        k = rng.randint(0, 2)
+        picked = rng.sample(qs, 5)
+        if k == 0:
+            X & picked[1:3] | picked[0]
+        elif k == 1:
+            X | picked[0]
+        else:
+            Increment & picked[4] | picked[0:3]
+
+
+def _run(engine_list, seed, superposed):
+    sim = Simulator()
+    eng = MainEngine(backend=sim, engine_list=engine_list)
+    qs = list(eng.allocate_qureg(9))
+    rng = random.Random(seed)
+    for q in qs[:superposed]:
+        H | q
+        T | q
+    _reversible_circuit(qs, rng)
+    extra = eng.allocate_qubit()
+    X & qs[0] | extra
+    ModularBimultiplicationGate(2, 7) & qs[8] | (qs[0:3], qs[3:6])
+    _reversible_circuit(qs, rng)
+    eng.flush()
+    return ordered_state(sim, qs + list(extra))
+
+
+def test_matches_unfused_simulator():
+    seed = random.randint(0, 1 << 30)
+    fuser = ReversibleGateFuser(min_run_length=1)
+    fused = _run([fuser], seed, superposed=2)
+    assert fuser.fused_runs == 1
+    assert fuser.fused_gates == 122
+    np.testing.assert_allclose(fused,
+                               _run([], seed, superposed=2),
+                               atol=1e-8)
+
+
+def test_forwards_when_dense():
+    seed = random.randint(0, 1 << 30)
+    fuser = ReversibleGateFuser(min_run_length=1)
+    fused = _run([fuser], seed, superposed=9)
+    assert fuser.fused_runs == 0
+    np.testing.assert_allclose(fused,
+                               _run([], seed, superposed=9),
+                               atol=1e-8)
+
+
+def test_forwards_short_runs():
+    seed = random.randint(0, 1 << 30)
+    fuser = ReversibleGateFuser(min_run_length=123)
+    _run([fuser], seed, superposed=2)
+    assert fuser.fused_runs == 0
+
+
+def test_forwards_when_not_before_simulator():
+    backend = DummyEngine(save_commands=True)
+    fuser = ReversibleGateFuser(min_run_length=1)
+    eng = MainEngine(backend=backend, engine_list=[fuser])
+    qs = eng.allocate_qureg(3)
+    X & qs[0] | qs[1]
+    Increment | qs
+    H | qs[2]
+    eng.flush()
+    assert fuser.fused_runs == 0
+    assert [str(cmd.gate) for cmd in backend.received_commands[3:]] == [
+        'X', str(Increment), 'H', '']
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import random
+
+import numpy as np
+import pytest
+from projectq import MainEngine
+from projectq.backends import Simulator
+from projectq.meta import Control
+from projectq.cengines import DecompositionRuleSet
+from projectq.ops import H, Rz, T, X, Y
+
+from dirty_period_finding.decompositions import phase_gradient_rules
+from dirty_period_finding.extensions import (
+    AutoReplacerEx,
+    LimitedCapabilityEngine,
+    SparseSimulator,
+)
+from dirty_period_finding.gates import (
+    Increment,
+    ModularBimultiplicationGate,
+    PhaseGradient,
+)
+from .._test_util import check_phase_circuit, ordered_state
+
+
+def _random_circuit(eng, qs, rng):
+    for _ in range(80):
+        k = rng.randint(0, 5)
+        picked = rng.sample(qs, 5)
+        if k == 0:
+            H | picked[0]
+        elif k == 1:
+            X & picked[1:3] | picked[0]
+        elif k == 2:
+            with Control(eng, picked[1]):
+                Rz(rng.random()) | picked[0]
+        elif k == 3:
+            Y | picked[0]
+        elif k == 4:
+            T | picked[0]
+        else:
+            Increment & picked[4] | picked[0:3]
+
+
+def test_matches_simulator():
+    seed = random.randint(0, 1 << 30)
+    states = []
+    for sim in [Simulator(), SparseSimulator()]:
+        eng = MainEngine(backend=sim, engine_list=[])
+        qs = eng.allocate_qureg(7)
+        _random_circuit(eng, list(qs), random.Random(seed))
+        eng.flush()
+        states.append(ordered_state(sim, qs))
+    np.testing.assert_allclose(states[0], states[1], atol=1e-8)
+
+
+def test_phase_circuit():
+    check_phase_circuit(
+        register_sizes=[5, 2],
+        expected_turns=lambda lens, vals:
+            vals[0] / 2.0**lens[0] / -4 if vals[1] == 3 else 0,
+        engine_list=[
+            AutoReplacerEx(DecompositionRuleSet(modules=[
+                phase_gradient_rules
+            ])),
+            LimitedCapabilityEngine(
+                allow_single_qubit_gates_with_controls=True
+            )
+        ],
+        actions=lambda eng, regs: PhaseGradient**(-1/4.0) & regs[1] | regs[0],
+        simulator=SparseSimulator())
+
+
+def test_stays_sparse_for_arithmetic():
+    sim = SparseSimulator()
+    eng = MainEngine(backend=sim, engine_list=[])
+    c = eng.allocate_qubit()
+    a = eng.allocate_qureg(40)
+    b = eng.allocate_qureg(40)
+    X | a[0]
+    H | c
+    ModularBimultiplicationGate(3, (1 << 40) - 87) & c | (a, b)
+    assert sim.state_count == 2
+
+    value = a.measure()
+    assert value in [1, 3]
+    assert sim.state_count == 1
+    assert c.measure() == (value == 3)
+
+
+def test_deallocation_recycles_cleared_positions():
+    sim = SparseSimulator(rnd_seed=5)
+    eng = MainEngine(backend=sim, engine_list=[])
+    a = eng.allocate_qureg(2)
+    H | a[0]
+    t = eng.allocate_qubit()
+    X | t
+    eng.deallocate_qubit(t[0])
+    u = eng.allocate_qubit()
+    assert not u.measure()
+
+    with pytest.raises(ValueError):
+        eng.deallocate_qubit(a[0])
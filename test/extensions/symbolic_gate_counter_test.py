@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import numpy as np
+from projectq import MainEngine
+from projectq.backends import ResourceCounter
+from projectq.cengines import DummyEngine, DecompositionRuleSet
+from projectq.ops import X
+
+import dirty_period_finding.decompositions as decompositions
+from dirty_period_finding.extensions import (
+    AutoReplacerEx,
+    FileDecompositionCache,
+    GateHistogram,
+    SymbolicGateCounter,
+)
+from dirty_period_finding.gates import ModularBimultiplicationGate
+from .._test_util import toffoli_engine
+
+
+def _apply_bimultiplications(eng):
+    a = eng.allocate_qureg(4)
+    b = eng.allocate_qureg(4)
+    c = eng.allocate_qubit()
+    ModularBimultiplicationGate(7, 13) & c | (a, b)
+    ModularBimultiplicationGate(7, 13) | (b, a)
+    X | c
+
+
+def test_histogram_from_commands():
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[])
+    q = eng.allocate_qureg(5)
+    rec.received_commands = []
+    X | q[0]
+    X & q[1] | q[2]
+    X & q[1] | q[0]
+    X & q[0:2] | q[4]
+
+    h = GateHistogram.from_commands(rec.received_commands)
+    assert h.counts == {('X', 0): 1, ('X', 1): 2, ('X', 2): 1}
+    assert h.gate_counts() == {'X': 1, 'CX': 2, 'CCX': 1}
+    assert h.total() == 4
+    assert h.width == 4
+    assert list(h.touched) == [0, 1, 2, 4]
+
+    lookup = np.array([10, 11, 12, 13, 9])
+    assert list(h.remapped(lookup).touched) == [9, 10, 11, 12]
+
+    doubled = GateHistogram.combine([h, h.remapped(lookup)])
+    assert doubled.gate_counts() == {'X': 2, 'CX': 4, 'CCX': 2}
+    assert doubled.width == 8
+    assert GateHistogram.combine([h, h]).width == 4
+
+
+def test_matches_resource_counter():
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+    cnt = ResourceCounter()
+    eng = MainEngine(backend=cnt, engine_list=[
+        AutoReplacerEx(rule_set),
+        toffoli_engine(),
+    ])
+    _apply_bimultiplications(eng)
+
+    symbolic = SymbolicGateCounter(rule_set)
+    rec = DummyEngine(save_commands=True)
+    eng = MainEngine(backend=rec, engine_list=[
+        symbolic,
+        toffoli_engine(),
+    ])
+    _apply_bimultiplications(eng)
+
+    assert symbolic.gate_counts == cnt.gate_counts
+    assert symbolic.max_width == cnt.max_width == 9
+    assert str(symbolic) == str(cnt)
+
+    # Only the directly available commands were produced.
+    assert len(rec.received_commands) == 10
+
+
+def test_file_cache_stores_histograms(tmpdir):
+    rule_set = DecompositionRuleSet(modules=[decompositions])
+
+    def run():
+        cache = FileDecompositionCache(str(tmpdir), rule_set)
+        counter = SymbolicGateCounter(rule_set, cache=cache)
+        eng = MainEngine(backend=DummyEngine(), engine_list=[
+            counter,
+            toffoli_engine(),
+        ])
+        _apply_bimultiplications(eng)
+        return counter
+
+    cold = run()
+    warm = run()
+    assert warm.gate_counts == cold.gate_counts
+    assert warm.cache.misses == 0
+    assert warm.cache.hits == 2
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import random
+
+import numpy as np
+from projectq.ops import BasicMathGate
+
+from dirty_period_finding.extensions import BasicMathGateEx
+from dirty_period_finding.extensions._vectorized_math import (
+    evaluate_math_gate,
+    register_dtype,
+)
+from dirty_period_finding.gates import (
+    Add,
+    ConstPivotFlipGate,
+    Decrement,
+    Increment,
+    LessThanConstantGate,
+    ModularAdditionGate,
+    ModularBimultiplicationGate,
+    ModularDoubleGate,
+    ModularNegate,
+    ModularOffsetGate,
+    ModularScaledAdditionGate,
+    ModularSubtractionGate,
+    ModularUndoubleGate,
+    MultiNot,
+    Negate,
+    OffsetGate,
+    PivotFlip,
+    PredictOffsetOverflowGate,
+    ReverseBits,
+    RotateBitsGate,
+    ScaleGate,
+    ScaledAdditionGate,
+    Subtract,
+    XorOffsetCarrySignalsGate,
+)
+
+
+def _gates_for_size(n):
+    """(gate, register sizes) pairs with n-bit working registers."""
+    modulus = (1 << n) - 3
+    return [
+        (Add, [n, n]),
+        (Subtract, [n, n]),
+        (Increment, [n]),
+        (Decrement, [n]),
+        (MultiNot, [n]),
+        (OffsetGate(5), [n]),
+        (OffsetGate(-(1 << (n + 7)) - 3), [n]),
+        (ModularAdditionGate(modulus), [n, n]),
+        (ModularSubtractionGate(modulus), [n, n]),
+        (ModularOffsetGate(7, modulus), [n]),
+        (ModularScaledAdditionGate(modulus - 2, modulus), [n, n]),
+        (ModularBimultiplicationGate(modulus - 2, modulus), [n, n]),
+        (ModularDoubleGate(modulus), [n]),
+        (ModularUndoubleGate(modulus), [n]),
+        (ModularNegate(modulus), [n]),
+        (PivotFlip, [n, n]),
+        (ConstPivotFlipGate(modulus), [n]),
+        (Negate, [n]),
+        (ScaleGate(5, 3), [n]),
+        (ScaledAdditionGate(-7), [n, n]),
+        (RotateBitsGate(3), [n]),
+        (ReverseBits, [n]),
+        (XorOffsetCarrySignalsGate(11), [n, n]),
+        (PredictOffsetOverflowGate(11), [n, 1]),
+        (LessThanConstantGate(modulus), [n, 1]),
+    ]
+
+
+def _check_matches_scalar(gate, sizes, count=50):
+    registers = tuple([None] * size for size in sizes)
+    inputs = [np.array([random.randint(0, (1 << size) - 1)
+                        for _ in range(count)], register_dtype(size))
+              for size in sizes]
+    func = gate.get_math_function(registers)
+    expected = [func(list(xs)) for xs in zip(*[x.tolist() for x in inputs])]
+    expected = [[v & ((1 << size) - 1) for v in column]
+                for column, size in zip(zip(*expected), sizes)]
+
+    outputs = evaluate_math_gate(gate, registers, inputs)
+    assert [y.tolist() for y in outputs] == expected, gate
+    for y, size in zip(outputs, sizes):
+        assert y.dtype == register_dtype(size)
+
+
+def test_gates_match_scalar_operation():
+    for n in [3, 5, 31, 61, 62, 63, 90]:
+        for gate, sizes in _gates_for_size(n):
+            _check_matches_scalar(gate, sizes)
+
+
+def test_fallback_vectorizes_scalar_operation():
+    calls = []
+
+    class Halve(BasicMathGateEx):
+        def do_operation(self, x):
+            calls.append(x)
+            return x >> 1,
+
+    xs = np.array([6, 3, 6, 6, 3], np.int64)
+    assert Halve().do_vectorized_operation(xs)[0].tolist() == [3, 1, 3, 3, 1]
+    assert sorted(calls) == [3, 6]
+
+    plain = BasicMathGate(lambda x: (x * 3,))
+    _check_matches_scalar(plain, [4])
+    _check_matches_scalar(plain, [70])
+
+
+def test_empty_inputs():
+    for gate, sizes in _gates_for_size(4):
+        registers = tuple([None] * size for size in sizes)
+        inputs = [np.zeros(0, np.int64) for _ in sizes]
+        outputs = evaluate_math_gate(gate, registers, inputs)
+        assert [len(y) for y in outputs] == [0] * len(sizes)